@@ -0,0 +1,623 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import statistics
+import string
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import main
+
+
+def _best_of(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# Keyword matching
+def bench_keyword_matcher(vocab_sizes=(16, 48, 80, 96, 128, 1024), calls: int = 3000, seed: int = 0):
+    # Times both KeywordMatcher strategies on call-sized texts, which is how
+    # the agents use it, and checks they agree with each other and with a
+    # plain substring scan.
+    rng = random.Random(seed)
+    texts = [t.lower() for t in generate_transcripts(calls, list(generate_flights(50)), seed)]
+    base_vocab = sorted(set(main._keyword_matcher.terms))
+    synthetic = set()
+    while len(synthetic) < max(vocab_sizes):
+        synthetic.add("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))))
+    synthetic = sorted(synthetic)
+
+    print(f"Keyword matching over {calls:,} transcripts (default scan limit {main.KEYWORD_SCAN_MAX_TERMS} terms)")
+    print(f"{'terms':>8} {'build ms':>10} {'scan ms':>9} {'regex ms':>9} {'default':>8}")
+    for size in vocab_sizes:
+        vocab = (base_vocab + synthetic)[:size]
+        scan = main.KeywordMatcher(vocab, scan_max_terms=size)
+        start = time.perf_counter()
+        regex = main.KeywordMatcher(vocab, scan_max_terms=0)
+        build = time.perf_counter() - start
+
+        for text in texts:
+            hits = regex.count(text)
+            if hits != scan.count(text) or set(hits) != {term for term in vocab if term in text}:
+                raise AssertionError(f"keyword matchers disagree at {size} terms")
+
+        scanned = _best_of(lambda: [scan.count(text) for text in texts])
+        compiled = _best_of(lambda: [regex.count(text) for text in texts])
+        default = "scan" if main.KeywordMatcher(vocab).scan else "regex"
+        print(f"{size:>8} {build * 1000:>10.2f} {scanned * 1000:>9.1f} {compiled * 1000:>9.1f} {default:>8}")
+
+
+# Cold start
+HEAVY_MODULES = ("streamlit", "together", "dotenv", "asyncio", "concurrent.futures")
+
+
+def _python_wall_time(code: str, runs: int) -> float:
+    here = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=here, check=True, capture_output=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def bench_import_time(runs: int = 7):
+    here = os.path.dirname(os.path.abspath(__file__))
+    probe = f"import main, sys; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", probe],
+                            cwd=here, check=True, capture_output=True, text=True)
+    cumulative_us = None
+    for line in result.stderr.splitlines():
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == "main":
+            cumulative_us = int(parts[1])
+    loaded = result.stdout.strip()
+
+    interpreter = _python_wall_time("pass", runs)
+    with_main = _python_wall_time("import main", runs)
+    print(f"interpreter start-up   {interpreter * 1000:8.1f} ms")
+    print(f"start-up + import main {with_main * 1000:8.1f} ms")
+    print(f"import main (-X importtime cumulative) {cumulative_us / 1000 if cumulative_us else float('nan'):.1f} ms")
+    print(f"heavy modules loaded by import: {loaded or 'none'}")
+
+
+# Synthetic workload
+AIRLINE_CODES = ["AI", "UK", "SG", "QP", "IX", "G", "S"]
+DESTINATIONS = ["Delhi", "Mumbai", "Bangalore", "Chennai", "Kolkata", "Hyderabad", "Pune", "Goa", "Jaipur", "Kochi"]
+STATUSES = ["On Time", "Delayed", "Boarding", "Cancelled", "Scheduled"]
+FIRST_NAMES = ["John", "Sarah", "Priya", "Arjun", "Maria", "Wei", "Fatima", "David", "Ananya", "Rahul"]
+LAST_NAMES = ["Smith", "Johnson", "Sharma", "Patel", "Garcia", "Chen", "Khan", "Brown", "Iyer", "Mehta"]
+
+CALL_OPENINGS = [
+    "Air Express customer service, how may I help you?",
+    "Air Express reservations, how may I assist you?",
+    "Hello, thank you for calling Air Express. How may I assist you today?",
+]
+CALL_REQUESTS = [
+    "I'm having an issue with my baggage. I arrived on flight {flight} this morning, but one of my bags didn't make it.",
+    "I'd like to change my seat assignment on flight {flight} tomorrow.",
+    "I need to cancel my flight {flight} and get a refund.",
+    "I want to book a ticket on flight {flight} for next week.",
+    "Can you check the status of flight {flight}? I heard there is a delay.",
+    "I'm very disappointed, the service on flight {flight} was terrible.",
+    "I need to reschedule flight {flight} to a different date.",
+]
+CALL_CLOSINGS = [
+    ("Okay, thank you for your help.", "Thank you for calling Air Express. Have a wonderful day!"),
+    ("Great, thank you so much!", "You're welcome. Have a pleasant flight."),
+    ("No, that's all.", "Thank you for calling Air Express. We apologize for the inconvenience."),
+]
+QUERY_TEMPLATES = [
+    "What is the status of flight {flight}?",
+    "When does {flight} depart?",
+    "Which gate is flight {flight} leaving from?",
+    "Where is flight {flight} going to?",
+    "Tell me about {flight}",
+    "Is {flight} delayed?",
+]
+
+
+def generate_flights(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    flights = {}
+    for i in range(n):
+        code = AIRLINE_CODES[i // 9000 % len(AIRLINE_CODES)]
+        flight_number = f"{code}{100 + i % 9000}" if i < 9000 * len(AIRLINE_CODES) else f"{code}{i}"
+        departure = rng.randrange(24 * 60)
+        arrival = (departure + rng.randrange(60, 240)) % (24 * 60)
+        flights[flight_number] = {
+            "flight_number": flight_number,
+            "departure_time": _clock(departure),
+            "destination": rng.choice(DESTINATIONS),
+            "status": rng.choice(STATUSES),
+            "terminal": f"T{rng.randint(1, 3)}",
+            "gate": f"G{rng.randint(1, 40)}",
+            "arrival_time": _clock(arrival),
+        }
+    return flights
+
+
+def _clock(minutes: int) -> str:
+    hours, minutes = divmod(minutes, 60)
+    return f"{(hours - 1) % 12 + 1:02d}:{minutes:02d} {'AM' if hours < 12 else 'PM'}"
+
+
+def generate_transcripts(n: int, flight_numbers, seed: int = 0):
+    rng = random.Random(seed)
+    for _ in range(n):
+        flight = rng.choice(flight_numbers)
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        booking = "".join(rng.choice(string.ascii_uppercase) for _ in range(3)) + str(rng.randint(100, 999))
+        customer_close, agent_close = rng.choice(CALL_CLOSINGS)
+        yield "\n".join([
+            f"Agent: {rng.choice(CALL_OPENINGS)}",
+            f"Customer: Hi, {rng.choice(CALL_REQUESTS).format(flight=flight)}",
+            "Agent: I'd be happy to help you with that. May I have your name and booking reference?",
+            f"Customer: My name is {name}, and my booking reference is {booking}.",
+            f"Agent: Thank you. I can see your booking on flight {flight}. Let me take care of that for you.",
+            f"Customer: {customer_close}",
+            f"Agent: {agent_close}",
+        ])
+
+
+HOLD_TURNS = [
+    "Agent: Please hold for a moment while I look into that.",
+    "Customer: Sure, no problem.",
+    "Agent: Thank you for your patience, I'm still checking our system.",
+    "Customer: Okay, I'll wait.",
+    "Agent: Sorry for the wait, the system is a little slow today.",
+]
+
+
+def pad_transcript(transcript: str, rng, max_turns: int = 20) -> str:
+    # Long calls: hold time and small talk spliced in after the request.
+    lines = transcript.split("\n")
+    filler = [rng.choice(HOLD_TURNS) for _ in range(rng.randint(0, max_turns))]
+    return "\n".join(lines[:2] + ["        " + line for line in filler] + lines[2:])
+
+
+def generate_queries(n: int, flight_numbers, seed: int = 0):
+    rng = random.Random(seed)
+    for _ in range(n):
+        roll = rng.random()
+        if roll < 0.05:
+            yield "Hello, can you help me with my trip?"
+        elif roll < 0.1:
+            yield rng.choice(QUERY_TEMPLATES).format(flight=f"ZZ{rng.randint(1000, 9999)}")
+        else:
+            yield rng.choice(QUERY_TEMPLATES).format(flight=rng.choice(flight_numbers))
+
+
+# Stub LLM
+class StubTogether:
+    # Stands in for the together module: Complete.create sleeps for the
+    # configured latency (plus a per-prompt-token cost) and fails at the
+    # configured rate. Categorizations come from the rule-based categorizer
+    # run on the transcript in the prompt, so they depend on what the prompt
+    # actually contains.
+    def __init__(self, latency: float = 0.02, jitter: float = 0.5, error_rate: float = 0.0, seed: int = 0,
+                 token_latency: float = 0.0):
+        self.Complete = self
+        self.latency = latency
+        self.token_latency = token_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+    def create(self, prompt, model, max_tokens=500, temperature=0.1, top_p=0.9, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency * (1 + self.jitter * (self._rng.random() * 2 - 1))
+                   + self.token_latency * main.estimate_tokens(prompt))
+        if self._rng.random() < self.error_rate:
+            raise RuntimeError("stub LLM error")
+        flights = main.re.findall(r"\b([A-Z]{1,3}\d{1,4})\b", prompt)
+        if "Extract the flight number" in prompt:
+            text = flights[-1] if flights else "NONE"
+        elif "categorizes airline call center" in prompt:
+            text = main._categorize_rules(prompt.split("Transcript:", 1)[1].rsplit("Output:", 1)[0])
+        else:
+            text = f"Flight {flights[0] if flights else 'unknown'} is operating as scheduled."
+        return {"output": {"choices": [{"text": text}]}}
+
+
+@contextlib.contextmanager
+def stub_llm(stub):
+    saved = (main._together, main.together_api_key, main._env_loaded, main.LLM_CACHE_ENABLED)
+    main._together, main.together_api_key, main._env_loaded, main.LLM_CACHE_ENABLED = stub, "stub", True, False
+    try:
+        yield stub
+    finally:
+        main._together, main.together_api_key, main._env_loaded, main.LLM_CACHE_ENABLED = saved
+
+
+@contextlib.contextmanager
+def regex_only():
+    saved = (main.together_api_key, main._env_loaded)
+    main.together_api_key, main._env_loaded = None, True
+    try:
+        yield
+    finally:
+        main.together_api_key, main._env_loaded = saved
+
+
+@contextlib.contextmanager
+def flight_store(flights):
+    saved = main._flight_store
+    main.set_flight_store(main.SQLiteFlightStore(":memory:", seed=flights))
+    try:
+        yield
+    finally:
+        main.set_flight_store(saved)
+
+
+# Transcript compression
+def _categorization_fields(result: str):
+    try:
+        parsed = json.loads(result)
+        details = parsed["details"]
+        return (parsed["category"], tuple(sorted(set(details["flight_numbers"]))),
+                details["resolution_status"], details["customer_name"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def bench_compression(args):
+    # Categorizes the same long transcripts with the prompt compressed and
+    # uncompressed. The stub LLM's latency grows with prompt size, and its
+    # answers depend on the prompt's content. Agreement is the share of calls
+    # whose category, flights, resolution and customer name match the
+    # uncompressed run.
+    rng = random.Random(args.seed)
+    flight_numbers = sorted(generate_flights(100, args.seed))
+    transcripts = [pad_transcript(t, rng) for t in generate_transcripts(args.llm_size, flight_numbers, args.seed)]
+    saved = (main.CATEGORIZE_COMPRESS, main.CATEGORIZE_TOKEN_BUDGET)
+    runs = {}
+    try:
+        for label, compress, budget in (("raw", False, 0), ("compressed", True, 0),
+                                        (f"budget {args.token_budget}", True, args.token_budget)):
+            main.CATEGORIZE_COMPRESS, main.CATEGORIZE_TOKEN_BUDGET = compress, budget
+            stub = StubTogether(args.llm_latency, jitter=0, seed=args.seed, token_latency=args.llm_token_latency)
+            with stub_llm(stub), open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                latencies, results = [], []
+                for transcript in transcripts:
+                    start = time.perf_counter()
+                    results.append(main.categorize_call(transcript))
+                    latencies.append(time.perf_counter() - start)
+            tokens = [main.estimate_tokens(main.compress_transcript(t, budget)[0] if compress else t) for t in transcripts]
+            runs[label] = (sorted(latencies), [_categorization_fields(result) for result in results], tokens)
+    finally:
+        main.CATEGORIZE_COMPRESS, main.CATEGORIZE_TOKEN_BUDGET = saved
+
+    reference = runs["raw"][1]
+    print(f"Categorizing {len(transcripts)} padded transcripts "
+          f"(stub LLM {args.llm_latency * 1000:g} ms + {args.llm_token_latency * 1000:g} ms/token)")
+    print(f"{'prompt':<14} {'tokens/call':>12} {'p50 ms':>8} {'p95 ms':>8} {'agreement':>10}")
+    for label, (latencies, fields, tokens) in runs.items():
+        agreement = sum(1 for a, b in zip(fields, reference) if a == b) / len(reference) if reference else 0.0
+        print(f"{label:<14} {statistics.mean(tokens):>12.1f} {_percentile(latencies, 0.5) * 1000:>8.2f} "
+              f"{_percentile(latencies, 0.95) * 1000:>8.2f} {agreement:>10.1%}")
+
+
+# Benchmark suite
+def _percentile(sorted_values, fraction: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def _measure_calls(fn, inputs, measure_memory: bool):
+    for item in inputs[:100]:
+        fn(item)
+    latencies = []
+    start = time.perf_counter()
+    for item in inputs:
+        call_start = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+    peak = None
+    if measure_memory:
+        tracemalloc.start()
+        for item in inputs[:2000]:
+            fn(item)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    latencies.sort()
+    return {
+        "n": len(inputs),
+        "ops_per_sec": len(inputs) / elapsed if elapsed else float("inf"),
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "peak_mb": peak / 1e6 if peak is not None else None,
+    }
+
+
+def _measure_kpis(make_transcripts, n: int, measure_memory: bool):
+    # One streaming KPI run; latencies are per chunk of KPI_CHUNK_SIZE calls.
+    latencies = []
+    chunk_start = start = time.perf_counter()
+    partial = main.KPIPartial()
+    i = 0
+    for i, (categorization, sentiment) in enumerate(main._iter_categorized(make_transcripts()), 1):
+        partial.add(categorization, sentiment)
+        if i % main.KPI_CHUNK_SIZE == 0:
+            now = time.perf_counter()
+            latencies.append(now - chunk_start)
+            chunk_start = now
+    elapsed = time.perf_counter() - start
+    if i % main.KPI_CHUNK_SIZE:
+        latencies.append(time.perf_counter() - chunk_start)
+    peak = None
+    if measure_memory:
+        tracemalloc.start()
+        main.compute_call_center_kpis_stream(make_transcripts())
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    latencies.sort()
+    return {
+        "n": n,
+        "ops_per_sec": n / elapsed if elapsed else float("inf"),
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "peak_mb": peak / 1e6 if peak is not None else None,
+    }
+
+
+def run_suite(size: int = 1000, llm_size: int = 200, seed: int = 0, llm_latency: float = 0.02,
+              llm_error_rate: float = 0.0, measure_memory: bool = True):
+    flights = generate_flights(max(100, size // 20), seed)
+    flight_numbers = sorted(flights)
+    results = {}
+    with flight_store(flights):
+        for path, n in (("regex", size), ("llm", llm_size)):
+            queries = list(generate_queries(n, flight_numbers, seed))
+            transcripts = list(generate_transcripts(min(n, 10000), flight_numbers, seed))
+            context = regex_only() if path == "regex" else stub_llm(StubTogether(llm_latency, error_rate=llm_error_rate, seed=seed))
+            # the agents print() fallback errors; keep them out of the report
+            with context, open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                results[f"{path}/extract_flight_number"] = _measure_calls(main.extract_flight_number, queries, measure_memory)
+                results[f"{path}/qa_agent_respond"] = _measure_calls(main.qa_agent_respond, queries, measure_memory)
+                results[f"{path}/categorize_call"] = _measure_calls(main.categorize_call, transcripts, measure_memory)
+                results[f"{path}/compute_call_center_kpis"] = _measure_kpis(
+                    lambda: generate_transcripts(n, flight_numbers, seed), n, measure_memory
+                )
+    return results
+
+
+def print_results(results, baseline=None):
+    print(f"{'benchmark':<38} {'n':>8} {'ops/sec':>11} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak MB':>8}")
+    for name, result in results.items():
+        peak = f"{result['peak_mb']:.2f}" if result["peak_mb"] is not None else "-"
+        line = (f"{name:<38} {result['n']:>8} {result['ops_per_sec']:>11.1f} {result['p50_ms']:>8.3f} "
+                f"{result['p95_ms']:>8.3f} {result['p99_ms']:>8.3f} {peak:>8}")
+        if baseline and name in baseline:
+            line += f"  ({result['ops_per_sec'] / baseline[name]['ops_per_sec'] - 1:+.0%} ops/sec)"
+        print(line)
+
+
+def find_regressions(results, baseline, tolerance: float):
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if result["ops_per_sec"] < before["ops_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: ops/sec {before['ops_per_sec']:.1f} -> {result['ops_per_sec']:.1f}")
+        if result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.3f} ms -> {result['p95_ms']:.3f} ms")
+    return regressions
+
+
+# Batch analysis
+BATCH_EDGE_CASES = [
+    "", " ", "\x00", "thank you\x00have a", "thank  you have\na have a",
+    "İSTANBUL complaint AI12 ai999 xAI123 ABCD123", "this is Zoë Ünal, calling to cancel",
+    "name is Bob. I am unhappy, BAD experience, delay", "ﬁle ß bag gage money\xa0back money back",
+]
+
+
+def _check_batch(transcripts, chunk_sizes=(1, 7, 256)):
+    # The batch path must give exactly what the per-call path gives.
+    analyzer = main.get_batch_analyzer()
+    expected = []
+    for transcript in transcripts:
+        hits = main.match_keywords(transcript)
+        expected.append((json.loads(main._categorize_rules(transcript, hits)), main.score_sentiment(hits)))
+    for chunk in chunk_sizes:
+        for start in range(0, len(transcripts), chunk):
+            categorizations, sentiments = analyzer.analyze(transcripts[start:start + chunk])
+            for offset, result in enumerate(zip(categorizations, sentiments)):
+                if result != expected[start + offset]:
+                    raise AssertionError(f"batch analysis disagrees with the per-call path on "
+                                         f"{transcripts[start + offset]!r} (chunk size {chunk})")
+
+
+def bench_batch(args):
+    # Rule-based analysis of the same transcripts one call at a time and
+    # through the vectorized batch path, at a few chunk sizes.
+    flight_numbers = sorted(generate_flights(100, args.seed))
+    transcripts = list(generate_transcripts(args.size, flight_numbers, args.seed))
+    with regex_only():
+        if main.get_batch_analyzer() is None:
+            print("Batch analysis needs NumPy and KPI_VECTORIZE=1")
+            return 1
+        _check_batch(transcripts + main.SAMPLE_TRANSCRIPTS + BATCH_EDGE_CASES)
+
+        def per_call():
+            for transcript in transcripts:
+                hits = main.match_keywords(transcript)
+                main.categorize_call(transcript, hits)
+                main.score_sentiment(hits)
+
+        def batched(chunk):
+            for start in range(0, len(transcripts), chunk):
+                main.analyze_batch(transcripts[start:start + chunk])
+
+        baseline = _best_of(per_call, 3)
+        print(f"Analyzing {len(transcripts)} transcripts (rules only)")
+        print(f"{'path':<14} {'calls/s':>10} {'speedup':>8}")
+        print(f"{'per call':<14} {len(transcripts) / baseline:>10.0f} {1.0:>7.1f}x")
+        for chunk in (64, 256, 1024, 4096):
+            elapsed = _best_of(lambda: batched(chunk), 3)
+            print(f"{f'batch {chunk}':<14} {len(transcripts) / elapsed:>10.0f} {baseline / elapsed:>7.1f}x")
+    return 0
+
+
+# Live flight updates
+def bench_feed(args):
+    # Applies a burst of synthetic status updates through FlightFeed while
+    # reader threads keep looking up flights, for each flight store. Reader
+    # latency is also measured with no writer as a reference.
+    flights = generate_flights(args.flights, args.seed)
+    flight_numbers = sorted(flights)
+    updates = list(main.iter_synthetic_updates(flight_numbers, limit=args.updates, seed=args.seed))
+    print(f"{len(updates)} updates over {len(flights)} flights, batches of {args.batch_size}, {args.readers} readers")
+    print(f"{'store':<10} {'writer':<8} {'updates/s':>10} {'versions':>9} {'reads/s':>10} {'p50 us':>8} {'p99 us':>8} {'max us':>8}")
+    for label, make_store in (("snapshot", lambda: main.SnapshotFlightStore(flights)),
+                              ("sqlite", lambda: main.SQLiteFlightStore(":memory:", flights))):
+        for writing in (False, True):
+            store = make_store()
+            store.get(flight_numbers[0])
+            done = threading.Event()
+            latencies = [[] for _ in range(args.readers)]
+
+            def read(samples, seed):
+                rng = random.Random(seed)
+                while not done.is_set():
+                    flight_number = rng.choice(flight_numbers)
+                    start = time.perf_counter()
+                    store.get_json(flight_number)
+                    samples.append(time.perf_counter() - start)
+
+            readers = [threading.Thread(target=read, args=(samples, index)) for index, samples in enumerate(latencies)]
+            for reader in readers:
+                reader.start()
+            start = time.perf_counter()
+            feed = None
+            if writing:
+                feed = main.FlightFeed(iter(updates), store, batch_size=args.batch_size)
+                feed.run()
+            else:
+                time.sleep(0.5)
+            elapsed = time.perf_counter() - start
+            done.set()
+            for reader in readers:
+                reader.join()
+            samples = sorted(sample for reader_samples in latencies for sample in reader_samples)
+            rate = f"{feed.updates / elapsed:.0f}" if feed else "-"
+            versions = str(store.version) if isinstance(store, main.SnapshotFlightStore) else "-"
+            print(f"{label:<10} {'yes' if writing else 'no':<8} {rate:>10} {versions:>9} {len(samples) / elapsed:>10.0f} "
+                  f"{_percentile(samples, 0.5) * 1e6:>8.1f} {_percentile(samples, 0.99) * 1e6:>8.1f} "
+                  f"{samples[-1] * 1e6 if samples else float('nan'):>8.1f}")
+    return 0
+
+
+# Call archive
+def bench_archive(args):
+    # Filtered KPIs over archived calls, scanned with and without NumPy,
+    # against re-analyzing the transcripts for the unfiltered query.
+    flight_numbers = sorted(generate_flights(100, args.seed))
+    transcripts = list(generate_transcripts(args.size, flight_numbers, args.seed))
+    with regex_only(), tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "calls.kpiarc")
+        start = time.perf_counter()
+        main.archive_calls(transcripts, path, date="2024-05-01")
+        written = time.perf_counter() - start
+        reanalyze = _best_of(lambda: main.compute_call_center_kpis_stream(transcripts), 3)
+        print(f"Archived {len(transcripts)} calls in {written:.2f}s, {os.path.getsize(path) / len(transcripts):.0f} bytes/call")
+        print(f"{'query':<22} {'scan':<8} {'ms':>9} {'speedup':>8}")
+        print(f"{'all (re-analyze)':<22} {'-':<8} {reanalyze * 1e3:>9.2f} {1.0:>7.1f}x")
+        queries = (("all", {}), ("category", {"category": "Complaint"}),
+                   ("flight", {"flight": flight_numbers[0]}), ("date range", {"date_from": "2024-05-01"}))
+        get_numpy = main._get_numpy
+        with main.CallArchive(path) as archive:
+            for scan in ("numpy", "python"):
+                if scan == "numpy" and get_numpy() is None:
+                    continue
+                if scan == "python":
+                    main._get_numpy = lambda: None
+                try:
+                    for label, filters in queries:
+                        elapsed = _best_of(lambda: archive.kpis(**filters), 3)
+                        print(f"{label:<22} {scan:<8} {elapsed * 1e3:>9.2f} {reanalyze / elapsed:>7.1f}x")
+                finally:
+                    main._get_numpy = get_numpy
+    return 0
+
+
+def bench_suite(args):
+    results = run_suite(args.size, args.llm_size, args.seed, args.llm_latency, args.llm_error_rate,
+                        not args.skip_memory)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if baseline:
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+BENCHMARKS = {
+    "keywords": lambda args: bench_keyword_matcher(),
+    "import": lambda args: bench_import_time(),
+    "suite": bench_suite,
+    "compression": bench_compression,
+    "batch": bench_batch,
+    "feed": bench_feed,
+    "archive": bench_archive,
+}
+
+
+def run(argv=None):
+    parser = argparse.ArgumentParser(description="Airline call center benchmarks")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run: {', '.join(sorted(BENCHMARKS))} (default: all)")
+    parser.add_argument("--size", type=int, default=1000, help="synthetic transcripts/queries for the regex path")
+    parser.add_argument("--llm-size", type=int, default=200, help="synthetic transcripts/queries for the LLM path")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency", type=float, default=0.02, help="stub LLM latency in seconds")
+    parser.add_argument("--llm-token-latency", type=float, default=0.0002,
+                        help="extra stub LLM latency per prompt token, in seconds")
+    parser.add_argument("--token-budget", type=int, default=64, help="prompt token budget for the compression benchmark")
+    parser.add_argument("--flights", type=int, default=5000, help="flights in the store for the feed benchmark")
+    parser.add_argument("--updates", type=int, default=200000, help="synthetic updates for the feed benchmark")
+    parser.add_argument("--batch-size", type=int, default=main.FLIGHT_FEED_BATCH, help="updates per feed batch")
+    parser.add_argument("--readers", type=int, default=2, help="reader threads for the feed benchmark")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="fraction of stub LLM calls that fail")
+    parser.add_argument("--skip-memory", action="store_true", help="skip the tracemalloc peak memory pass")
+    parser.add_argument("--save", help="write suite results to this JSON file")
+    parser.add_argument("--compare", help="compare suite results with a saved JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before flagging a regression")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    status = 0
+    for name in args.names or sorted(BENCHMARKS):
+        print(f"== {name}")
+        status = BENCHMARKS[name](args) or status
+        print()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -1,16 +1,243 @@
-import streamlit as st
+import io
 import json
 import re
 import os
-from typing import Dict, Any, List, Union
-from dotenv import load_dotenv
-import together
+import math
+import heapq
+import base64
+import sys
+import time
+import queue
+import random
+import struct
+import sqlite3
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from itertools import chain, islice
+from typing import AbstractSet, Dict, Any, Iterable, Iterator, List, Optional, Union
 
-load_dotenv('api_keys.env')
+# Streamlit, the Together SDK, python-dotenv and asyncio are imported on first
+# use, so batch jobs and the CLI only pay for what they touch.
+together_api_key = None
+_env_loaded = False
+_together = None
 
-together_api_key = os.getenv('TOGETHER_API_KEY')
-if together_api_key:
-    together.api_key = together_api_key
+def _load_env() -> Optional[str]:
+    global together_api_key, _env_loaded
+    if not _env_loaded:
+        try:
+            from dotenv import load_dotenv
+            load_dotenv('api_keys.env')
+        except ImportError:
+            pass
+        together_api_key = os.getenv('TOGETHER_API_KEY')
+        _env_loaded = True
+    return together_api_key
+
+class _TimeoutRequests:
+    # Stands in for the requests module inside the Together SDK, which (as of
+    # 0.2.x) sends requests with no timeout. A hung connection would otherwise
+    # hold an LLM worker forever; with a read timeout it fails on its own.
+    def __init__(self, requests, timeout: float):
+        self._requests = requests
+        self._timeout = timeout
+    
+    def __getattr__(self, name: str):
+        return getattr(self._requests, name)
+    
+    def post(self, *args, **kwargs):
+        kwargs.setdefault("timeout", self._timeout)
+        return self._requests.post(*args, **kwargs)
+    
+    def get(self, *args, **kwargs):
+        kwargs.setdefault("timeout", self._timeout)
+        return self._requests.get(*args, **kwargs)
+
+def _get_together():
+    global _together
+    if _together is None:
+        import together
+        if _load_env():
+            together.api_key = together_api_key
+        utils = getattr(together, "utils", None)
+        if utils is not None and hasattr(utils, "requests") and not isinstance(utils.requests, _TimeoutRequests):
+            utils.requests = _TimeoutRequests(utils.requests, TOGETHER_TIMEOUT)
+        _together = together
+    return _together
+
+
+# Metrics
+METRICS_ENABLED = os.getenv("AGENT_METRICS", "1") != "0"
+METRICS_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class _StageTimer:
+    __slots__ = ("metrics", "name", "start")
+    
+    def __init__(self, metrics: "Metrics", name: str):
+        self.metrics = metrics
+        self.name = name
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+class _NullTimer:
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class Metrics:
+    # Event counters and per-stage latency histograms. Every thread writes to
+    # its own shard, so recording never takes a lock; snapshots sum the shards.
+    # Shards of finished threads are folded into one retired shard, so
+    # short-lived worker threads do not pile up. When disabled, updates
+    # return immediately.
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self._local = threading.local()
+        self._shards = []
+        self._retired = ({}, {})
+        self._lock = threading.Lock()
+    
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = ({}, {})
+            with self._lock:
+                self._retire_finished()
+                self._shards.append((threading.current_thread(), shard))
+            return shard
+    
+    def _retire_finished(self):
+        # Called with the lock held. A finished thread can no longer write to
+        # its shard, so folding it in loses nothing.
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                self._fold(self._retired, shard)
+        self._shards = live
+    
+    @staticmethod
+    def _fold(target, shard):
+        counters, timers = target
+        shard_counters, shard_timers = shard
+        for name, value in list(shard_counters.items()):
+            counters[name] = counters.get(name, 0) + value
+        for name, timer in list(shard_timers.items()):
+            merged = timers.setdefault(name, [0, 0.0, 0.0, [0] * (len(METRICS_BUCKETS) + 1)])
+            merged[0] += timer[0]
+            merged[1] += timer[1]
+            merged[2] = max(merged[2], timer[2])
+            merged[3] = [a + b for a, b in zip(merged[3], timer[3])]
+    
+    def inc(self, name: str, amount: int = 1):
+        if not self.enabled:
+            return
+        counters = self._shard()[0]
+        counters[name] = counters.get(name, 0) + amount
+    
+    def observe(self, name: str, seconds: float):
+        if not self.enabled:
+            return
+        timers = self._shard()[1]
+        timer = timers.get(name)
+        if timer is None:
+            timer = timers[name] = [0, 0.0, 0.0, [0] * (len(METRICS_BUCKETS) + 1)]
+        timer[0] += 1
+        timer[1] += seconds
+        if seconds > timer[2]:
+            timer[2] = seconds
+        timer[3][bisect_left(METRICS_BUCKETS, seconds)] += 1
+    
+    def timer(self, name: str):
+        return _StageTimer(self, name) if self.enabled else _NULL_TIMER
+    
+    def timed(self, name: str):
+        def decorator(fn):
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+            wrapper.__name__ = fn.__name__
+            wrapper.__qualname__ = fn.__qualname__
+            wrapper.__doc__ = fn.__doc__
+            wrapper.__wrapped__ = fn
+            return wrapper
+        return decorator
+    
+    def _merged(self):
+        merged = ({}, {})
+        with self._lock:
+            self._retire_finished()
+            self._fold(merged, self._retired)
+            shards = [shard for _, shard in self._shards]
+        for shard in shards:
+            self._fold(merged, shard)
+        return merged
+    
+    def snapshot(self) -> Dict[str, Any]:
+        counters, timers = self._merged()
+        return {
+            "counters": counters,
+            "stages": {
+                name: {"count": count, "total_seconds": total, "max_seconds": peak,
+                       "mean_seconds": total / count if count else 0.0}
+                for name, (count, total, peak, _) in timers.items()
+            }
+        }
+    
+    def render_prometheus(self) -> str:
+        counters, timers = self._merged()
+        lines = ["# TYPE airline_agent_events_total counter"]
+        for name, value in sorted(counters.items()):
+            lines.append(f'airline_agent_events_total{{event="{name}"}} {value}')
+        lines.append("# TYPE airline_agent_stage_seconds histogram")
+        for name, (count, total, _, buckets) in sorted(timers.items()):
+            cumulative = 0
+            for bound, hits in zip(METRICS_BUCKETS, buckets):
+                cumulative += hits
+                lines.append(f'airline_agent_stage_seconds_bucket{{stage="{name}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'airline_agent_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {count}')
+            lines.append(f'airline_agent_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'airline_agent_stage_seconds_count{{stage="{name}"}} {count}')
+        return "\n".join(lines) + "\n"
+    
+    def reset(self):
+        with self._lock:
+            for counters, timers in [self._retired] + [shard for _, shard in self._shards]:
+                counters.clear()
+                timers.clear()
+
+metrics = Metrics()
+
+def metrics_snapshot() -> Dict[str, Any]:
+    return metrics.snapshot()
+
+def render_metrics() -> str:
+    return metrics.render_prometheus()
+
+def _is_timeout(error: Exception) -> bool:
+    return isinstance(error, TimeoutError) or "timeout" in type(error).__name__.lower()
 
 
 # Flight database
@@ -107,306 +334,3668 @@ SAMPLE_TRANSCRIPTS = [
 ]
 
 # Together AI functions
+TOGETHER_MODEL = "mistralai/Mixtral-8x7B-Instruct-v0.1"
+
 def is_together_available():
     
-    return bool(together_api_key)
+    return bool(_load_env())
+
+def invoke_together_model(prompt: str, model: str = TOGETHER_MODEL,
+                          max_tokens: int = 500, temperature: float = 0.1, top_p: float = 0.9,
+                          use_cache: bool = True, refresh: bool = False):
+    # refresh skips the cache lookup but still stores the new response, so it
+    # replaces whatever was cached.
+    if not _load_env():
+        raise EnvironmentError("Together AI API key not configured")
+    
+    cache = get_llm_cache() if use_cache and LLM_CACHE_ENABLED else None
+    if cache is not None:
+        key = cache.make_key(model, prompt, max_tokens=max_tokens, temperature=temperature, top_p=top_p)
+        cached = cache.get(key) if not refresh else None
+        if cached is not None:
+            metrics.inc("llm.cache_hit")
+            return cached
+    
+    response = _resilient_call(_call_together, prompt, model, max_tokens, temperature, top_p)
+    
+    if cache is not None and isinstance(response, dict) and "output" in response:
+        cache.put(key, response)
+    
+    return response
+
+_STREAM_END = object()
+
+def stream_together_model(prompt: str, model: str = TOGETHER_MODEL,
+                          max_tokens: int = 500, temperature: float = 0.1, top_p: float = 0.9,
+                          use_cache: bool = True, refresh: bool = False) -> Iterator[str]:
+    # Yields completion text as it is generated. The cache, rate limit,
+    # breaker and deadlines apply as in invoke_together_model, but a stream
+    # is only retried before its first token, since text already handed out
+    # cannot be taken back. Closing the generator early stops the upstream
+    # stream, and partial completions are never cached.
+    if not _load_env():
+        raise EnvironmentError("Together AI API key not configured")
+    
+    cache = get_llm_cache() if use_cache and LLM_CACHE_ENABLED else None
+    if cache is not None:
+        key = cache.make_key(model, prompt, max_tokens=max_tokens, temperature=temperature, top_p=top_p)
+        cached = cache.get(key) if not refresh else None
+        if cached is not None:
+            metrics.inc("llm.cache_hit")
+            yield cached['output']['choices'][0]['text']
+            return
+    
+    if not _llm_breaker.allow():
+        metrics.inc("llm.circuit_skip")
+        raise CircuitOpenError("Together AI circuit breaker is open")
+    
+    probe = _llm_breaker.is_probing()
+    deadline = time.monotonic() + TOGETHER_DEADLINE
+    attempt = 0
+    while True:
+        tokens, stop = queue.Queue(), threading.Event()
+        call = _submit_llm(_stream_together, (prompt, model, max_tokens, temperature, top_p, tokens, stop), probe)
+        parts = []
+        try:
+            call.wait_started(deadline)
+            start = time.perf_counter()
+            while True:
+                timeout = min(TOGETHER_TIMEOUT, deadline - time.monotonic())
+                try:
+                    token = tokens.get(timeout=max(0.0, timeout))
+                except queue.Empty:
+                    raise LLMTimeoutError(f"Together AI stream stalled for {timeout:g}s")
+                if token is _STREAM_END:
+                    break
+                if isinstance(token, Exception):
+                    raise token
+                if not parts:
+                    metrics.observe("llm.first_token", time.perf_counter() - start)
+                parts.append(token)
+                yield token
+        except GeneratorExit:
+            metrics.inc("llm.stream_aborted")
+            _llm_breaker.record_success()
+            raise
+        except LLMSaturatedError:
+            if probe:
+                _llm_breaker.record_failure()
+            raise
+        except Exception as e:
+            _llm_breaker.record_failure()
+            metrics.inc("llm.timeout" if _is_timeout(e) else "llm.error")
+            attempt += 1
+            remaining = deadline - time.monotonic()
+            if parts or attempt > TOGETHER_MAX_RETRIES or remaining <= 0 or not _llm_breaker.allow():
+                raise
+            backoff = min(TOGETHER_BACKOFF_MAX, TOGETHER_BACKOFF_BASE * 2 ** (attempt - 1))
+            metrics.inc("llm.retry")
+            time.sleep(min(remaining, random.uniform(0, backoff)))
+            continue
+        finally:
+            stop.set()
+        
+        _llm_breaker.record_success()
+        metrics.observe("llm.stream", time.perf_counter() - start)
+        if cache is not None:
+            cache.put(key, {"output": {"choices": [{"text": "".join(parts)}]}})
+        return
+
+# Rate limiting
+TOGETHER_RATE_LIMIT = float(os.getenv("TOGETHER_RATE_LIMIT", "0"))
+TOGETHER_RATE_BURST = float(os.getenv("TOGETHER_RATE_BURST", "0"))
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 0):
+        self.rate = rate
+        self.capacity = capacity if capacity > 0 else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self, tokens: float = 1.0):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+_llm_rate_limiter = TokenBucket(TOGETHER_RATE_LIMIT, TOGETHER_RATE_BURST) if TOGETHER_RATE_LIMIT > 0 else None
+
+def set_llm_rate_limit(rate: float, burst: float = 0):
+    # rate is in requests per second; 0 disables limiting
+    global _llm_rate_limiter
+    _llm_rate_limiter = TokenBucket(rate, burst) if rate > 0 else None
+
+# Resilient calls
+TOGETHER_TIMEOUT = float(os.getenv("TOGETHER_TIMEOUT", "20"))
+TOGETHER_DEADLINE = float(os.getenv("TOGETHER_DEADLINE", "45"))
+TOGETHER_MAX_RETRIES = int(os.getenv("TOGETHER_MAX_RETRIES", "2"))
+TOGETHER_BACKOFF_BASE = float(os.getenv("TOGETHER_BACKOFF_BASE", "0.25"))
+TOGETHER_BACKOFF_MAX = float(os.getenv("TOGETHER_BACKOFF_MAX", "4"))
+TOGETHER_HEDGE_AFTER = float(os.getenv("TOGETHER_HEDGE_AFTER", "0"))
+TOGETHER_BREAKER_FAILURES = int(os.getenv("TOGETHER_BREAKER_FAILURES", "5"))
+TOGETHER_BREAKER_RESET = float(os.getenv("TOGETHER_BREAKER_RESET", "30"))
+TOGETHER_MAX_IN_FLIGHT = int(os.getenv("TOGETHER_MAX_IN_FLIGHT", "32"))
+
+class LLMTimeoutError(TimeoutError):
+    pass
+
+class LLMSaturatedError(LLMTimeoutError):
+    # Every LLM worker stayed busy until the deadline; the call never reached
+    # the provider, so it says nothing about the provider's health.
+    pass
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+class CircuitBreaker:
+    # Opens after `failure_threshold` consecutive failures. Once
+    # `reset_timeout` has passed, a single probe call is let through; its
+    # outcome closes the breaker again or re-opens it.
+    def __init__(self, failure_threshold: int = TOGETHER_BREAKER_FAILURES,
+                 reset_timeout: float = TOGETHER_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+    
+    def is_open(self) -> bool:
+        with self._lock:
+            if self.state == "open":
+                return time.monotonic() - self._opened_at < self.reset_timeout
+            return self.state == "half_open"
+    
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+            return False
+    
+    def is_probing(self) -> bool:
+        with self._lock:
+            return self.state == "half_open"
+    
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+    
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    metrics.inc("llm.circuit_opened")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+_llm_breaker = CircuitBreaker()
+_llm_executor = None
+_llm_probe_executor = None
+_llm_executor_lock = threading.Lock()
+
+def _get_llm_executor(probe: bool = False):
+    # Half-open probes get a worker of their own, so calls abandoned on the
+    # main pool cannot keep the breaker from ever closing again.
+    # Each pool is created on first use on its own, since either may have
+    # been adopted from another module instance (see _process_resources).
+    global _llm_executor, _llm_probe_executor
+    if probe:
+        if _llm_probe_executor is None:
+            with _llm_executor_lock:
+                if _llm_probe_executor is None:
+                    from concurrent.futures import ThreadPoolExecutor
+                    _llm_probe_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="together-probe")
+        return _llm_probe_executor
+    if _llm_executor is None:
+        with _llm_executor_lock:
+            if _llm_executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                _llm_executor = ThreadPoolExecutor(max_workers=TOGETHER_MAX_IN_FLIGHT, thread_name_prefix="together")
+    return _llm_executor
+
+def _llm_enabled() -> bool:
+    # Callers skip straight to their regex/template fallback while the
+    # provider is marked unhealthy.
+    if not is_together_available():
+        return False
+    if _llm_breaker.is_open():
+        metrics.inc("llm.circuit_skip")
+        return False
+    return True
+
+def _call_together(prompt: str, model: str, max_tokens: int, temperature: float, top_p: float):
+    metrics.inc("llm.call")
+    with metrics.timer("llm.call"):
+        return _get_together().Complete.create(
+            prompt=prompt,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature, 
+            top_p=top_p
+        )
+
+def _stream_together(prompt: str, model: str, max_tokens: int, temperature: float, top_p: float,
+                     tokens: queue.Queue, stop: threading.Event):
+    # Runs on an LLM worker, feeding tokens to the consumer until the stream
+    # ends or the consumer sets stop.
+    metrics.inc("llm.stream")
+    try:
+        stream = _get_together().Complete.create_streaming(
+            prompt=prompt,
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            top_p=top_p
+        )
+        try:
+            for token in stream:
+                if stop.is_set():
+                    break
+                tokens.put(token)
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+        tokens.put(_STREAM_END)
+    except Exception as e:
+        tokens.put(e)
+
+class _LLMCall:
+    # A call handed to an LLM worker. Its attempt timeout runs from
+    # started_at, when a worker picks it up, not from when it was queued.
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self.started = threading.Event()
+        self.started_at = 0.0
+        self.future = None
+    
+    def run(self):
+        self.started_at = time.monotonic()
+        self.started.set()
+        return self.fn(*self.args)
+    
+    def wait_started(self, deadline: float):
+        # A call still queued at the deadline is withdrawn.
+        if not self.started.wait(max(0.0, deadline - time.monotonic())) and self.future.cancel():
+            metrics.inc("llm.saturated")
+            raise LLMSaturatedError("No Together AI worker became free before the deadline")
+        self.started.wait()
+    
+    def abandon(self):
+        if not self.future.cancel():
+            metrics.inc("llm.abandoned")
+
+def _submit_llm(fn, args, probe: bool = False) -> _LLMCall:
+    if _llm_rate_limiter is not None:
+        with metrics.timer("llm.rate_limit_wait"):
+            _llm_rate_limiter.acquire()
+    call = _LLMCall(fn, args)
+    call.future = _get_llm_executor(probe).submit(call.run)
+    return call
+
+def _attempt_llm(fn, args, timeout: float, deadline: float, probe: bool = False):
+    # One attempt, given `timeout` seconds once a worker starts it and never
+    # running past `deadline`. When hedging is on and the first request is
+    # still running after TOGETHER_HEDGE_AFTER seconds, a duplicate is sent
+    # and whichever succeeds first wins. A request that overruns is abandoned
+    # rather than interrupted; the SDK's transport timeout ends it later.
+    from concurrent.futures import wait, FIRST_COMPLETED
+    calls = [_submit_llm(fn, args, probe)]
+    calls[0].wait_started(deadline)
+    attempt_deadline = min(deadline, calls[0].started_at + timeout)
+    if not probe and 0 < TOGETHER_HEDGE_AFTER < attempt_deadline - time.monotonic():
+        done, _ = wait([calls[0].future], timeout=TOGETHER_HEDGE_AFTER)
+        if not done:
+            metrics.inc("llm.hedge")
+            calls.append(_submit_llm(fn, args))
+    
+    error = None
+    pending = {call.future for call in calls}
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, attempt_deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                if future is not calls[0].future:
+                    metrics.inc("llm.hedge_win")
+                for call in calls:
+                    if call.future in pending:
+                        call.abandon()
+                return future.result()
+            error = future.exception()
+    for call in calls:
+        if call.future in pending:
+            call.abandon()
+    if pending or error is None:
+        raise LLMTimeoutError(f"Together AI call exceeded {timeout:g}s")
+    raise error
+
+def _resilient_call(fn, *args):
+    if not _llm_breaker.allow():
+        metrics.inc("llm.circuit_skip")
+        raise CircuitOpenError("Together AI circuit breaker is open")
+    
+    probe = _llm_breaker.is_probing()
+    deadline = time.monotonic() + TOGETHER_DEADLINE
+    attempt = 0
+    while True:
+        try:
+            result = _attempt_llm(fn, args, TOGETHER_TIMEOUT, deadline, probe)
+            _llm_breaker.record_success()
+            return result
+        except LLMSaturatedError:
+            # Only a probe that could not run counts: the breaker has to
+            # leave half-open either way.
+            if probe:
+                _llm_breaker.record_failure()
+            raise
+        except Exception as e:
+            _llm_breaker.record_failure()
+            metrics.inc("llm.timeout" if _is_timeout(e) else "llm.error")
+            attempt += 1
+            remaining = deadline - time.monotonic()
+            if attempt > TOGETHER_MAX_RETRIES or remaining <= 0 or not _llm_breaker.allow():
+                raise
+            # full jitter: sleep anywhere up to the exponential backoff cap
+            backoff = min(TOGETHER_BACKOFF_MAX, TOGETHER_BACKOFF_BASE * 2 ** (attempt - 1))
+            metrics.inc("llm.retry")
+            time.sleep(min(remaining, random.uniform(0, backoff)))
+
+# LLM response cache
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") != "0"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite3")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1024"))
+LLM_CACHE_DISK_ENTRIES = int(os.getenv("LLM_CACHE_DISK_ENTRIES", "100000"))
+
+class LLMResponseCache:
+    # Two tiers: an in-process LRU in front of an optional SQLite file shared
+    # between processes. Both tiers honour the same TTL.
+    def __init__(self, path: Optional[str] = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL,
+                 memory_entries: int = LLM_CACHE_MEMORY_ENTRIES, disk_entries: int = LLM_CACHE_DISK_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "writes": 0, "evictions": 0}
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes_since_trim = 0
+    
+    @staticmethod
+    def make_key(model: str, prompt: str, **params) -> str:
+        payload = json.dumps({"model": model, "prompt": prompt, "params": params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    def _disk(self):
+        if not self.path:
+            return None
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            self._conn.commit()
+        return self._conn
+    
+    def _remember(self, key: str, expires_at: float, response: Dict[str, Any]):
+        self._memory[key] = (expires_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+                self.stats["expired"] += 1
+            
+            try:
+                conn = self._disk()
+                row = conn.execute(
+                    "SELECT response, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone() if conn is not None else None
+                if row is not None:
+                    if row[1] > now:
+                        conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                        conn.commit()
+                        response = json.loads(row[0])
+                        self._remember(key, row[1], response)
+                        self.stats["disk_hits"] += 1
+                        return response
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    conn.commit()
+                    self.stats["expired"] += 1
+            except sqlite3.Error as e:
+                print(f"Error reading LLM response cache: {str(e)}")
+            
+            self.stats["misses"] += 1
+            return None
+    
+    def put(self, key: str, response: Dict[str, Any]):
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, response)
+            self.stats["writes"] += 1
+            try:
+                conn = self._disk()
+                if conn is None:
+                    return
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(response), expires_at, now)
+                )
+                self._writes_since_trim += 1
+                if self._writes_since_trim >= 100:
+                    self._trim(conn, now)
+                conn.commit()
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                print(f"Error writing LLM response cache: {str(e)}")
+    
+    def _trim(self, conn, now: float):
+        self._writes_since_trim = 0
+        conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+        excess = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.disk_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                (excess,)
+            )
+            self.stats["evictions"] += excess
+    
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            conn = self._disk()
+            if conn is not None:
+                conn.execute("DELETE FROM responses")
+                conn.commit()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache() -> LLMResponseCache:
+    global _llm_cache
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                _llm_cache = LLMResponseCache()
+    return _llm_cache
+
+# Flight store
+FLIGHT_STORE_PATH = os.getenv("FLIGHT_STORE_PATH", ":memory:")
+FLIGHT_INDEXED_FIELDS = ("destination", "status", "terminal", "gate")
+# What a record needs before lookups and answers can use it
+FLIGHT_REQUIRED_FIELDS = ("flight_number", "departure_time", "destination", "status", "terminal", "gate")
+
+def is_complete_flight_record(record: Dict[str, Any]) -> bool:
+    return all(record.get(field) not in (None, "") for field in FLIGHT_REQUIRED_FIELDS)
+
+def parse_clock_time(value: Union[str, int, None]) -> Optional[int]:
+    # "08:00 AM" / "14:30" -> minutes after midnight
+    if value is None or isinstance(value, int):
+        return value
+    match = re.match(r'^\s*(\d{1,2}):(\d{2})\s*([AaPp][Mm])?\s*$', value)
+    if not match:
+        return None
+    hours, minutes, meridiem = int(match.group(1)), int(match.group(2)), match.group(3)
+    if meridiem:
+        hours = hours % 12 + (12 if meridiem.upper() == "PM" else 0)
+    return hours * 60 + minutes
+
+class FlightStore(ABC):
+    @abstractmethod
+    def get(self, flight_number: str) -> Optional[Dict[str, Any]]:
+        ...
+    
+    @abstractmethod
+    def query(self, destination: Optional[str] = None, status: Optional[str] = None,
+              terminal: Optional[str] = None, gate: Optional[str] = None,
+              departs_after: Union[str, int, None] = None, departs_before: Union[str, int, None] = None,
+              limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        ...
+    
+    @abstractmethod
+    def upsert_many(self, records: Iterable[Dict[str, Any]]) -> int:
+        ...
+    
+    def upsert(self, record: Dict[str, Any]) -> int:
+        return self.upsert_many([record])
+    
+    def apply_updates(self, updates: Iterable[Dict[str, Any]]) -> int:
+        # Partial records are merged into the stored ones and written in one
+        # upsert_many call. Unknown flights are only added from complete
+        # records; other updates for them are skipped and counted.
+        merged = {}
+        rejected = 0
+        for update in updates:
+            flight_number = update["flight_number"].upper()
+            base = merged.get(flight_number) or self.get(flight_number)
+            if base is None and not is_complete_flight_record(update):
+                rejected += 1
+                continue
+            merged[flight_number] = {**(base or {}), **update, "flight_number": flight_number}
+        if rejected:
+            metrics.inc("flights.rejected", rejected)
+        return self.upsert_many(merged.values()) if merged else 0
+    
+    def get_json(self, flight_number: str) -> Optional[str]:
+        record = self.get(flight_number)
+        return json.dumps(record) if record is not None else None
+    
+    def get_many_json(self, flight_numbers: Iterable[str]) -> Dict[str, str]:
+        found = {}
+        for flight_number in flight_numbers:
+            record_json = self.get_json(flight_number)
+            if record_json is not None:
+                found[flight_number.upper()] = record_json
+        return found
+    
+    def get_version(self, flight_number: str) -> Optional[str]:
+        # Derived from the record's content, so it only changes when the
+        # record does and agrees across processes sharing a store.
+        record_json = self.get_json(flight_number)
+        return flight_record_version(record_json) if record_json is not None else None
+    
+    def known_flights(self) -> AbstractSet[str]:
+        # Upper-case flight numbers currently in the store.
+        return frozenset(record["flight_number"].upper() for record in self.query())
+
+def flight_record_version(record_json: str) -> str:
+    return hashlib.blake2b(record_json.encode("utf-8"), digest_size=8).hexdigest()
+
+class SQLiteFlightStore(FlightStore):
+    # Records are kept whole as JSON, with the indexed fields and departure
+    # time (in minutes) copied into columns for lookups and range queries.
+    # The database is opened and seeded on first use.
+    #
+    # Decoded records are cached next to their encoded JSON and version, so
+    # lookups hand out all three without re-encoding or re-hashing. An entry is dropped only when an upsert
+    # changes that record, or when another connection commits to the file.
+    # Returned dicts are shared and must be treated as read-only.
+    def __init__(self, path: str = FLIGHT_STORE_PATH, seed: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.path = path
+        self._seed = FLIGHT_DATABASE if seed is None else seed
+        self._conn = None
+        self._lock = threading.RLock()
+        self._records = {}
+        self._known = None
+        self._data_version = None
+    
+    def _db(self):
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS flights ("
+                        "flight_number TEXT PRIMARY KEY, departure_minutes INTEGER, "
+                        "destination TEXT COLLATE NOCASE, status TEXT COLLATE NOCASE, "
+                        "terminal TEXT COLLATE NOCASE, gate TEXT COLLATE NOCASE, record TEXT NOT NULL)"
+                    )
+                    for field in FLIGHT_INDEXED_FIELDS + ("departure_minutes",):
+                        conn.execute(f"CREATE INDEX IF NOT EXISTS flights_{field} ON flights ({field})")
+                    conn.commit()
+                    self._conn = conn
+                    if self._seed and not conn.execute("SELECT 1 FROM flights LIMIT 1").fetchone():
+                        self.upsert_many(self._seed.values())
+        return self._conn
+    
+    def _sync(self, conn):
+        if self.path and self.path != ":memory:":
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._records.clear()
+                self._known = None
+                self._data_version = data_version
+    
+    def _cached(self, flight_number: str, record_json: str):
+        entry = self._records.get(flight_number)
+        if entry is None or entry[1] != record_json:
+            entry = (json.loads(record_json), record_json, flight_record_version(record_json))
+            self._records[flight_number] = entry
+        return entry
+    
+    def _entries(self, flight_numbers: Iterable[str]) -> Dict[str, Any]:
+        conn = self._db()
+        found = {}
+        with self._lock:
+            self._sync(conn)
+            missing = []
+            for flight_number in flight_numbers:
+                flight_number = flight_number.upper()
+                entry = self._records.get(flight_number)
+                if entry is not None:
+                    found[flight_number] = entry
+                else:
+                    missing.append(flight_number)
+            for start in range(0, len(missing), 500):
+                batch = missing[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT flight_number, record FROM flights WHERE flight_number IN ({','.join('?' * len(batch))})",
+                    batch
+                ).fetchall()
+                for flight_number, record_json in rows:
+                    found[flight_number] = self._cached(flight_number, record_json)
+        return found
+    
+    def get(self, flight_number: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries([flight_number]).get(flight_number.upper())
+        return entry[0] if entry else None
+    
+    def get_json(self, flight_number: str) -> Optional[str]:
+        entry = self._entries([flight_number]).get(flight_number.upper())
+        return entry[1] if entry else None
+    
+    def get_many_json(self, flight_numbers: Iterable[str]) -> Dict[str, str]:
+        return {flight_number: entry[1] for flight_number, entry in self._entries(flight_numbers).items()}
+    
+    def get_version(self, flight_number: str) -> Optional[str]:
+        entry = self._entries([flight_number]).get(flight_number.upper())
+        return entry[2] if entry else None
+    
+    def known_flights(self) -> AbstractSet[str]:
+        conn = self._db()
+        with self._lock:
+            self._sync(conn)
+            if self._known is None:
+                self._known = frozenset(row[0] for row in conn.execute("SELECT flight_number FROM flights"))
+            return self._known
+    
+    def query(self, destination: Optional[str] = None, status: Optional[str] = None,
+              terminal: Optional[str] = None, gate: Optional[str] = None,
+              departs_after: Union[str, int, None] = None, departs_before: Union[str, int, None] = None,
+              limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        clauses, params = [], []
+        for field, value in zip(FLIGHT_INDEXED_FIELDS, (destination, status, terminal, gate)):
+            if value is not None:
+                clauses.append(f"{field} = ?")
+                params.append(value)
+        if departs_after is not None:
+            clauses.append("departure_minutes >= ?")
+            params.append(parse_clock_time(departs_after))
+        if departs_before is not None:
+            clauses.append("departure_minutes <= ?")
+            params.append(parse_clock_time(departs_before))
+        
+        sql = "SELECT flight_number, record FROM flights"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY departure_minutes, flight_number"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        
+        conn = self._db()
+        with self._lock:
+            self._sync(conn)
+            rows = conn.execute(sql, params).fetchall()
+            return [self._cached(flight_number, record_json)[0] for flight_number, record_json in rows]
+    
+    def upsert_many(self, records: Iterable[Dict[str, Any]]) -> int:
+        rows = []
+        for record in records:
+            record = dict(record)
+            record["flight_number"] = record["flight_number"].upper()
+            rows.append((
+                record["flight_number"], parse_clock_time(record.get("departure_time")),
+                record.get("destination"), record.get("status"), record.get("terminal"), record.get("gate"),
+                json.dumps(record)
+            ))
+        conn = self._db()
+        with self._lock:
+            conn.executemany(
+                "INSERT OR REPLACE INTO flights "
+                "(flight_number, departure_minutes, destination, status, terminal, gate, record) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.commit()
+            if self._known is not None and not self._known.issuperset(row[0] for row in rows):
+                self._known = None
+            for row in rows:
+                entry = self._records.get(row[0])
+                if entry is not None and entry[1] != row[-1]:
+                    del self._records[row[0]]
+        return len(rows)
+
+class FlightSnapshot:
+    # One immutable version of the flight table. Entries are
+    # (record, json, content version) tuples, shared with the previous
+    # snapshot unless a batch changed them.
+    def __init__(self, version: int, entries: Dict[str, Any]):
+        self.version = version
+        self.entries = entries
+        self._departures = None
+    
+    def departures(self) -> List[tuple]:
+        # (departure minutes, flight number, entry) in query order, built on
+        # first use. Flights without a departure time sort first, as in SQLite.
+        if self._departures is None:
+            rows = [(parse_clock_time(entry[0].get("departure_time")), flight_number, entry)
+                    for flight_number, entry in self.entries.items()]
+            rows.sort(key=lambda row: (row[0] is not None, row[0] or 0, row[1]))
+            self._departures = rows
+        return self._departures
+
+class SnapshotFlightStore(FlightStore):
+    # In-memory store for live flight data. Writers build a new snapshot from
+    # a copy of the current entries and publish it with a single reference
+    # assignment, so readers never lock and never see a half-applied batch.
+    # Writers are serialized by a lock. Returned dicts are shared and must be
+    # treated as read-only.
+    def __init__(self, seed: Optional[Dict[str, Dict[str, Any]]] = None):
+        self._write_lock = threading.Lock()
+        self._snapshot = FlightSnapshot(0, {})
+        seed = FLIGHT_DATABASE if seed is None else seed
+        if seed:
+            self.upsert_many(seed.values())
+    
+    def snapshot(self) -> FlightSnapshot:
+        # Hold on to the result to make several reads against one version.
+        return self._snapshot
+    
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+    
+    def get(self, flight_number: str) -> Optional[Dict[str, Any]]:
+        entry = self._snapshot.entries.get(flight_number.upper())
+        return entry[0] if entry else None
+    
+    def get_json(self, flight_number: str) -> Optional[str]:
+        entry = self._snapshot.entries.get(flight_number.upper())
+        return entry[1] if entry else None
+    
+    def get_many_json(self, flight_numbers: Iterable[str]) -> Dict[str, str]:
+        entries = self._snapshot.entries
+        found = {}
+        for flight_number in flight_numbers:
+            entry = entries.get(flight_number.upper())
+            if entry is not None:
+                found[flight_number.upper()] = entry[1]
+        return found
+    
+    def get_version(self, flight_number: str) -> Optional[str]:
+        entry = self._snapshot.entries.get(flight_number.upper())
+        return entry[2] if entry else None
+    
+    def known_flights(self) -> AbstractSet[str]:
+        return self._snapshot.entries.keys()
+    
+    def query(self, destination: Optional[str] = None, status: Optional[str] = None,
+              terminal: Optional[str] = None, gate: Optional[str] = None,
+              departs_after: Union[str, int, None] = None, departs_before: Union[str, int, None] = None,
+              limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        filters = [(field, str(value).lower()) for field, value in
+                   zip(FLIGHT_INDEXED_FIELDS, (destination, status, terminal, gate)) if value is not None]
+        after = parse_clock_time(departs_after) if departs_after is not None else None
+        before = parse_clock_time(departs_before) if departs_before is not None else None
+        if (departs_after is not None and after is None) or (departs_before is not None and before is None):
+            return []
+        
+        results = []
+        for minutes, _, (record, _, _) in self._snapshot.departures():
+            if limit is not None and len(results) >= limit:
+                break
+            if (after is not None or before is not None) and minutes is None:
+                continue
+            if (after is not None and minutes < after) or (before is not None and minutes > before):
+                continue
+            if all(isinstance(record.get(field), str) and record[field].lower() == value for field, value in filters):
+                results.append(record)
+        return results
+    
+    def _write(self, records: Iterable[Dict[str, Any]], merge: bool) -> int:
+        # With merge, records are partial updates and unknown flights are only
+        # added from complete records (see FlightStore.apply_updates).
+        with self._write_lock:
+            current = self._snapshot
+            entries = dict(current.entries)
+            count = changed = rejected = 0
+            for record in records:
+                flight_number = record["flight_number"].upper()
+                entry = entries.get(flight_number)
+                if merge and entry is None and not is_complete_flight_record(record):
+                    rejected += 1
+                    continue
+                count += 1
+                record = {**entry[0], **record} if merge and entry else dict(record)
+                record["flight_number"] = flight_number
+                record_json = json.dumps(record)
+                if entry is not None and entry[1] == record_json:
+                    continue
+                entries[flight_number] = (record, record_json, flight_record_version(record_json))
+                changed += 1
+            if changed:
+                self._snapshot = FlightSnapshot(current.version + 1, entries)
+        if rejected:
+            metrics.inc("flights.rejected", rejected)
+        return count
+    
+    def upsert_many(self, records: Iterable[Dict[str, Any]]) -> int:
+        return self._write(records, merge=False)
+    
+    def apply_updates(self, updates: Iterable[Dict[str, Any]]) -> int:
+        return self._write(updates, merge=True)
+
+# "sqlite" (the default) or "snapshot" for live-updated in-memory data
+FLIGHT_STORE_BACKEND = os.getenv("FLIGHT_STORE_BACKEND", "sqlite")
+
+_flight_store = None
+_flight_store_lock = threading.Lock()
+
+def get_flight_store() -> FlightStore:
+    global _flight_store
+    if _flight_store is None:
+        with _flight_store_lock:
+            if _flight_store is None:
+                _flight_store = SnapshotFlightStore() if FLIGHT_STORE_BACKEND == "snapshot" else SQLiteFlightStore()
+    return _flight_store
+
+def set_flight_store(store: FlightStore):
+    global _flight_store
+    _flight_store = store
+
+# Flight status feed
+FLIGHT_FEED = os.getenv("FLIGHT_FEED", "")
+FLIGHT_FEED_BATCH = int(os.getenv("FLIGHT_FEED_BATCH", "256"))
+FLIGHT_FEED_INTERVAL = float(os.getenv("FLIGHT_FEED_INTERVAL", "0.05"))
+
+FLIGHT_STATUSES = ["On Time", "Delayed", "Boarding", "Departed", "Cancelled"]
+
+def _parse_update(line: str) -> Optional[Dict[str, Any]]:
+    if not line.strip():
+        return None
+    try:
+        update = json.loads(line)
+    except ValueError as e:
+        print(f"Error parsing flight update: {str(e)}")
+        return None
+    if not isinstance(update, dict) or not isinstance(update.get("flight_number"), str):
+        print("Error parsing flight update: missing flight_number")
+        return None
+    return update
+
+def iter_update_file(path: str, follow: bool = False, poll_interval: float = 0.2,
+                     stop: Optional[threading.Event] = None) -> Iterator[Dict[str, Any]]:
+    # JSONL of partial flight records. With follow, keeps waiting for
+    # appended lines like tail -f until stop is set.
+    with open(path, "r", encoding="utf-8") as f:
+        pending = ""
+        while True:
+            line = f.readline()
+            if line.endswith("\n") or (line and not follow):
+                update = _parse_update(pending + line)
+                pending = ""
+                if update is not None:
+                    yield update
+            elif line:
+                pending += line
+            elif not follow or (stop is not None and stop.is_set()):
+                return
+            else:
+                time.sleep(poll_interval)
+
+def iter_update_socket(host: str, port: int) -> Iterator[Dict[str, Any]]:
+    # Newline-delimited JSON updates read from a TCP server until it closes.
+    import socket
+    with socket.create_connection((host, port)) as conn:
+        with conn.makefile("r", encoding="utf-8") as f:
+            for line in f:
+                update = _parse_update(line)
+                if update is not None:
+                    yield update
+
+def iter_synthetic_updates(flight_numbers: List[str], rate: float = 0, limit: Optional[int] = None,
+                           seed: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    # Stand-in producer: random status, gate and terminal changes, at about
+    # rate updates per second (0 for as fast as possible).
+    rng = random.Random(seed)
+    start = time.monotonic()
+    produced = 0
+    while limit is None or produced < limit:
+        update = {"flight_number": rng.choice(flight_numbers)}
+        change = rng.random()
+        if change < 0.6:
+            update["status"] = rng.choice(FLIGHT_STATUSES)
+        elif change < 0.9:
+            update["gate"] = f"{rng.choice('ABCD')}{rng.randint(1, 30)}"
+        else:
+            update["terminal"] = f"T{rng.randint(1, 3)}"
+        yield update
+        produced += 1
+        if rate > 0:
+            delay = start + produced / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+def open_flight_feed(spec: str, stop: Optional[threading.Event] = None) -> Iterator[Dict[str, Any]]:
+    # "file:PATH", "tail:PATH" (follow appends), "tcp:HOST:PORT" or
+    # "synthetic[:RATE]" (updates per second for the seeded flights)
+    kind, _, target = spec.partition(":")
+    if kind == "file":
+        return iter_update_file(target)
+    if kind == "tail":
+        return iter_update_file(target, follow=True, stop=stop)
+    if kind == "tcp":
+        host, _, port = target.rpartition(":")
+        return iter_update_socket(host or "127.0.0.1", int(port))
+    if kind == "synthetic":
+        return iter_synthetic_updates(sorted(FLIGHT_DATABASE), float(target or "100"))
+    raise ValueError(f"Unknown flight feed: {spec}")
+
+_FEED_END = object()
+
+class FlightFeed:
+    # Applies updates from a source to a flight store in batches: a batch is
+    # flushed when it reaches batch_size or when its first update has waited
+    # interval seconds. A reader thread drains the source into a bounded
+    # queue so a slow or blocking source never holds back a pending batch.
+    def __init__(self, source: Iterable[Dict[str, Any]], store: Optional[FlightStore] = None,
+                 batch_size: int = FLIGHT_FEED_BATCH, interval: float = FLIGHT_FEED_INTERVAL,
+                 stop: Optional[threading.Event] = None):
+        self.source = source
+        self.store = store
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self.updates = 0
+        self.batches = 0
+        self.stopped = stop or threading.Event()
+        self._queue = queue.Queue(maxsize=self.batch_size * 4)
+        self._threads = []
+    
+    def _read(self):
+        try:
+            for update in self.source:
+                while not self.stopped.is_set():
+                    try:
+                        self._queue.put(update, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if self.stopped.is_set():
+                    break
+        except Exception as e:
+            print(f"Error reading flight feed: {str(e)}")
+        finally:
+            while not self.stopped.is_set():
+                try:
+                    self._queue.put(_FEED_END, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+    
+    def _flush(self, batch: List[Dict[str, Any]]):
+        store = self.store or get_flight_store()
+        try:
+            with metrics.timer("flights.apply"):
+                store.apply_updates(batch)
+            self.updates += len(batch)
+            self.batches += 1
+            metrics.inc("flights.updates", len(batch))
+            metrics.inc("flights.batches")
+        except Exception as e:
+            print(f"Error applying flight updates: {str(e)}")
+    
+    def _apply(self):
+        batch, deadline = [], None
+        while True:
+            timeout = self.interval if not batch else max(0.0, deadline - time.monotonic())
+            try:
+                update = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                update = None
+            if update is _FEED_END:
+                break
+            if update is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.interval
+                batch.append(update)
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(batch)
+                batch = []
+            if self.stopped.is_set() and self._queue.empty():
+                break
+        if batch:
+            self._flush(batch)
+    
+    def start(self) -> "FlightFeed":
+        self._threads = [threading.Thread(target=self._read, name="flight-feed-reader", daemon=True),
+                         threading.Thread(target=self._apply, name="flight-feed", daemon=True)]
+        for thread in self._threads:
+            thread.start()
+        return self
+    
+    def run(self):
+        # Applies the whole source on the calling thread's behalf.
+        self.start()
+        self.join()
+    
+    def join(self, timeout: Optional[float] = None):
+        self._threads[-1].join(timeout)
+    
+    def stop(self, timeout: Optional[float] = None):
+        self.stopped.set()
+        self.join(timeout)
+
+_flight_feed = None
+_flight_feed_lock = threading.Lock()
+
+def start_flight_feed(spec: str = FLIGHT_FEED) -> Optional[FlightFeed]:
+    # Starts the process-wide feed named by FLIGHT_FEED, once.
+    global _flight_feed
+    if _flight_feed is None and spec:
+        with _flight_feed_lock:
+            if _flight_feed is None:
+                stop = threading.Event()
+                _flight_feed = FlightFeed(open_flight_feed(spec, stop), get_flight_store(), stop=stop).start()
+    return _flight_feed
+
+# Info Agent 
+def get_flight_info(flight_number: str):
+    return get_flight_store().get(flight_number) or {}
+
+@metrics.timed("info.total")
+def info_agent_request(flight_number: str)  :
+    try:
+        result = get_flight_store().get_json(flight_number)
+        
+        if not result:
+            return json.dumps({"error": f"Flight {flight_number} not found in database."})
+        
+        return result
+            
+    except Exception as e:
+        return json.dumps({"error": f"Error processing request: {str(e)}"})
+
+def info_agent_request_many(flight_numbers: List[str]):
+    # Records are spliced in from their pre-encoded JSON rather than re-dumped.
+    try:
+        requested = list(OrderedDict.fromkeys(flight_number.upper() for flight_number in flight_numbers))
+        found = get_flight_store().get_many_json(requested)
+        records = [found[flight_number] for flight_number in requested if flight_number in found]
+        not_found = [flight_number for flight_number in requested if flight_number not in found]
+        return '{"flights": [' + ", ".join(records) + '], "not_found": ' + json.dumps(not_found) + '}'
+    
+    except Exception as e:
+        return json.dumps({"error": f"Error processing request: {str(e)}"})
+
+def info_agent_search(destination: Optional[str] = None, status: Optional[str] = None,
+                      terminal: Optional[str] = None, gate: Optional[str] = None,
+                      departs_after: Optional[str] = None, departs_before: Optional[str] = None,
+                      limit: Optional[int] = None):
+    try:
+        flights = get_flight_store().query(destination, status, terminal, gate, departs_after, departs_before, limit)
+        return json.dumps({"count": len(flights), "flights": flights})
+    except Exception as e:
+        return json.dumps({"error": f"Error processing request: {str(e)}"})
+
+# QA Agent 
+def extract_flight_number(query: str)  :
+    # hot path: plain perf_counter calls are cheaper than a timer context
+    start = time.perf_counter()
+    try:
+        known_flights = get_flight_store().known_flights()
+    except Exception as e:
+        print(f"Error loading flight index: {str(e)}")
+        known_flights = None
+    flight_number = choose_flight_number(query, known_flights)
+    metrics.observe("extract.regex", time.perf_counter() - start)
+    if flight_number:
+        metrics.inc("extract.regex_hit")
+        return flight_number
+    
+    if _llm_enabled():
+        metrics.inc("extract.llm_fallback")
+        try:
+            prompt = f"""
+            Extract the flight number from the following user query. 
+            Respond with ONLY the flight number, or 'NONE' if no flight number is found.
+            
+            User query: {query}
+            
+            Flight number:
+            """
+            
+            with metrics.timer("extract.llm"):
+                response = invoke_together_model(prompt)
+            extracted = response['output']['choices'][0]['text'].strip()
+            
+            if re.match(r'^[A-Za-z]{1,3}\d{1,4}$', extracted):
+                metrics.inc("extract.llm_hit")
+                return extracted
+            elif extracted != "NONE":
+                flight_number = choose_flight_number(extracted, known_flights)
+                if flight_number:
+                    metrics.inc("extract.llm_hit")
+                    return flight_number
+        except Exception as e:
+            metrics.inc("extract.llm_error")
+            print(f"Error using Together AI for extraction: {str(e)}")
+            pass  
+    
+    metrics.inc("extract.none")
+    return ""
+
+# QA routing
+QA_ROUTER_THRESHOLD = float(os.getenv("QA_ROUTER_THRESHOLD", "0.8"))
+
+# Checked in order; the first match picks the answer template.
+QA_INTENT_PATTERNS = [
+    ("departure", re.compile(r'depart|departure|leave|time', re.IGNORECASE)),
+    ("destination", re.compile(r'destination|arrive|goes to|going to', re.IGNORECASE)),
+    ("status", re.compile(r'status|delayed|on time|cancelled', re.IGNORECASE)),
+    ("gate", re.compile(r'terminal|gate', re.IGNORECASE)),
+]
+
+# Questions the templates cannot answer even when an intent keyword is present.
+QA_OPEN_QUESTION_PATTERN = re.compile(
+    r"\b(why|how|should|could|would|can i|compensation|refund|rebook|baggage|luggage|meal|weather|connecting)\b",
+    re.IGNORECASE
+)
+
+def detect_query_intents(user_query: str):
+    # Returns the matching template intents in priority order, and the
+    # open-ended question words found (lowercased, sorted, de-duplicated).
+    matched = [intent for intent, pattern in QA_INTENT_PATTERNS if pattern.search(user_query)]
+    open_terms = sorted(set(term.lower() for term in QA_OPEN_QUESTION_PATTERN.findall(user_query)))
+    return matched, open_terms
+
+def classify_query_intent(user_query: str):
+    # One matching intent is a confident template answer. Several intents, or
+    # none at all, make the question ambiguous, and open-ended phrasing halves
+    # the confidence.
+    matched, open_terms = detect_query_intents(user_query)
+    if not matched:
+        intent, confidence = "general", 0.3
+    else:
+        intent, confidence = matched[0], 0.95 if len(matched) == 1 else 0.9 / len(matched)
+    if open_terms:
+        confidence *= 0.5
+    return intent, confidence
+
+# Semantic QA cache
+QA_CACHE_ENABLED = os.getenv("QA_CACHE_ENABLED", "1") != "0"
+QA_CACHE_ENTRIES = int(os.getenv("QA_CACHE_ENTRIES", "4096"))
+
+def qa_cache_key(flight_number: str, user_query: str):
+    # Differently worded questions about the same flight share a key when
+    # they detect the same intents and open-ended terms. Queries with no
+    # detected intent are not cached, since nothing pins down their meaning.
+    matched, open_terms = detect_query_intents(user_query)
+    if not matched:
+        return None
+    return (flight_number.upper(), tuple(sorted(matched)), tuple(open_terms))
+
+class QAAnswerCache:
+    # In-process LRU of generated answers. Each entry remembers the flight
+    # record version it was answered from; a lookup against a newer version
+    # drops the entry, so answers never outlive the data behind them.
+    def __init__(self, max_entries: int = QA_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "writes": 0, "evictions": 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, version: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == version:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    metrics.inc("qa.cache_hit")
+                    return entry[1]
+                del self._entries[key]
+                self.stats["stale"] += 1
+                metrics.inc("qa.cache_stale")
+            self.stats["misses"] += 1
+            metrics.inc("qa.cache_miss")
+            return None
+    
+    def put(self, key, version: str, answer: str):
+        with self._lock:
+            self._entries[key] = (version, answer)
+            self._entries.move_to_end(key)
+            self.stats["writes"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+_qa_cache = None
+_qa_cache_lock = threading.Lock()
+
+def get_qa_cache() -> QAAnswerCache:
+    global _qa_cache
+    if _qa_cache is None:
+        with _qa_cache_lock:
+            if _qa_cache is None:
+                _qa_cache = QAAnswerCache()
+    return _qa_cache
+
+def template_answer(flight_data: Dict[str, Any], intent: str) -> str:
+    # Fields a record lacks read as "unknown" rather than failing the answer.
+    flight_data = {**dict.fromkeys(FLIGHT_REQUIRED_FIELDS, "unknown"),
+                   **{field: value for field, value in flight_data.items() if value not in (None, "")}}
+    if intent == "departure":
+        return f"Flight {flight_data['flight_number']} departs at {flight_data['departure_time']} to {flight_data['destination']}. Current status: {flight_data['status']}."
+    elif intent == "destination":
+        return f"Flight {flight_data['flight_number']} is headed to {flight_data['destination']}. It departs at {flight_data['departure_time']}. Current status: {flight_data['status']}."
+    elif intent == "status":
+        return f"Flight {flight_data['flight_number']} status: {flight_data['status']}. It's scheduled to depart at {flight_data['departure_time']} to {flight_data['destination']}."
+    elif intent == "gate":
+        return f"Flight {flight_data['flight_number']} departs from Terminal {flight_data['terminal']}, Gate {flight_data['gate']}. Current status: {flight_data['status']}."
+    return f"Flight {flight_data['flight_number']} to {flight_data['destination']} departs at {flight_data['departure_time']} from Terminal {flight_data['terminal']}, Gate {flight_data['gate']}. Current status: {flight_data['status']}."
+
+QA_MAX_ANSWER_CHARS = 200
+
+def _qa_plan(user_query: str, refresh: bool = False) -> Dict[str, Any]:
+    # Everything decided before the model is called. "answer" is set when no
+    # model call is needed, with "tier" saying where it came from: "lookup"
+    # (no flight to answer about) or "cache". Otherwise "prompt" is set when
+    # the query is routed to the model, and "fallback" holds the template
+    # answer. refresh skips the answer cache lookup.
+    flight_number = extract_flight_number(user_query)
+    
+    if not flight_number:
+        metrics.inc("qa.no_flight")
+        return {"answer": "I couldn't identify a flight number in your query. Please specify a flight number like 'AI123'.",
+                "tier": "lookup"}
+    
+    start = time.perf_counter()
+    flight_data = get_flight_info(flight_number)
+    metrics.observe("qa.lookup", time.perf_counter() - start)
+    
+    if not flight_data:
+        metrics.inc("qa.not_found")
+        return {"answer": f"Flight {flight_number} not found in database.", "tier": "lookup"}
+    
+    intent, confidence = classify_query_intent(user_query)
+    plan = {"fallback": template_answer(flight_data, intent)}
+    if confidence < QA_ROUTER_THRESHOLD and _llm_enabled():
+        metrics.inc("qa.route_llm")
+        cache = get_qa_cache() if QA_CACHE_ENABLED else None
+        cache_key = qa_cache_key(flight_number, user_query) if cache is not None else None
+        version = get_flight_store().get_version(flight_number) if cache_key is not None else None
+        if version is not None:
+            answer = cache.get(cache_key, version) if not refresh else None
+            if answer is not None:
+                return {"answer": answer, "tier": "cache"}
+            plan["cache_slot"] = (cache, cache_key, version)
+        
+        plan["prompt"] = f"""
+                Generate a concise answer to the user's query about a flight based on the flight data provided.
+                The response should be factual and address the specific question asked.
+                
+                User query: {user_query}
+                
+                Flight data: {get_flight_store().get_json(flight_number)}
+                
+                Answer:
+                """
+    else:
+        metrics.inc("qa.route_template")
+    return plan
+
+def _qa_accept(plan: Dict[str, Any], answer: str):
+    metrics.inc("qa.llm_answer")
+    if "cache_slot" in plan:
+        cache, cache_key, version = plan["cache_slot"]
+        cache.put(cache_key, version, answer)
+
+def _qa_fallback(plan: Dict[str, Any]) -> Dict[str, str]:
+    # The template answer, tiered "fallback" when it stands in for a model
+    # answer that failed or was rejected.
+    metrics.inc("qa.template_answer")
+    return {"answer": plan["fallback"], "tier": "fallback" if "prompt" in plan else "template"}
+
+@metrics.timed("qa.total")
+def qa_agent_respond(user_query: str, refresh: bool = False)  :
+    try:
+        plan = _qa_plan(user_query, refresh)
+        if "answer" in plan:
+            return json.dumps({
+                "answer": plan["answer"],
+                "tier": plan["tier"]
+            })
+        
+        if "prompt" in plan:
+            try:
+                with metrics.timer("qa.llm"):
+                    response = invoke_together_model(plan["prompt"], refresh=refresh)
+                answer = response['output']['choices'][0]['text'].strip()
+                
+                if answer and len(answer) <= QA_MAX_ANSWER_CHARS:
+                    _qa_accept(plan, answer)
+                    return json.dumps({
+                        "answer": answer,
+                        "tier": "llm"
+                    })
+                metrics.inc("qa.llm_rejected")
+            except Exception as e:
+                metrics.inc("qa.llm_error")
+                print(f"Error using Together AI for response generation: {str(e)}")
+        
+        return json.dumps(_qa_fallback(plan))
+            
+    except Exception as e:
+        return json.dumps({"answer": f"Error processing request: {str(e)}", "tier": "error"})
+
+def qa_agent_respond_stream(user_query: str, refresh: bool = False) -> Iterator[Dict[str, str]]:
+    # Yields {"delta": text} events while the model answers and always ends
+    # with {"answer": ..., "tier": ...}, what qa_agent_respond would give. The
+    # length guard is checked as tokens arrive: an answer that outgrows it is
+    # cut off there and the final event carries the template answer instead.
+    try:
+        plan = _qa_plan(user_query, refresh)
+    except Exception as e:
+        yield {"answer": f"Error processing request: {str(e)}", "tier": "error"}
+        return
+    if "answer" in plan:
+        yield {"answer": plan["answer"], "tier": plan["tier"]}
+        return
+    
+    if "prompt" in plan:
+        stream = None
+        try:
+            stream = stream_together_model(plan["prompt"], refresh=refresh)
+            text = ""
+            for token in stream:
+                text += token
+                if len(text.strip()) > QA_MAX_ANSWER_CHARS:
+                    metrics.inc("qa.stream_aborted")
+                    break
+                yield {"delta": token}
+            else:
+                answer = text.strip()
+                if answer:
+                    _qa_accept(plan, answer)
+                    yield {"answer": answer, "tier": "llm"}
+                    return
+            metrics.inc("qa.llm_rejected")
+        except Exception as e:
+            metrics.inc("qa.llm_error")
+            print(f"Error using Together AI for response generation: {str(e)}")
+        finally:
+            if stream is not None:
+                stream.close()
+    
+    yield _qa_fallback(plan)
+
+# Keyword matching
+CALL_CATEGORIES = {
+    "Flight Booking": ["book", "reserve", "purchase", "buy", "schedule"],
+    "Flight Cancellation": ["cancel", "refund", "money back"],
+    "Flight Rescheduling": ["reschedule", "change", "move", "different date"],
+    "Baggage Issue": ["baggage", "luggage", "bag", "suitcase", "missing", "lost"],
+    "Complaint": ["complaint", "unhappy", "disappointed", "poor", "terrible", "bad experience"],
+    "Seat Change": ["seat", "change seat", "different seat", "window", "aisle"],
+    "General Inquiry": ["status", "check", "information", "time", "when"]
+}
+
+POSITIVE_WORDS = ["thank", "good", "great", "excellent", "helpful", "appreciate", "happy", "satisfied"]
+NEGATIVE_WORDS = ["unhappy", "disappointed", "poor", "terrible", "bad", "issue", "problem", "complaint", "delay"]
+
+RESOLUTION_PHRASES = ["thank you", "have a"]
+
+# Vocabularies up to this size are matched with a substring scan per term,
+# which beats the single regex pass until roughly 90-100 terms on call-sized
+# texts (see `python benchmarks.py keywords`).
+KEYWORD_SCAN_MAX_TERMS = int(os.getenv("KEYWORD_SCAN_MAX_TERMS", "80"))
+
+class KeywordMatcher:
+    # Small vocabularies are scanned term by term with str.count. Larger ones
+    # are compiled into a trie-shaped regex inside a lookahead, so one
+    # finditer pass tests every position of the text in the C regex engine.
+    # Each position yields its longest matching term; shorter terms starting
+    # there are exactly the vocabulary prefixes of that term. Both count
+    # overlapping occurrences, so they give the same hits.
+    def __init__(self, terms: List[str], scan_max_terms: Optional[int] = None):
+        self.terms = sorted(set(term.lower() for term in terms if term))
+        self.scan = len(self.terms) <= (KEYWORD_SCAN_MAX_TERMS if scan_max_terms is None else scan_max_terms)
+        # str.count skips over each match, which undercounts terms that can
+        # overlap themselves ("aa" in "aaa")
+        self._overlapping = {term for term in self.terms
+                             if any(term[:size] == term[-size:] for size in range(1, len(term)))}
+        if self.scan:
+            return
+        trie = {}
+        for term in self.terms:
+            node = trie
+            for char in term:
+                node = node.setdefault(char, {})
+            node[""] = term
+        self._prefixes = {}
+        for term in self.terms:
+            node = trie
+            prefixes = []
+            for char in term[:-1]:
+                node = node[char]
+                if "" in node:
+                    prefixes.append(node[""])
+            self._prefixes[term] = prefixes
+        body = self._trie_pattern(trie) if self.terms else "(?!)"
+        self._pattern = re.compile(f"(?=({body}))")
+    
+    @classmethod
+    def _trie_pattern(cls, node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + cls._trie_pattern(child) for char, child in node.items() if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        pattern = "(?:" + "|".join(branches) + ")"
+        return pattern + "?" if "" in node else pattern
+    
+    def count(self, text: str) -> Dict[str, int]:
+        # text is expected to be lower-case already
+        if self.scan:
+            return self._scan(text)
+        hits = {}
+        prefixes = self._prefixes
+        for match in self._pattern.finditer(text):
+            term = match.group(1)
+            hits[term] = hits.get(term, 0) + 1
+            for prefix in prefixes[term]:
+                hits[prefix] = hits.get(prefix, 0) + 1
+        return hits
+    
+    def _scan(self, text: str) -> Dict[str, int]:
+        hits = {}
+        for term in self.terms:
+            if term in text:
+                if term in self._overlapping:
+                    count, start = 0, text.find(term)
+                    while start >= 0:
+                        count += 1
+                        start = text.find(term, start + 1)
+                    hits[term] = count
+                else:
+                    hits[term] = text.count(term)
+        return hits
+
+_keyword_matcher = KeywordMatcher(
+    [keyword for keywords in CALL_CATEGORIES.values() for keyword in keywords]
+    + POSITIVE_WORDS + NEGATIVE_WORDS + RESOLUTION_PHRASES
+)
+
+def match_keywords(transcript: str) -> Dict[str, int]:
+    return _keyword_matcher.count(transcript.lower())
+
+def score_sentiment(keyword_hits: Dict[str, int]) -> int:
+    positive = sum(1 for word in POSITIVE_WORDS if word in keyword_hits)
+    negative = sum(1 for word in NEGATIVE_WORDS if word in keyword_hits)
+    return positive - negative
+
+# Transcript compression
+CATEGORIZE_COMPRESS = os.getenv("CATEGORIZE_COMPRESS", "1") != "0"
+CATEGORIZE_TOKEN_BUDGET = int(os.getenv("CATEGORIZE_TOKEN_BUDGET", "512"))
+
+SPEAKER_PATTERN = re.compile(r'^([A-Za-z][A-Za-z ]{0,20}):\s*(.*)$')
+SENTENCE_SPLIT_PATTERN = re.compile(r'(?<=[.!?])\s+')
+FLIGHT_MENTION_PATTERN = re.compile(r'\b[A-Za-z]{1,3}\d{1,4}\b')
+BOOKING_REFERENCE_PATTERN = re.compile(r'\b(?=[A-Z0-9]*\d)(?=[A-Z0-9]*[A-Z])[A-Z0-9]{5,8}\b')
+NAME_MENTION_PATTERN = re.compile(r"(?i:\bname is|\bI'm|\bI am|\bthis is)\s+[A-Z][a-z]+")
+DATE_MENTION_PATTERN = re.compile(
+    r'\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+\d{1,2}\b|\b\d{1,2}[/-]\d{1,2}(?:[/-]\d{2,4})?\b'
+    r'|\b(?:tomorrow|yesterday|next week|(?:mon|tues|wednes|thurs|fri|satur|sun)day)\b',
+    re.IGNORECASE
+)
+_category_keywords = frozenset(keyword for keywords in CALL_CATEGORIES.values() for keyword in keywords)
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text; close enough to
+    # budget prompts without loading a tokenizer.
+    return (len(text) + 3) // 4
+
+def _sentence_priority(sentence: str) -> int:
+    if (FLIGHT_MENTION_PATTERN.search(sentence) or BOOKING_REFERENCE_PATTERN.search(sentence)
+            or NAME_MENTION_PATTERN.search(sentence)):
+        return 3
+    if DATE_MENTION_PATTERN.search(sentence):
+        return 2
+    if _category_keywords.intersection(_keyword_matcher.count(sentence.lower())):
+        return 1
+    return 0
+
+def compress_transcript(transcript: str, token_budget: Optional[int] = None):
+    # Whitespace is normalized and the transcript is cut into sentences, each
+    # remembering its speaker turn. Only sentences that mention a flight,
+    # booking reference, name, date or category keyword are kept, so greetings
+    # and sign-offs fall away. The exception is sentences in the last two turns
+    # carrying a resolution phrase, because they show how the call ended. When
+    # the kept text is over budget, the lowest-priority sentences go first.
+    # Returns the compressed transcript and a dict of token counts.
+    if token_budget is None:
+        token_budget = CATEGORIZE_TOKEN_BUDGET
+    sentences = []
+    turns = 0
+    lines = [" ".join(line.split()) for line in transcript.splitlines()]
+    lines = [line for line in lines if line]
+    for index, line in enumerate(lines):
+        match = SPEAKER_PATTERN.match(line)
+        speaker, text = (match.group(1), match.group(2)) if match else ("", line)
+        closing = index >= len(lines) - 2
+        turns += 1
+        for sentence in SENTENCE_SPLIT_PATTERN.split(text):
+            if not sentence:
+                continue
+            priority = _sentence_priority(sentence)
+            if not priority and closing and any(phrase in sentence.lower() for phrase in RESOLUTION_PHRASES):
+                priority = 1
+            if priority:
+                sentences.append((priority, len(sentences), turns, speaker, sentence))
+    
+    truncated = False
+    if not sentences:
+        # Nothing stood out; fall back to the normalized text.
+        sentences = [(1, 0, 1, "", " ".join(lines))]
+    if token_budget > 0 and sum(estimate_tokens(item[4]) + 1 for item in sentences) > token_budget:
+        kept, used = [], 0
+        for item in sorted(sentences, key=lambda item: (-item[0], item[1])):
+            cost = estimate_tokens(item[4]) + 1
+            if used + cost <= token_budget:
+                kept.append(item)
+                used += cost
+        if not kept:
+            item = sentences[0]
+            kept = [item[:4] + (item[4][:max(0, token_budget - 1) * 4],)]
+        truncated = True
+        sentences = sorted(kept, key=lambda item: item[1])
+    
+    output, turn, parts = [], None, []
+    for _, _, turn_index, speaker, sentence in sentences:
+        if turn_index != turn:
+            if parts:
+                output.append(" ".join(parts))
+            turn, parts = turn_index, [f"{speaker}:"] if speaker else []
+        parts.append(sentence)
+    if parts:
+        output.append(" ".join(parts))
+    compressed = "\n".join(output)
+    
+    original_tokens = estimate_tokens(transcript)
+    compressed_tokens = estimate_tokens(compressed)
+    return compressed, {
+        "original_tokens": original_tokens,
+        "compressed_tokens": compressed_tokens,
+        "saved_tokens": max(0, original_tokens - compressed_tokens),
+        "turns": turns,
+        "kept_turns": len(output),
+        "truncated": truncated,
+    }
+
+# Entity extraction
+MENTIONED_FLIGHT_PATTERN = r'([A-Za-z]{1,3}\d{1,4})'
+CUSTOMER_NAME_PATTERNS = [
+    r'name is ([A-Za-z\s]+),',
+    r'name is ([A-Za-z\s]+)\.', 
+    r'I\'m ([A-Za-z\s]+),',
+    r'this is ([A-Za-z\s]+),'
+]
+
+# Flight context, in the order extract_flight_number prefers it
+FLIGHT_CONTEXT_BEFORE, FLIGHT_CONTEXT_AFTER, FLIGHT_CONTEXT_NUMBER, FLIGHT_CONTEXT_NONE = range(4)
+
+# A bare code right after one of these is a booking reference or a seat,
+# not a flight.
+NON_FLIGHT_CONTEXT_PATTERN = re.compile(
+    r'(?i:\b(?:booking|reference|confirmation|pnr|locator|seat)\b[^.?!\n]{0,24})$'
+)
+
+class EntityExtractor:
+    # Precompiled patterns for the entities in queries and transcripts:
+    # flight codes and customer names. Codes come
+    # out exactly as re.findall(MENTIONED_FLIGHT_PATTERN) would return them,
+    # and the name is the one the first matching CUSTOMER_NAME_PATTERNS entry
+    # would pick. Each pattern runs only when its entity is asked for; one
+    # alternation of them all measured several times slower in re's
+    # backtracking engine than these separate scans.
+    def __init__(self):
+        self.code_pattern = re.compile(MENTIONED_FLIGHT_PATTERN)
+        self.spaced_code_pattern = re.compile(r'(?<![A-Za-z])([A-Za-z]{1,3})[ -](\d{1,4})(?!\d)')
+        # Much cheaper than the full pattern, and found wherever it would match
+        self.spaced_hint_pattern = re.compile(r'[ -]\d')
+        self.flight_word_pattern = re.compile(r'(?i:flight)\s+((?i:number)\s+)?')
+        self.flight_after_pattern = re.compile(r'\s+(?i:flight)')
+        self.name_patterns = [re.compile(pattern) for pattern in CUSTOMER_NAME_PATTERNS]
+    
+    def flight_codes(self, text: str) -> List[str]:
+        return self.code_pattern.findall(text)
+    
+    def customer_name(self, text: str) -> Optional[str]:
+        for pattern in self.name_patterns:
+            name_match = pattern.search(text)
+            if name_match:
+                return name_match.group(1).strip()
+        return None
+    
+    def flight_candidates(self, text: str) -> List[tuple]:
+        # (code, start, context, spaced) in text order. "AI 123" and "ai-123"
+        # forms are spaced codes, joined up as "AI123".
+        flight_words = {match.end(): match.group(1) is not None for match in self.flight_word_pattern.finditer(text)}
+        candidates = []
+        for match in self.code_pattern.finditer(text):
+            candidates.append((match.group(1), match.start(), self._context(text, match, flight_words), False))
+        for match in self.spaced_code_pattern.finditer(text):
+            candidates.append((match.group(1) + match.group(2), match.start(),
+                               self._context(text, match, flight_words), True))
+        candidates.sort(key=lambda candidate: candidate[1])
+        return candidates
+    
+    def _context(self, text: str, match, flight_words: Dict[int, bool]) -> int:
+        number_word = flight_words.get(match.start())
+        if number_word is False:
+            return FLIGHT_CONTEXT_BEFORE
+        if self.flight_after_pattern.match(text, match.end()):
+            return FLIGHT_CONTEXT_AFTER
+        if number_word:
+            return FLIGHT_CONTEXT_NUMBER
+        return FLIGHT_CONTEXT_NONE
+
+entity_extractor = EntityExtractor()
+
+def choose_flight_number(text: str, known_flights: Optional[AbstractSet[str]] = None) -> str:
+    # Known flights win, then codes next to the word "flight", then the
+    # first bare code that does not follow a booking or seat mention. Ties go
+    # to the earliest code.
+    if known_flights:
+        # Most queries name a single known flight, which needs no context
+        # scan, only a check that no spaced code is known as well.
+        known = None
+        for code in entity_extractor.flight_codes(text):
+            if code.upper() in known_flights:
+                if known is not None and code != known:
+                    break
+                known = code
+        else:
+            if known is not None and (not entity_extractor.spaced_hint_pattern.search(text) or not any(
+                    (match.group(1) + match.group(2)).upper() in known_flights
+                    for match in entity_extractor.spaced_code_pattern.finditer(text))):
+                metrics.inc("extract.known")
+                return known
+    candidates = entity_extractor.flight_candidates(text)
+    if known_flights:
+        known = [candidate for candidate in candidates if candidate[0].upper() in known_flights]
+        if known:
+            metrics.inc("extract.known")
+            return min(known, key=lambda candidate: (candidate[2], candidate[1]))[0]
+    in_context = [candidate for candidate in candidates if candidate[2] != FLIGHT_CONTEXT_NONE]
+    if in_context:
+        return min(in_context, key=lambda candidate: (candidate[2], candidate[1]))[0]
+    for code, start, _, spaced in candidates:
+        if spaced:
+            continue
+        if NON_FLIGHT_CONTEXT_PATTERN.search(text, max(0, start - 48), start):
+            metrics.inc("extract.rejected")
+            continue
+        return code
+    return ""
+
+# Call categorization 
+def _categorize_prompt(transcript: str) -> str:
+    if CATEGORIZE_COMPRESS:
+        transcript, stats = compress_transcript(transcript)
+        metrics.inc("categorize.prompt_tokens", stats["compressed_tokens"])
+        metrics.inc("categorize.prompt_tokens_saved", stats["saved_tokens"])
+    return f"""
+                You are an AI assistant that categorizes airline call center conversations. 
+                Categories include: Flight Booking, Flight Cancellation, Flight Rescheduling, 
+                Refund Request, Baggage Issue, Complaint, and General Inquiry.
+                
+                Please categorize the following call transcript and extract key information 
+                like flight numbers, dates, and specific issues. Provide the output in JSON 
+                format with 'category' and 'details' fields.
+                
+                Transcript: {transcript}
+                
+                Output:
+                """
+
+def categorize_call(transcript: str, keyword_hits: Optional[Dict[str, int]] = None, refresh: bool = False)  :
+    return _categorize_with_source(transcript, keyword_hits, refresh)[0]
+
+@metrics.timed("categorize.total")
+def _categorize_with_source(transcript: str, keyword_hits: Optional[Dict[str, int]] = None, refresh: bool = False):
+    # Returns the categorization and which analyzer produced it: "llm",
+    # "rules", or "error".
+    try:
+        if _llm_enabled():
+            try:
+                with metrics.timer("categorize.llm"):
+                    response = invoke_together_model(_categorize_prompt(transcript), refresh=refresh)
+                categorization = response['output']['choices'][0]['text'].strip()
+                
+                try:
+                    metrics.inc("categorize.llm")
+                    return categorization, "llm"
+                except json.JSONDecodeError:
+                    pass
+            except Exception as e:
+                metrics.inc("categorize.llm_error")
+                print(f"Error using Together AI for categorization: {str(e)}")
+        
+        return _categorize_rules(transcript, keyword_hits), "rules"
+    
+    except Exception as e:
+        return json.dumps({"error": f"Error categorizing call: {str(e)}"}), "error"
+
+def _categorize_rules(transcript: str, keyword_hits: Optional[Dict[str, int]] = None) -> str:
+    metrics.inc("categorize.rules")
+    if keyword_hits is None:
+        keyword_hits = match_keywords(transcript)
+    determined_category = "General Inquiry"  
+    
+    for category, keywords in CALL_CATEGORIES.items():
+        if not keyword_hits.keys().isdisjoint(keywords):
+            determined_category = category
+    
+    flight_numbers = [code for code in entity_extractor.flight_codes(transcript) if code.upper().startswith('AI')]
+    
+    resolved = all(phrase in keyword_hits for phrase in RESOLUTION_PHRASES)
+    resolution_status = "Resolved" if resolved else "Pending"
+    
+    customer_name = entity_extractor.customer_name(transcript) or "Unknown"
+    
+    details = {
+        "flight_numbers": flight_numbers,
+        "customer_name": customer_name,
+        "resolution_status": resolution_status,
+        "call_summary": f"{determined_category} related to flight(s): {', '.join(flight_numbers) if flight_numbers else 'None specified'}"
+    }
+    
+    return json.dumps({
+        "category": determined_category,
+        "details": details
+    })
+
+def categorize_call_stream(transcript: str, keyword_hits: Optional[Dict[str, int]] = None,
+                           refresh: bool = False) -> Iterator[Dict[str, str]]:
+    # Yields {"delta": text} events while the model writes its categorization
+    # and always ends with {"result": ..., "source": ...}: the string
+    # categorize_call would return and the analyzer that produced it ("llm",
+    # "rules" or "error"). A failed stream falls back to the rules.
+    try:
+        if _llm_enabled():
+            stream = None
+            try:
+                stream = stream_together_model(_categorize_prompt(transcript), refresh=refresh)
+                parts = []
+                for token in stream:
+                    parts.append(token)
+                    yield {"delta": token}
+                metrics.inc("categorize.llm")
+                yield {"result": "".join(parts).strip(), "source": "llm"}
+                return
+            except Exception as e:
+                metrics.inc("categorize.llm_error")
+                print(f"Error using Together AI for categorization: {str(e)}")
+            finally:
+                if stream is not None:
+                    stream.close()
+        
+        result, source = _categorize_rules(transcript, keyword_hits), "rules"
+    except Exception as e:
+        result, source = json.dumps({"error": f"Error categorizing call: {str(e)}"}), "error"
+    yield {"result": result, "source": source}
+
+# Batch analysis
+KPI_VECTORIZE = os.getenv("KPI_VECTORIZE", "1") != "0"
+_numpy = None
+
+def _get_numpy():
+    # NumPy is optional; without it batches take the per-transcript path.
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+class BatchAnalyzer:
+    # Rule-based analysis of a whole chunk at once. Single-word keywords and
+    # flight numbers can only occur inside a whitespace-delimited token, so
+    # the chunk is split into tokens once. Each distinct token is matched a
+    # single time and the result remembered. Tokens map to keyword columns
+    # through a sparse token-term table, which gives a document-term presence
+    # matrix. Multi-word keywords get one literal scan each. Category hits,
+    # sentiment and resolution are then matrix products with per-term weights.
+    # The results equal categorize_call's rules path.
+    TOKEN_MEMO_LIMIT = 500000
+    
+    def __init__(self, matcher: KeywordMatcher, np):
+        self.np = np
+        self.matcher = matcher
+        terms = matcher.terms
+        self._column = {term: index for index, term in enumerate(terms)}
+        self._multiword = [(index, re.compile(re.escape(term))) for term, index in self._column.items()
+                           if any(char.isspace() for char in term)]
+        self._lock = threading.Lock()
+        self._reset_memo()
+        
+        self.categories = list(CALL_CATEGORIES)
+        self._category_weights = np.zeros((len(terms), len(self.categories)), dtype=np.int32)
+        for index, keywords in enumerate(CALL_CATEGORIES.values()):
+            for keyword in keywords:
+                if keyword in self._column:
+                    self._category_weights[self._column[keyword], index] = 1
+        self._sentiment_weights = np.zeros(len(terms), dtype=np.int32)
+        for word in POSITIVE_WORDS:
+            if word in self._column:
+                self._sentiment_weights[self._column[word]] += 1
+        for word in NEGATIVE_WORDS:
+            if word in self._column:
+                self._sentiment_weights[self._column[word]] -= 1
+        self._resolution = ([self._column[phrase] for phrase in RESOLUTION_PHRASES]
+                            if all(phrase in self._column for phrase in RESOLUTION_PHRASES) else None)
+    
+    def _reset_memo(self):
+        # Token memos hold an id per distinct token: -2 for the document
+        # separator, -1 for tokens with nothing to report, otherwise an index
+        # into the keyword columns or flight mentions found in that token.
+        self._keyword_ids = {"\x00": -2}
+        self._keyword_columns = []
+        self._flight_ids = {"\x00": -2}
+        self._flight_mentions = []
+        self._keyword_table = None
+    
+    def _keyword_id(self, token: str) -> int:
+        columns = [self._column[term] for term in self.matcher.count(token)]
+        if not columns:
+            return -1
+        self._keyword_columns.append(columns)
+        self._keyword_table = None
+        return len(self._keyword_columns) - 1
+    
+    def _flight_id(self, token: str) -> int:
+        mentions = [match for match in entity_extractor.flight_codes(token) if match.upper().startswith('AI')]
+        if not mentions:
+            return -1
+        self._flight_mentions.append(mentions)
+        return len(self._flight_mentions) - 1
+    
+    def _token_ids(self, text: str, memo: Dict[str, int], classify):
+        np = self.np
+        tokens = text.split()
+        for token in set(tokens).difference(memo):
+            memo[token] = classify(token)
+        ids = np.fromiter(map(memo.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+        documents = np.cumsum(ids == -2)
+        found = ids >= 0
+        return documents[found], ids[found]
+    
+    def _joined(self, transcripts: List[str], separator: str) -> str:
+        text = separator.join(transcripts)
+        if text.count("\x00") != len(transcripts) - 1:
+            text = separator.join(transcript.replace("\x00", "\x01") for transcript in transcripts)
+        return text
+    
+    def presence(self, transcripts: List[str]):
+        np = self.np
+        present = np.zeros((len(transcripts), len(self._column)), dtype=bool)
+        documents, ids = self._token_ids(self._joined(transcripts, " \x00 ").lower(), self._keyword_ids, self._keyword_id)
+        if len(ids):
+            if self._keyword_table is None:
+                counts = np.array([len(columns) for columns in self._keyword_columns], dtype=np.int64)
+                flat = np.array([column for columns in self._keyword_columns for column in columns], dtype=np.int64)
+                self._keyword_table = (counts, np.cumsum(counts) - counts, flat)
+            counts, starts, flat = self._keyword_table
+            repeat = counts[ids]
+            offsets = np.arange(repeat.sum()) - np.repeat(np.cumsum(repeat) - repeat, repeat)
+            present[np.repeat(documents, repeat), flat[np.repeat(starts[ids], repeat) + offsets]] = True
+        
+        if self._multiword:
+            lowered = [transcript.lower() for transcript in transcripts]
+            text = self._joined(lowered, "\x00")
+            starts = np.cumsum([0] + [len(transcript) + 1 for transcript in lowered[:-1]])
+            for column, pattern in self._multiword:
+                positions = np.fromiter((match.start() for match in pattern.finditer(text)), dtype=np.int64)
+                if len(positions):
+                    present[np.searchsorted(starts, positions, side="right") - 1, column] = True
+        return present
+    
+    def flights(self, transcripts: List[str]) -> List[List[str]]:
+        flights = [[] for _ in transcripts]
+        documents, ids = self._token_ids(self._joined(transcripts, " \x00 "), self._flight_ids, self._flight_id)
+        for document, flight_id in zip(documents.tolist(), ids.tolist()):
+            flights[document].extend(self._flight_mentions[flight_id])
+        return flights
+    
+    def analyze(self, transcripts: List[str]):
+        # Returns parallel lists of categorization dicts and sentiment scores.
+        np = self.np
+        with self._lock:
+            if len(self._keyword_ids) + len(self._flight_ids) > self.TOKEN_MEMO_LIMIT:
+                self._reset_memo()
+            present = self.presence(transcripts)
+            flights = self.flights(transcripts)
+        weights = present.astype(np.int32)
+        category_hit = (weights @ self._category_weights) > 0
+        last_hit = (len(self.categories) - 1 - np.argmax(category_hit[:, ::-1], axis=1)).tolist()
+        any_hit = category_hit.any(axis=1).tolist()
+        sentiments = (weights @ self._sentiment_weights).tolist()
+        if self._resolution is None:
+            resolved = [False] * len(transcripts)
+        else:
+            resolved = present[:, self._resolution].all(axis=1).tolist()
+        
+        categorizations = []
+        for index, transcript in enumerate(transcripts):
+            category = self.categories[last_hit[index]] if any_hit[index] else "General Inquiry"
+            customer_name = entity_extractor.customer_name(transcript) or "Unknown"
+            flight_numbers = flights[index]
+            categorizations.append({
+                "category": category,
+                "details": {
+                    "flight_numbers": flight_numbers,
+                    "customer_name": customer_name,
+                    "resolution_status": "Resolved" if resolved[index] else "Pending",
+                    "call_summary": f"{category} related to flight(s): {', '.join(flight_numbers) if flight_numbers else 'None specified'}"
+                }
+            })
+        metrics.inc("categorize.rules", len(transcripts))
+        metrics.inc("categorize.batch", len(transcripts))
+        return categorizations, sentiments
+
+_batch_analyzer = None
+
+def get_batch_analyzer() -> Optional[BatchAnalyzer]:
+    global _batch_analyzer
+    if _batch_analyzer is None and KPI_VECTORIZE:
+        np = _get_numpy()
+        if np is not None:
+            _batch_analyzer = BatchAnalyzer(_keyword_matcher, np)
+    return _batch_analyzer if KPI_VECTORIZE else None
+
+def analyze_batch(transcripts: List[str]):
+    # Rule-based (categorization dict, sentiment) lists for a chunk, or None
+    # when the LLM is in use, NumPy is missing or vectorizing is switched off.
+    if len(transcripts) < 2 or _llm_enabled():
+        return None
+    analyzer = get_batch_analyzer()
+    if analyzer is None:
+        return None
+    with metrics.timer("categorize.batch"):
+        return analyzer.analyze(transcripts)
+
+KPI_MAX_WORKERS = int(os.getenv("KPI_MAX_WORKERS", "8"))
+
+def categorize_calls(transcripts: List[str], max_workers: Optional[int] = None,
+                     keyword_hits: Optional[List[Dict[str, int]]] = None, refresh: bool = False) -> List[str]:
+    batch = analyze_batch(transcripts)
+    if batch is not None:
+        return [json.dumps(categorization) for categorization in batch[0]]
+    fn = (lambda transcript, hits: categorize_call(transcript, hits, True)) if refresh else categorize_call
+    return _categorize_batch(fn, transcripts, max_workers, keyword_hits)
+
+def _categorize_batch(fn, transcripts: List[str], max_workers: Optional[int] = None,
+                      keyword_hits: Optional[List[Dict[str, int]]] = None) -> List[Any]:
+    # Results come back in input order. Without the LLM categorization is pure
+    # CPU work, so it stays on the calling thread.
+    if keyword_hits is None:
+        keyword_hits = [None] * len(transcripts)
+    workers = KPI_MAX_WORKERS if max_workers is None else max_workers
+    if workers <= 1 or len(transcripts) <= 1 or not is_together_available():
+        return [fn(transcript, hits) for transcript, hits in zip(transcripts, keyword_hits)]
+    
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(workers, len(transcripts))) as executor:
+        return list(executor.map(fn, transcripts, keyword_hits))
+
+# KPI
+def _merge_counts(left: Dict[str, int], right: Dict[str, int]) -> Dict[str, int]:
+    merged = dict(left)
+    for key, count in right.items():
+        merged[key] = merged.get(key, 0) + count
+    return merged
+
+# KPI sketches
+KPI_SKETCH = os.getenv("KPI_SKETCH", "0") == "1"
+KPI_SKETCH_TOP_ERROR = float(os.getenv("KPI_SKETCH_TOP_ERROR", "0.001"))
+KPI_SKETCH_DISTINCT_ERROR = float(os.getenv("KPI_SKETCH_DISTINCT_ERROR", "0.02"))
+
+class SpaceSaving:
+    # Top-k counter with a fixed number of slots (Metwally et al.). Counts
+    # overestimate by at most total / capacity, and error records the largest
+    # possible overestimate per item. Summaries merge with the same bound.
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.counts = {}
+        self.errors = {}
+        self.total = 0
+        self._heap = []
+    
+    @classmethod
+    def for_error(cls, error: float) -> "SpaceSaving":
+        return cls(math.ceil(1 / error))
+    
+    def add(self, item: str, count: int = 1):
+        self.total += count
+        if item in self.counts:
+            self.counts[item] += count
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+            heapq.heappush(self._heap, (count, item))
+            return
+        # Heap entries go stale when counts grow; refresh them until the
+        # smallest entry is current, then evict it.
+        while True:
+            minimum, evicted = heapq.heappop(self._heap)
+            if self.counts[evicted] == minimum:
+                break
+            heapq.heappush(self._heap, (self.counts[evicted], evicted))
+        del self.counts[evicted]
+        del self.errors[evicted]
+        self.counts[item] = minimum + count
+        self.errors[item] = minimum
+        heapq.heappush(self._heap, (minimum + count, item))
+    
+    def _floor(self) -> int:
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+    
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        # Items missing from a full summary may have had up to its smallest
+        # count, so that is added to both their count and their error.
+        merged = SpaceSaving(max(self.capacity, other.capacity))
+        merged.total = self.total + other.total
+        left, right = self._floor(), other._floor()
+        candidates = []
+        for item in list(self.counts) + [item for item in other.counts if item not in self.counts]:
+            count = self.counts.get(item, left) + other.counts.get(item, right)
+            error = self.errors.get(item, left) + other.errors.get(item, right)
+            candidates.append((count, error, item))
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        for count, error, item in candidates[:merged.capacity]:
+            merged.counts[item] = count
+            merged.errors[item] = error
+        merged._heap = [(count, item) for item, count in merged.counts.items()]
+        heapq.heapify(merged._heap)
+        return merged
+    
+    def top(self, n: int) -> List[tuple]:
+        return sorted(self.counts.items(), key=lambda x: x[1], reverse=True)[:n]
+    
+    def error_bound(self) -> float:
+        return self.total / self.capacity
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "total": self.total,
+            "counts": [[item, count, self.errors[item]] for item, count in self.counts.items()]
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SpaceSaving":
+        sketch = cls(data["capacity"])
+        sketch.total = data["total"]
+        for item, count, error in data["counts"]:
+            sketch.counts[item] = count
+            sketch.errors[item] = error
+        sketch._heap = [(count, item) for item, count in sketch.counts.items()]
+        heapq.heapify(sketch._heap)
+        return sketch
+
+class HyperLogLog:
+    # Distinct-count estimate in 2**precision one-byte registers, with a
+    # relative standard error of about 1.04 / sqrt(2**precision). Merging
+    # takes the register-wise maximum.
+    def __init__(self, precision: int):
+        self.precision = min(16, max(4, precision))
+        self.registers = bytearray(1 << self.precision)
+    
+    @classmethod
+    def for_error(cls, error: float) -> "HyperLogLog":
+        return cls(math.ceil(math.log2((1.04 / error) ** 2)))
+    
+    def add(self, item: str):
+        value = int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "big")
+        index = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+    
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if self.precision != other.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        merged = HyperLogLog(self.precision)
+        merged.registers = bytearray(map(max, self.registers, other.registers))
+        return merged
+    
+    def count(self) -> int:
+        size = len(self.registers)
+        estimate = (0.7213 / (1 + 1.079 / size)) * size * size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+    
+    def error_bound(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {"precision": self.precision, "registers": base64.b64encode(bytes(self.registers)).decode("ascii")}
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HyperLogLog":
+        sketch = cls(data["precision"])
+        sketch.registers = bytearray(base64.b64decode(data["registers"]))
+        return sketch
+
+def kpi_partial_mode() -> str:
+    # Partials built in different modes do not merge; this names the mode.
+    if not KPI_SKETCH:
+        return "exact"
+    return f"sketch-{SpaceSaving.for_error(KPI_SKETCH_TOP_ERROR).capacity}-{HyperLogLog.for_error(KPI_SKETCH_DISTINCT_ERROR).precision}"
+
+class KPIPartial:
+    # Running totals for one pass over a corpus; memory grows with the number
+    # of distinct categories and flights, not with the number of calls.
+    # Partials for consecutive shards merge into exactly the serial result,
+    # including the first-seen order used to break ties.
+    # With sketch=True flight mentions go to a fixed-size Space-Saving
+    # summary, and distinct flights and customers are estimated with
+    # HyperLogLog, so memory stays fixed however noisy the mentions are.
+    def __init__(self, sketch: Optional[bool] = None):
+        self.total_calls = 0
+        self.categories = {}
+        self.resolution_count = 0
+        self.flight_mentions = {}
+        self.sentiment_total = 0
+        self.sketch = KPI_SKETCH if sketch is None else sketch
+        self.flight_sketch = SpaceSaving.for_error(KPI_SKETCH_TOP_ERROR) if self.sketch else None
+        self.distinct_flights = HyperLogLog.for_error(KPI_SKETCH_DISTINCT_ERROR) if self.sketch else None
+        self.distinct_customers = HyperLogLog.for_error(KPI_SKETCH_DISTINCT_ERROR) if self.sketch else None
+    
+    def add(self, categorization: Dict[str, Any], sentiment_score: int):
+        category = categorization.get("category", "Unknown")
+        details = categorization.get("details", {})
+        
+        self.total_calls += 1
+        
+        if category in self.categories:
+            self.categories[category] += 1
+        else:
+            self.categories[category] = 1
+        
+        if details.get("resolution_status") == "Resolved":
+            self.resolution_count += 1
+        
+        if self.sketch:
+            for flight in details.get("flight_numbers", []):
+                self.flight_sketch.add(flight)
+                self.distinct_flights.add(flight)
+            customer_name = details.get("customer_name", "Unknown")
+            if customer_name and customer_name != "Unknown":
+                self.distinct_customers.add(customer_name.strip().lower())
+        else:
+            for flight in details.get("flight_numbers", []):
+                if flight in self.flight_mentions:
+                    self.flight_mentions[flight] += 1
+                else:
+                    self.flight_mentions[flight] = 1
+        
+        self.sentiment_total += sentiment_score
+    
+    def merge(self, other: "KPIPartial") -> "KPIPartial":
+        # An empty partial takes on the other side's mode.
+        if self.sketch != other.sketch:
+            if not self.total_calls:
+                return other.merge(KPIPartial(other.sketch))
+            if not other.total_calls:
+                return self.merge(KPIPartial(self.sketch))
+            raise ValueError("Cannot merge exact and sketched KPI partials")
+        merged = KPIPartial(self.sketch)
+        merged.total_calls = self.total_calls + other.total_calls
+        merged.categories = _merge_counts(self.categories, other.categories)
+        merged.resolution_count = self.resolution_count + other.resolution_count
+        merged.flight_mentions = _merge_counts(self.flight_mentions, other.flight_mentions)
+        merged.sentiment_total = self.sentiment_total + other.sentiment_total
+        if self.sketch:
+            merged.flight_sketch = self.flight_sketch.merge(other.flight_sketch)
+            merged.distinct_flights = self.distinct_flights.merge(other.distinct_flights)
+            merged.distinct_customers = self.distinct_customers.merge(other.distinct_customers)
+        return merged
+    
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "total_calls": self.total_calls,
+            "categories": self.categories,
+            "resolution_count": self.resolution_count,
+            "flight_mentions": self.flight_mentions,
+            "sentiment_total": self.sentiment_total
+        }
+        if self.sketch:
+            data["sketches"] = {
+                "flights": self.flight_sketch.to_dict(),
+                "distinct_flights": self.distinct_flights.to_dict(),
+                "distinct_customers": self.distinct_customers.to_dict()
+            }
+        return data
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "KPIPartial":
+        sketches = data.get("sketches")
+        partial = cls(sketches is not None)
+        partial.total_calls = data["total_calls"]
+        partial.categories = dict(data["categories"])
+        partial.resolution_count = data["resolution_count"]
+        partial.flight_mentions = dict(data["flight_mentions"])
+        partial.sentiment_total = data["sentiment_total"]
+        if sketches is not None:
+            partial.flight_sketch = SpaceSaving.from_dict(sketches["flights"])
+            partial.distinct_flights = HyperLogLog.from_dict(sketches["distinct_flights"])
+            partial.distinct_customers = HyperLogLog.from_dict(sketches["distinct_customers"])
+        return partial
+    
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+    
+    @classmethod
+    def load(cls, path: str) -> "KPIPartial":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+    
+    def result(self) -> Dict[str, Any]:
+        total = self.total_calls
+        
+        avg_response_time = 25  
+        
+        avg_sentiment = self.sentiment_total / total if total else 0
+        
+        resolution_rate = (self.resolution_count / total) * 100 if total else 0
+        
+        most_common_category = max(self.categories.items(), key=lambda x: x[1])[0] if self.categories else "None"
+        
+        if self.sketch:
+            most_mentioned_flights = self.flight_sketch.top(3)
+        else:
+            most_mentioned_flights = sorted(self.flight_mentions.items(), key=lambda x: x[1], reverse=True)[:3] if self.flight_mentions else []
+        
+        result = {
+            "total_calls": total,
+            "call_categories": self.categories,
+            "resolution_rate": resolution_rate,
+            "average_response_time": avg_response_time,
+            "average_sentiment": avg_sentiment,
+            "most_common_issue": most_common_category,
+            "most_mentioned_flights": dict(most_mentioned_flights),
+            "category_distribution": {category: (count / total) * 100 for category, count in self.categories.items()}
+        }
+        if self.sketch:
+            # Flight counts may overestimate by up to flight_count_error;
+            # distinct counts are within distinct_error (one standard error).
+            result["distinct_flights"] = self.distinct_flights.count()
+            result["distinct_customers"] = self.distinct_customers.count()
+            result["sketch"] = {
+                "flight_count_error": self.flight_sketch.error_bound(),
+                "distinct_error": self.distinct_flights.error_bound()
+            }
+        return result
+
+KPI_CHUNK_SIZE = int(os.getenv("KPI_CHUNK_SIZE", "256"))
+TRANSCRIPT_TEXT_FIELDS = ("transcript", "text", "body")
+TRANSCRIPT_DATE_FIELDS = ("date", "timestamp", "call_date", "started_at")
+
+def _peek(raw, size: int = 4) -> bytes:
+    if not raw.seekable():
+        return b""
+    position = raw.tell()
+    magic = raw.read(size)
+    raw.seek(position)
+    return magic
+
+def _iter_stream(raw, name: str, text_field: Optional[str], delimiter: str,
+                 date_fields: Optional[tuple] = None, stats: Optional[Dict[str, int]] = None) -> Iterator[Any]:
+    # raw is a binary stream read front to back; name only picks the format.
+    # With date_fields, (transcript, date) pairs are yielded instead, the date
+    # taken from the first of those JSONL fields or CSV columns present (None
+    # when there is none, as always for plain text). Malformed JSONL records
+    # are skipped and counted in stats["skipped"].
+    def emit(text: str, date: Any = None):
+        return text if date_fields is None else (text, date)
+    
+    def skip(number: int, reason: str):
+        print(f"Error parsing transcript record {number} in {name}: {reason}")
+        metrics.inc("transcripts.skipped")
+        if stats is not None:
+            stats["skipped"] = stats.get("skipped", 0) + 1
+    
+    name = name.lower()
+    magic = _peek(raw)
+    if magic.startswith(b"PK\x03\x04") or (not magic and name.endswith(".zip")):
+        import zipfile
+        with zipfile.ZipFile(raw) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and not info.filename.startswith("__MACOSX/"):
+                    with archive.open(info) as member:
+                        yield from _iter_stream(member, info.filename, text_field, delimiter, date_fields, stats)
+        return
+    if magic.startswith(b"\x1f\x8b") or (not magic and name.endswith(".gz")):
+        import gzip
+        raw = gzip.GzipFile(fileobj=raw)
+    if name.endswith(".gz"):
+        name = name[:-3]
+    
+    csv_format = name.endswith(".csv")
+    f = io.TextIOWrapper(raw, encoding="utf-8-sig" if csv_format else "utf-8", newline="" if csv_format else None)
+    try:
+        if name.endswith((".jsonl", ".ndjson")):
+            fields = (text_field,) if text_field else TRANSCRIPT_TEXT_FIELDS
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    skip(number, str(e))
+                    continue
+                if isinstance(record, str):
+                    yield emit(record)
+                    continue
+                if not isinstance(record, dict):
+                    skip(number, "not a JSON object or string")
+                    continue
+                for field in fields:
+                    if isinstance(record.get(field), str):
+                        date = next((record[key] for key in date_fields or () if record.get(key) not in (None, "")), None)
+                        yield emit(record[field], date)
+                        break
+                else:
+                    skip(number, f"no {' or '.join(fields)} field")
+        elif csv_format:
+            # The transcript column is found by header name; without a
+            # matching header the first column is used and the first row is
+            # data.
+            import csv
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                return
+            fields = (text_field,) if text_field else TRANSCRIPT_TEXT_FIELDS
+            names = [column.strip().lower() for column in header]
+            column = next((names.index(field.lower()) for field in fields if field.lower() in names), None)
+            date_column = next((names.index(field.lower()) for field in date_fields or () if field.lower() in names), None)
+            if column is None:
+                if text_field:
+                    raise ValueError(f"CSV has no {text_field} column")
+                column, date_column = 0, None
+                reader = chain([header], reader)
+            for row in reader:
+                if len(row) > column and row[column].strip():
+                    date = row[date_column].strip() or None if date_column is not None and len(row) > date_column else None
+                    yield emit(row[column], date)
+        else:
+            lines = []
+            for line in f:
+                if line.strip() == delimiter:
+                    if "".join(lines).strip():
+                        yield emit("".join(lines))
+                    lines = []
+                else:
+                    lines.append(line)
+            if "".join(lines).strip():
+                yield emit("".join(lines))
+    finally:
+        # Leave the caller's stream open
+        if not f.closed:
+            f.detach()
+
+def iter_transcripts(source: Union[str, Any, Iterable[str]], text_field: Optional[str] = None,
+                     delimiter: str = "---", name: Optional[str] = None,
+                     stats: Optional[Dict[str, int]] = None) -> Iterator[str]:
+    # A string is a file path and a binary file object (such as an upload) is
+    # read the same way, with name (or the object's .name) picking the format:
+    # JSONL (.jsonl/.ndjson), CSV (.csv), or plain text with transcripts
+    # separated by delimiter lines, each optionally gzip-compressed, or a ZIP
+    # archive of such files. Files are parsed as they are read, never loaded
+    # whole. Anything else is treated as an iterable of transcripts. Malformed
+    # JSONL records are skipped and, when stats is given, counted in
+    # stats["skipped"].
+    if isinstance(source, str):
+        with open(source, "rb") as raw:
+            yield from _iter_stream(raw, name or source, text_field, delimiter, stats=stats)
+        return
+    if hasattr(source, "read"):
+        yield from _iter_stream(source, name or getattr(source, "name", ""), text_field, delimiter, stats=stats)
+        return
+    yield from source
+
+def iter_transcript_records(source: Union[str, Any, Iterable[Any]], text_field: Optional[str] = None,
+                            delimiter: str = "---", name: Optional[str] = None,
+                            date_field: Optional[str] = None) -> Iterator[tuple]:
+    # Like iter_transcripts, but yields (transcript, date) pairs. The date
+    # comes from date_field, or the first of TRANSCRIPT_DATE_FIELDS present in
+    # a JSONL record or CSV header, and is None when there is none. Iterables
+    # may hold transcripts or (transcript, date) pairs.
+    date_fields = (date_field,) if date_field else TRANSCRIPT_DATE_FIELDS
+    if isinstance(source, str):
+        with open(source, "rb") as raw:
+            yield from _iter_stream(raw, name or source, text_field, delimiter, date_fields)
+        return
+    if hasattr(source, "read"):
+        yield from _iter_stream(source, name or getattr(source, "name", ""), text_field, delimiter, date_fields)
+        return
+    for item in source:
+        yield (item, None) if isinstance(item, str) else tuple(item)
+
+def _iter_categorized(transcripts: Iterable[str], max_workers: Optional[int] = None,
+                      chunk_size: int = KPI_CHUNK_SIZE, refresh: bool = False) -> Iterator[Any]:
+    iterator = iter(transcripts)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        batch = analyze_batch(chunk)
+        if batch is not None:
+            yield from zip(*batch)
+            continue
+        keyword_hits = [match_keywords(transcript) for transcript in chunk]
+        categorizations = categorize_calls(chunk, max_workers, keyword_hits, refresh)
+        for hits, categorization_json in zip(keyword_hits, categorizations):
+            yield json.loads(categorization_json), score_sentiment(hits)
+
+def compute_kpi_partial(source: Union[str, Iterable[str]], max_workers: Optional[int] = None,
+                        text_field: Optional[str] = None, delimiter: str = "---", refresh: bool = False) -> KPIPartial:
+    partial = KPIPartial()
+    transcripts = iter_transcripts(source, text_field, delimiter)
+    for categorization, sentiment_score in _iter_categorized(transcripts, max_workers, refresh=refresh):
+        partial.add(categorization, sentiment_score)
+    metrics.inc("kpi.calls", partial.total_calls)
+    return partial
+
+def _kpi_result_json(partial: KPIPartial) -> str:
+    if not partial.total_calls:
+        return json.dumps({"error": "No transcripts provided"})
+    return json.dumps(partial.result())
+
+@metrics.timed("kpi.total")
+def compute_call_center_kpis_stream(source: Union[str, Iterable[str]], max_workers: Optional[int] = None,
+                                    text_field: Optional[str] = None, delimiter: str = "---",
+                                    refresh: bool = False) -> str:
+    try:
+        return _kpi_result_json(compute_kpi_partial(source, max_workers, text_field, delimiter, refresh))
+    except Exception as e:
+        return json.dumps({"error": f"Error computing KPIs: {str(e)}"})
+
+KPI_SHARD_SIZE = int(os.getenv("KPI_SHARD_SIZE", "2000"))
+
+def _kpi_partial_for_shard(shard: List[str]) -> Dict[str, Any]:
+    return compute_kpi_partial(shard).to_dict()
+
+def _kpi_partial_for_path(path: str) -> Dict[str, Any]:
+    if path.endswith(".kpi.json"):
+        return KPIPartial.load(path).to_dict()
+    if path.endswith(".kpiarc"):
+        with CallArchive(path) as archive:
+            return archive.kpis().to_dict()
+    return compute_kpi_partial(path).to_dict()
+
+def _reduce_in_order(executor, tasks: Iterable[Any], fn, max_pending: int) -> KPIPartial:
+    # Keeps at most max_pending shards in flight and merges them in submission
+    # order, so the result matches a serial pass.
+    total = KPIPartial()
+    pending = []
+    for task in tasks:
+        pending.append(executor.submit(fn, task))
+        if len(pending) >= max_pending:
+            total = total.merge(KPIPartial.from_dict(pending.pop(0).result()))
+    for future in pending:
+        total = total.merge(KPIPartial.from_dict(future.result()))
+    return total
+
+def _shards(transcripts: Iterable[str], shard_size: int) -> Iterator[List[str]]:
+    iterator = iter(transcripts)
+    while True:
+        shard = list(islice(iterator, shard_size))
+        if not shard:
+            return
+        yield shard
+
+def compute_call_center_kpis_parallel(source: Union[str, Iterable[str]], processes: Optional[int] = None,
+                                      shard_size: int = KPI_SHARD_SIZE, text_field: Optional[str] = None,
+                                      delimiter: str = "---") -> str:
+    try:
+        from concurrent.futures import ProcessPoolExecutor
+        processes = processes or os.cpu_count() or 1
+        shards = _shards(iter_transcripts(source, text_field, delimiter), shard_size)
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            partial = _reduce_in_order(executor, shards, _kpi_partial_for_shard, processes * 2)
+        return _kpi_result_json(partial)
+    except Exception as e:
+        return json.dumps({"error": f"Error computing KPIs: {str(e)}"})
+
+def compute_call_center_kpis_files(paths: List[str], processes: Optional[int] = None) -> str:
+    # One file per task. Paths ending in .kpi.json are partials saved with
+    # KPIPartial.save (for example by other machines) and are merged as-is;
+    # .kpiarc call archives are scanned without re-analyzing their text.
+    try:
+        from concurrent.futures import ProcessPoolExecutor
+        processes = processes or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            partial = _reduce_in_order(executor, paths, _kpi_partial_for_path, processes * 2)
+        return _kpi_result_json(partial)
+    except Exception as e:
+        return json.dumps({"error": f"Error computing KPIs: {str(e)}"})
+
+# Incremental KPIs
+KPI_STORE_ENABLED = os.getenv("KPI_STORE_ENABLED", "1") != "0"
+KPI_STORE_PATH = os.getenv("KPI_STORE_PATH", ".kpi_store.sqlite3")
+KPI_STORE_ENTRIES = int(os.getenv("KPI_STORE_ENTRIES", "200000"))
+KPI_VIEW_LIMIT = int(os.getenv("KPI_VIEW_LIMIT", "8"))
+
+# Bump when the rule-based analysis changes in ways the keyword tables below
+# do not capture, so stored results are recomputed.
+ANALYZER_REVISION = 1
+
+def analyzer_version(source: str = "rules") -> str:
+    # Identifies what produced a stored analysis. Sentiment always comes from
+    # the keyword rules; LLM categorizations also depend on the model and on
+    # how the prompt is built.
+    config = [ANALYZER_REVISION, CALL_CATEGORIES, POSITIVE_WORDS, NEGATIVE_WORDS, RESOLUTION_PHRASES]
+    if source == "llm":
+        config += [TOGETHER_MODEL, CATEGORIZE_COMPRESS, CATEGORIZE_TOKEN_BUDGET]
+    return f"{source}-" + hashlib.blake2b(json.dumps(config).encode("utf-8"), digest_size=8).hexdigest()
+
+def transcript_hash(transcript: str) -> str:
+    return hashlib.blake2b(transcript.encode("utf-8"), digest_size=16).hexdigest()
+
+class KPIResultStore:
+    # Per-call analysis keyed by (content hash, analyzer version), so a
+    # transcript is only analyzed again when its text or the analyzer changes.
+    # Alongside are a few materialized KPI partials for whole corpora, keyed
+    # by call count and a rolling digest of the call hashes, so a corpus that
+    # only grew since the last run starts from the partial for its old prefix.
+    # At most max_entries call results are kept; the least recently used go
+    # first, which also clears out results from retired analyzer versions.
+    def __init__(self, path: str = KPI_STORE_PATH, view_limit: int = KPI_VIEW_LIMIT,
+                 max_entries: int = KPI_STORE_ENTRIES):
+        self.path = path or ":memory:"
+        self.view_limit = view_limit
+        self.max_entries = max_entries
+        self._conn = None
+        self._lock = threading.Lock()
+        self._writes_since_trim = 0
+    
+    def _db(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS call_analysis ("
+                "content_hash TEXT NOT NULL, analyzer TEXT NOT NULL, categorization TEXT NOT NULL, "
+                "sentiment INTEGER NOT NULL, accessed_at REAL NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (content_hash, analyzer)) WITHOUT ROWID"
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(call_analysis)")]
+            if "accessed_at" not in columns:
+                conn.execute("ALTER TABLE call_analysis ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS call_analysis_accessed_at ON call_analysis (accessed_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kpi_views ("
+                "analyzer TEXT NOT NULL, calls INTEGER NOT NULL, digest TEXT NOT NULL, "
+                "partial TEXT NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (analyzer, calls, digest))"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+    
+    def get_many(self, content_hashes: List[str], analyzer: str) -> Dict[str, Any]:
+        found = {}
+        with self._lock:
+            conn = self._db()
+            unique = list(OrderedDict.fromkeys(content_hashes))
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                rows = conn.execute(
+                    "SELECT content_hash, categorization, sentiment FROM call_analysis "
+                    f"WHERE analyzer = ? AND content_hash IN ({','.join('?' * len(batch))})",
+                    [analyzer] + batch
+                ).fetchall()
+                for content_hash, categorization, sentiment in rows:
+                    found[content_hash] = (json.loads(categorization), sentiment)
+                if rows:
+                    hits = [row[0] for row in rows]
+                    conn.execute(
+                        f"UPDATE call_analysis SET accessed_at = ? WHERE analyzer = ? AND content_hash IN ({','.join('?' * len(hits))})",
+                        [time.time(), analyzer] + hits
+                    )
+            conn.commit()
+        return found
+    
+    def put_many(self, rows: List[Any]):
+        # rows are (content_hash, analyzer, categorization_json, sentiment)
+        if not rows:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            conn.executemany(
+                "INSERT OR REPLACE INTO call_analysis (content_hash, analyzer, categorization, sentiment, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [tuple(row) + (now,) for row in rows]
+            )
+            self._writes_since_trim += len(rows)
+            if self._writes_since_trim >= 1000:
+                self._trim(conn)
+            conn.commit()
+    
+    def _trim(self, conn):
+        self._writes_since_trim = 0
+        excess = conn.execute("SELECT COUNT(*) FROM call_analysis").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM call_analysis WHERE (content_hash, analyzer) IN "
+                "(SELECT content_hash, analyzer FROM call_analysis ORDER BY accessed_at LIMIT ?)",
+                (excess,)
+            )
+            metrics.inc("kpi.store_evictions", excess)
+    
+    def get_views(self, analyzer: str) -> List[Any]:
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT calls, digest, partial FROM kpi_views WHERE analyzer = ?", (analyzer,)
+            ).fetchall()
+        return [(calls, digest, json.loads(partial)) for calls, digest, partial in rows]
+    
+    def put_view(self, analyzer: str, calls: int, digest: str, partial: KPIPartial):
+        with self._lock:
+            conn = self._db()
+            conn.execute(
+                "INSERT OR REPLACE INTO kpi_views (analyzer, calls, digest, partial, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (analyzer, calls, digest, json.dumps(partial.to_dict()), time.time())
+            )
+            conn.execute(
+                "DELETE FROM kpi_views WHERE analyzer = ? AND rowid NOT IN "
+                "(SELECT rowid FROM kpi_views WHERE analyzer = ? ORDER BY updated_at DESC LIMIT ?)",
+                (analyzer, analyzer, self.view_limit)
+            )
+            conn.commit()
+    
+    def clear(self):
+        with self._lock:
+            conn = self._db()
+            conn.execute("DELETE FROM call_analysis")
+            conn.execute("DELETE FROM kpi_views")
+            conn.commit()
+
+_kpi_store = None
+_kpi_store_lock = threading.Lock()
+
+def get_kpi_store() -> KPIResultStore:
+    global _kpi_store
+    if _kpi_store is None:
+        with _kpi_store_lock:
+            if _kpi_store is None:
+                _kpi_store = KPIResultStore()
+    return _kpi_store
 
-def invoke_together_model(prompt: str, model: str = "mistralai/Mixtral-8x7B-Instruct-v0.1") :
-    if not together_api_key:
-        raise EnvironmentError("Together AI API key not configured")
+def compute_kpi_partial_incremental(transcripts: List[str], max_workers: Optional[int] = None,
+                                    store: Optional[KPIResultStore] = None, refresh: bool = False) -> KPIPartial:
+    # Starts from the longest stored view whose calls are a prefix of
+    # transcripts, then adds the remaining calls in order, analyzing only those
+    # without a stored result for the current analyzer. The result equals a
+    # full serial pass. A new view is saved only when every call was
+    # analyzed by the current analyzer, so LLM fallbacks get retried later.
+    # refresh ignores stored views and results (and cached LLM responses),
+    # analyzes every call again and overwrites what was stored.
+    store = store or get_kpi_store()
+    version = analyzer_version("llm" if _llm_enabled() else "rules")
+    hashes = [transcript_hash(transcript) for transcript in transcripts]
     
-    response = together.Complete.create(
-        prompt=prompt,
-        model=model,
-        max_tokens=500,
-        temperature=0.1, 
-        top_p=0.9
-    )
+    view_key = version if not KPI_SKETCH else f"{version}/{kpi_partial_mode()}"
+    views = {calls: (digest, data) for calls, digest, data in store.get_views(view_key)
+             if calls <= len(hashes) and not refresh}
+    rolling = hashlib.blake2b(digest_size=16)
+    partial, start = KPIPartial(), 0
+    for position, content_hash in enumerate(hashes, 1):
+        rolling.update(content_hash.encode("ascii"))
+        view = views.get(position)
+        if view is not None and view[0] == rolling.hexdigest():
+            partial, start = KPIPartial.from_dict(view[1]), position
+    metrics.inc("kpi.view_calls", start)
     
-    return response
-
-# Info Agent 
-def get_flight_info(flight_number: str):
-    flight_number = flight_number.upper()
+    current = True
+    for offset in range(start, len(transcripts), KPI_CHUNK_SIZE):
+        chunk = transcripts[offset:offset + KPI_CHUNK_SIZE]
+        chunk_hashes = hashes[offset:offset + KPI_CHUNK_SIZE]
+        stored = store.get_many(chunk_hashes, version) if not refresh else {}
+        missing = [index for index, content_hash in enumerate(chunk_hashes) if content_hash not in stored]
+        if missing:
+            batch = analyze_batch([chunk[index] for index in missing])
+            if batch is not None:
+                sentiments = batch[1]
+                analyzed = [(json.dumps(categorization), "rules") for categorization in batch[0]]
+            else:
+                keyword_hits = [match_keywords(chunk[index]) for index in missing]
+                sentiments = [score_sentiment(hits) for hits in keyword_hits]
+                fn = (lambda transcript, hits: _categorize_with_source(transcript, hits, True)) if refresh \
+                    else _categorize_with_source
+                analyzed = _categorize_batch(fn, [chunk[index] for index in missing], max_workers, keyword_hits)
+            rows = []
+            for index, sentiment_score, (categorization_json, source) in zip(missing, sentiments, analyzed):
+                stored[chunk_hashes[index]] = (json.loads(categorization_json), sentiment_score)
+                if source == "error" or analyzer_version(source) != version:
+                    current = False
+                if source != "error":
+                    rows.append((chunk_hashes[index], analyzer_version(source), categorization_json, sentiment_score))
+            store.put_many(rows)
+        metrics.inc("kpi.stored_calls", len(chunk) - len(missing))
+        metrics.inc("kpi.analyzed_calls", len(missing))
+        for content_hash in chunk_hashes:
+            categorization, sentiment_score = stored[content_hash]
+            partial.add(categorization, sentiment_score)
     
-    if flight_number in FLIGHT_DATABASE:
-        return FLIGHT_DATABASE[flight_number]
-    return {}
+    if current and len(hashes) > start:
+        store.put_view(view_key, len(hashes), rolling.hexdigest(), partial)
+    metrics.inc("kpi.calls", partial.total_calls)
+    return partial
 
-def info_agent_request(flight_number: str)  :
+@metrics.timed("kpi.total")
+def compute_call_center_kpis_incremental(transcripts: List[str], max_workers: Optional[int] = None,
+                                         store: Optional[KPIResultStore] = None, refresh: bool = False) -> str:
     try:
-        result = get_flight_info(flight_number)
-        
-        if not result:
-            return json.dumps({"error": f"Flight {flight_number} not found in database."})
-        
-        return json.dumps(result)
-            
+        return _kpi_result_json(compute_kpi_partial_incremental(list(transcripts), max_workers, store, refresh))
     except Exception as e:
-        return json.dumps({"error": f"Error processing request: {str(e)}"})
+        return json.dumps({"error": f"Error computing KPIs: {str(e)}"})
 
-# QA Agent 
-def extract_flight_number(query: str)  :
-    patterns = [
-        r'flight\s+([A-Za-z]{1,3}\d{1,4})', 
-        r'([A-Za-z]{1,3}\d{1,4})\s+flight',  
-        r'flight\s+number\s+([A-Za-z]{1,3}\d{1,4})',
-        r'([A-Za-z]{1,3}\d{1,4})'  
-    ]
-    
-    for pattern in patterns:
-        matches = re.search(pattern, query, re.IGNORECASE)
-        if matches:
-            return matches.group(1)
+def compute_call_center_kpis(transcripts: List[str], max_workers: Optional[int] = None, refresh: bool = False)  :
+    if not transcripts:
+        return json.dumps({"error": "No transcripts provided"})
     
-    if is_together_available():
+    if KPI_STORE_ENABLED:
+        return compute_call_center_kpis_incremental(transcripts, max_workers, refresh=refresh)
+    return compute_call_center_kpis_stream(transcripts, max_workers, refresh=refresh)
+
+
+# KPI jobs
+KPI_JOB_POLL_INTERVAL = float(os.getenv("KPI_JOB_POLL_INTERVAL", "1.0"))
+
+class KPIJob:
+    # Computes KPIs for a transcript file on a background thread so the page
+    # can keep rendering. progress is the share of the file read so far and
+    # result holds KPIs over the calls analyzed so far, as JSON, refreshed
+    # after every chunk; skipped counts malformed records left out. cancel()
+    # stops the job after the call in progress.
+    def __init__(self, path: str, name: Optional[str] = None, text_field: Optional[str] = None,
+                 delimiter: str = "---", max_workers: Optional[int] = None, remove_file: bool = False):
+        self.path = path
+        self.name = name or path
+        self.text_field = text_field
+        self.delimiter = delimiter
+        self.max_workers = max_workers
+        self.remove_file = remove_file
+        self.status = "pending"
+        self.calls = 0
+        self.skipped = 0
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._cancelled = threading.Event()
+        self._thread = None
+        self._stats = {}
+    
+    @property
+    def running(self) -> bool:
+        return self.status in ("pending", "running")
+    
+    def start(self) -> "KPIJob":
+        self._thread = threading.Thread(target=self._run, name="kpi-job", daemon=True)
+        self._thread.start()
+        return self
+    
+    def cancel(self):
+        self._cancelled.set()
+    
+    def join(self, timeout: Optional[float] = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+    
+    def _publish(self, partial: KPIPartial, progress: float):
+        self.calls = partial.total_calls
+        self.skipped = self._stats.get("skipped", 0)
+        self.progress = min(1.0, progress)
+        if partial.total_calls:
+            self.result = json.dumps(partial.result())
+    
+    def _run(self):
+        self.status, self.started_at = "running", time.time()
+        metrics.inc("kpi.jobs")
+        partial = KPIPartial()
         try:
-            prompt = f"""
-            Extract the flight number from the following user query. 
-            Respond with ONLY the flight number, or 'NONE' if no flight number is found.
-            
-            User query: {query}
-            
-            Flight number:
-            """
-            
-            response = invoke_together_model(prompt)
-            extracted = response['output']['choices'][0]['text'].strip()
-            
-            if re.match(r'^[A-Za-z]{1,3}\d{1,4}$', extracted):
-                return extracted
-            elif extracted != "NONE":
-                for pattern in patterns:
-                    matches = re.search(pattern, extracted, re.IGNORECASE)
-                    if matches:
-                        return matches.group(1)
+            size = os.path.getsize(self.path) or 1
+            with metrics.timer("kpi.job"), open(self.path, "rb") as raw:
+                transcripts = iter_transcripts(raw, self.text_field, self.delimiter, self.name, self._stats)
+                categorized = _iter_categorized(transcripts, self.max_workers)
+                try:
+                    for categorization, sentiment_score in categorized:
+                        partial.add(categorization, sentiment_score)
+                        if self._cancelled.is_set():
+                            break
+                        if partial.total_calls % KPI_CHUNK_SIZE == 0:
+                            self._publish(partial, raw.tell() / size)
+                finally:
+                    categorized.close()
+                    transcripts.close()
+            if self._cancelled.is_set():
+                self._publish(partial, self.progress)
+                self.status = "cancelled"
+                metrics.inc("kpi.jobs_cancelled")
+            else:
+                self._publish(partial, 1.0)
+                self.status = "done"
+            metrics.inc("kpi.calls", partial.total_calls)
         except Exception as e:
-            print(f"Error using Together AI for extraction: {str(e)}")
-            pass  
+            print(f"Error computing KPIs: {str(e)}")
+            self._publish(partial, self.progress)
+            self.error = f"Error computing KPIs: {str(e)}"
+            self.status = "error"
+        finally:
+            self.finished_at = time.time()
+            if self.remove_file:
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    pass
     
-    return ""
+    def snapshot(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            "status": self.status,
+            "calls": self.calls,
+            "skipped": self.skipped,
+            "progress": self.progress,
+            "elapsed_seconds": end - self.started_at if self.started_at else 0.0,
+            "error": self.error,
+            "kpis": json.loads(self.result) if self.result else None
+        }
 
-def qa_agent_respond(user_query: str)  :
-    try:
-        flight_number = extract_flight_number(user_query)
-        
-        if not flight_number:
-            return json.dumps({
-                "answer": "I couldn't identify a flight number in your query. Please specify a flight number like 'AI123'."
-            })
-        
-        info_response = info_agent_request(flight_number)
-        flight_data = json.loads(info_response)
-        
-        if "error" in flight_data:
-            return json.dumps({
-                "answer": f"Flight {flight_number} not found in database."
-            })
-        
-        if is_together_available():
-            try:
-                prompt = f"""
-                Generate a concise answer to the user's query about a flight based on the flight data provided.
-                The response should be factual and address the specific question asked.
-                
-                User query: {user_query}
-                
-                Flight data: {json.dumps(flight_data)}
-                
-                Answer:
-                """
-                
-                response = invoke_together_model(prompt)
-                answer = response['output']['choices'][0]['text'].strip()
-                
-                if answer and len(answer) <= 200:
-                    return json.dumps({
-                        "answer": answer
-                    })
-            except Exception as e:
-                print(f"Error using Together AI for response generation: {str(e)}")
-        
-        if re.search(r'depart|departure|leave|time', user_query, re.IGNORECASE):
-            answer = f"Flight {flight_data['flight_number']} departs at {flight_data['departure_time']} to {flight_data['destination']}. Current status: {flight_data['status']}."
-        elif re.search(r'destination|arrive|goes to|going to', user_query, re.IGNORECASE):
-            answer = f"Flight {flight_data['flight_number']} is headed to {flight_data['destination']}. It departs at {flight_data['departure_time']}. Current status: {flight_data['status']}."
-        elif re.search(r'status|delayed|on time|cancelled', user_query, re.IGNORECASE):
-            answer = f"Flight {flight_data['flight_number']} status: {flight_data['status']}. It's scheduled to depart at {flight_data['departure_time']} to {flight_data['destination']}."
-        elif re.search(r'terminal|gate', user_query, re.IGNORECASE):
-            answer = f"Flight {flight_data['flight_number']} departs from Terminal {flight_data['terminal']}, Gate {flight_data['gate']}. Current status: {flight_data['status']}."
+def start_kpi_job(upload, text_field: Optional[str] = None, delimiter: str = "---") -> KPIJob:
+    # Spools an uploaded file to disk in blocks, so the job does not depend on
+    # the upload object staying around between reruns.
+    import shutil
+    import tempfile
+    upload.seek(0)
+    with tempfile.NamedTemporaryFile(prefix="kpi-upload-", delete=False) as spool:
+        shutil.copyfileobj(upload, spool, 1024 * 1024)
+    return KPIJob(spool.name, getattr(upload, "name", None), text_field, delimiter, remove_file=True).start()
+
+# Call archive
+CALL_ARCHIVE_MAGIC = b"AKPIARC1"
+CALL_ARCHIVE_DICTIONARIES = ("category", "status", "customer", "flight")
+# Column name -> array typecode
+CALL_ARCHIVE_COLUMNS = {
+    "category": "I", "status": "I", "customer": "I", "sentiment": "i", "resolved": "B", "date": "i",
+    "flight_offsets": "Q", "flights": "I", "text_offsets": "Q"
+}
+
+def _date_ordinal(value: Any) -> int:
+    # datetime.date/datetime, an ISO "YYYY-MM-DD..." string or Unix seconds
+    # -> proleptic ordinal (UTC); 0 means unknown.
+    if value is None or value == "":
+        return 0
+    if hasattr(value, "toordinal"):
+        return value.toordinal()
+    import datetime
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.datetime.fromtimestamp(value, datetime.timezone.utc).toordinal()
+    return datetime.date.fromisoformat(str(value).strip()[:10]).toordinal()
+
+class CallArchiveWriter:
+    # Writes analyzed calls to a compact columnar file. Transcript text is
+    # streamed to disk as calls are added. The columns are held as typed
+    # arrays and written on close, followed by a JSON footer with the
+    # dictionaries and the offset of every column. The file only appears
+    # under its final name once complete.
+    def __init__(self, path: str):
+        from array import array
+        self.path = path
+        self._file = open(path + ".tmp", "wb")
+        self._codes = {kind: {} for kind in CALL_ARCHIVE_DICTIONARIES}
+        self._columns = {name: array(typecode) for name, typecode in CALL_ARCHIVE_COLUMNS.items()}
+        self._columns["flight_offsets"].append(0)
+        self._columns["text_offsets"].append(0)
+        self._text_bytes = 0
+        self.calls = 0
+    
+    def _code(self, kind: str, value: str) -> int:
+        codes = self._codes[kind]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+        return code
+    
+    def add(self, transcript: str, categorization: Dict[str, Any], sentiment_score: int, date: Any = None):
+        details = categorization.get("details", {})
+        status = details.get("resolution_status", "Unknown")
+        columns = self._columns
+        columns["category"].append(self._code("category", categorization.get("category", "Unknown")))
+        columns["status"].append(self._code("status", status))
+        columns["customer"].append(self._code("customer", details.get("customer_name", "Unknown")))
+        columns["sentiment"].append(sentiment_score)
+        columns["resolved"].append(1 if status == "Resolved" else 0)
+        try:
+            ordinal = _date_ordinal(date)
+        except (TypeError, ValueError, OverflowError, OSError):
+            metrics.inc("archive.bad_date")
+            ordinal = 0
+        columns["date"].append(ordinal)
+        for flight in details.get("flight_numbers", []):
+            columns["flights"].append(self._code("flight", flight))
+        columns["flight_offsets"].append(len(columns["flights"]))
+        data = transcript.encode("utf-8")
+        self._file.write(data)
+        self._text_bytes += len(data)
+        columns["text_offsets"].append(self._text_bytes)
+        self.calls += 1
+    
+    def close(self):
+        layout = {}
+        for name, column in self._columns.items():
+            self._file.write(b"\0" * (-self._file.tell() % 8))
+            if sys.byteorder == "big":
+                column = column.__copy__()
+                column.byteswap()
+            layout[name] = {"offset": self._file.tell(), "count": len(column), "type": column.typecode}
+            self._file.write(column.tobytes())
+        footer = json.dumps({
+            "version": 1,
+            "byteorder": "little",
+            "calls": self.calls,
+            "dictionaries": {kind: list(codes) for kind, codes in self._codes.items()},
+            "columns": layout
+        }).encode("utf-8")
+        self._file.write(footer)
+        self._file.write(struct.pack("<Q", len(footer)) + CALL_ARCHIVE_MAGIC)
+        self._file.close()
+        os.replace(self.path + ".tmp", self.path)
+    
+    def __enter__(self) -> "CallArchiveWriter":
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
         else:
-            answer = f"Flight {flight_data['flight_number']} to {flight_data['destination']} departs at {flight_data['departure_time']} from Terminal {flight_data['terminal']}, Gate {flight_data['gate']}. Current status: {flight_data['status']}."
-        
-        return json.dumps({
-            "answer": answer
-        })
-            
-    except Exception as e:
-        return json.dumps({"answer": f"Error processing request: {str(e)}"})
+            self._file.close()
+            os.remove(self.path + ".tmp")
 
-# Call categorization 
-def categorize_call(transcript: str)  :
-    try:
-        categories = {
-            "Flight Booking": ["book", "reserve", "purchase", "buy", "schedule"],
-            "Flight Cancellation": ["cancel", "refund", "money back"],
-            "Flight Rescheduling": ["reschedule", "change", "move", "different date"],
-            "Baggage Issue": ["baggage", "luggage", "bag", "suitcase", "missing", "lost"],
-            "Complaint": ["complaint", "unhappy", "disappointed", "poor", "terrible", "bad experience"],
-            "Seat Change": ["seat", "change seat", "different seat", "window", "aisle"],
-            "General Inquiry": ["status", "check", "information", "time", "when"]
+class CallArchive:
+    # Read-only view of a call archive. The file is memory-mapped and every
+    # column is a memoryview cast over the mapping, so nothing is copied or
+    # decoded until it is used. Columns are stored little-endian; on a
+    # big-endian host each one is byteswapped into a native copy instead.
+    # KPI queries are column scans: vectorized over zero-copy NumPy arrays
+    # when NumPy is installed, plain loops otherwise. Results match a
+    # KPIPartial built from the same calls in order.
+    def __init__(self, path: str):
+        import mmap
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is not a call archive")
+        size = len(self._map)
+        if size < 16 or self._map[size - 8:] != CALL_ARCHIVE_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a call archive")
+        footer_length = struct.unpack("<Q", self._map[size - 16:size - 8])[0]
+        footer = json.loads(self._map[size - 16 - footer_length:size - 16].decode("utf-8"))
+        self.calls = footer["calls"]
+        self.dictionaries = footer["dictionaries"]
+        self._view = memoryview(self._map)
+        self.columns = {}
+        swap = footer.get("byteorder", "little") != sys.byteorder
+        for name, spec in footer["columns"].items():
+            itemsize = struct.calcsize("<" + spec["type"])
+            column = self._view[spec["offset"]:spec["offset"] + spec["count"] * itemsize]
+            if swap:
+                from array import array
+                native = array(spec["type"], bytes(column))
+                native.byteswap()
+                column.release()
+                self.columns[name] = memoryview(native)
+            else:
+                self.columns[name] = column.cast(spec["type"])
+        self._arrays = {}
+    
+    def close(self):
+        self._arrays = {}
+        for column in getattr(self, "columns", {}).values():
+            column.release()
+        if getattr(self, "_view", None) is not None:
+            self._view.release()
+        self._map.close()
+        self._file.close()
+    
+    def __enter__(self) -> "CallArchive":
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+    
+    def __len__(self) -> int:
+        return self.calls
+    
+    def transcript(self, index: int) -> str:
+        offsets = self.columns["text_offsets"]
+        return str(self._view[offsets[index]:offsets[index + 1]], "utf-8")
+    
+    def _codes(self, kind: str, values: Union[str, Iterable[str], None], fold_case: bool = False) -> Optional[set]:
+        if values is None:
+            return None
+        wanted = {values} if isinstance(values, str) else set(values)
+        if fold_case:
+            wanted = {value.upper() for value in wanted}
+            return {code for code, value in enumerate(self.dictionaries[kind]) if value.upper() in wanted}
+        return {code for code, value in enumerate(self.dictionaries[kind]) if value in wanted}
+    
+    def kpis(self, category: Union[str, Iterable[str], None] = None, flight: Union[str, Iterable[str], None] = None,
+             status: Union[str, Iterable[str], None] = None, date_from: Any = None, date_to: Any = None) -> KPIPartial:
+        # Calls matching every given filter. Flights match case-insensitively
+        # and a call matches when it mentions any of them. Dates are inclusive,
+        # and calls without a date only match when no date filter is set.
+        filters = {
+            "category": self._codes("category", category),
+            "status": self._codes("status", status),
+            "flight": self._codes("flight", flight, fold_case=True),
+            "date_from": _date_ordinal(date_from) if date_from is not None else None,
+            "date_to": _date_ordinal(date_to) if date_to is not None else None,
         }
+        np = _get_numpy()
+        rows, flight_codes = self._scan_numpy(np, filters) if np is not None else self._scan(filters)
         
-        if is_together_available():
-            try:
-                prompt = f"""
-                You are an AI assistant that categorizes airline call center conversations. 
-                Categories include: Flight Booking, Flight Cancellation, Flight Rescheduling, 
-                Refund Request, Baggage Issue, Complaint, and General Inquiry.
-                
-                Please categorize the following call transcript and extract key information 
-                like flight numbers, dates, and specific issues. Provide the output in JSON 
-                format with 'category' and 'details' fields.
-                
-                Transcript: {transcript}
-                
-                Output:
-                """
-                
-                response = invoke_together_model(prompt)
-                categorization = response['output']['choices'][0]['text'].strip()
-                
-                try:
-                    return categorization
-                except json.JSONDecodeError:
-                    pass
-            except Exception as e:
-                print(f"Error using Together AI for categorization: {str(e)}")
-        
-        transcript_lower = transcript.lower()
-        determined_category = "General Inquiry"  
-        
-        for category, keywords in categories.items():
-            for keyword in keywords:
-                if keyword in transcript_lower:
-                    determined_category = category
-                    break
-        
-        flight_numbers = []
-        pattern = r'([A-Za-z]{1,3}\d{1,4})'
-        matches = re.findall(pattern, transcript)
-        if matches:
-            flight_numbers = [match for match in matches if match.upper().startswith('AI')]
-        
-        resolved = "thank you" in transcript_lower and "have a" in transcript_lower
-        resolution_status = "Resolved" if resolved else "Pending"
-        
-        customer_name = "Unknown"
-        name_patterns = [
-            r'name is ([A-Za-z\s]+),',
-            r'name is ([A-Za-z\s]+)\.', 
-            r'I\'m ([A-Za-z\s]+),',
-            r'this is ([A-Za-z\s]+),'
-        ]
-        
-        for pattern in name_patterns:
-            name_match = re.search(pattern, transcript)
-            if name_match:
-                customer_name = name_match.group(1).strip()
-                break
-        
-        details = {
-            "flight_numbers": flight_numbers,
-            "customer_name": customer_name,
-            "resolution_status": resolution_status,
-            "call_summary": f"{determined_category} related to flight(s): {', '.join(flight_numbers) if flight_numbers else 'None specified'}"
-        }
+        partial = KPIPartial()
+        columns = self.columns
+        categories, customers = self.dictionaries["category"], self.dictionaries["customer"]
+        partial.total_calls = len(rows)
+        if np is not None:
+            partial.resolution_count = int(self._array(np, "resolved")[rows].sum(dtype=np.int64))
+            partial.sentiment_total = int(self._array(np, "sentiment")[rows].sum(dtype=np.int64))
+            category_counts = self._first_seen_counts(np, self._array(np, "category")[rows])
+            flight_counts = self._first_seen_counts(np, flight_codes)
+            customer_codes = np.unique(self._array(np, "customer")[rows]).tolist() if partial.sketch else []
+        else:
+            partial.resolution_count = sum(columns["resolved"][row] for row in rows)
+            partial.sentiment_total = sum(columns["sentiment"][row] for row in rows)
+            category_counts = self._first_seen_counts(None, [columns["category"][row] for row in rows])
+            flight_counts = self._first_seen_counts(None, flight_codes)
+            customer_codes = {columns["customer"][row] for row in rows} if partial.sketch else []
         
-        return json.dumps({
-            "category": determined_category,
-            "details": details
-        })
+        partial.categories = {categories[code]: count for code, count in category_counts}
+        flights = self.dictionaries["flight"]
+        if partial.sketch:
+            for code, count in flight_counts:
+                partial.flight_sketch.add(flights[code], count)
+                partial.distinct_flights.add(flights[code])
+            for code in customer_codes:
+                if customers[code] and customers[code] != "Unknown":
+                    partial.distinct_customers.add(customers[code].strip().lower())
+        else:
+            partial.flight_mentions = {flights[code]: count for code, count in flight_counts}
+        return partial
     
-    except Exception as e:
-        return json.dumps({"error": f"Error categorizing call: {str(e)}"})
+    def _array(self, np, name: str):
+        array = self._arrays.get(name)
+        if array is None:
+            array = self._arrays[name] = np.frombuffer(self.columns[name], dtype=np.dtype(self.columns[name].format))
+        return array
+    
+    def _scan_numpy(self, np, filters: Dict[str, Any]):
+        mask = np.ones(self.calls, dtype=bool)
+        for name in ("category", "status"):
+            if filters[name] is not None:
+                mask &= np.isin(self._array(np, name), list(filters[name]))
+        dates = self._array(np, "date")
+        if filters["date_from"] is not None:
+            mask &= dates >= filters["date_from"]
+        if filters["date_to"] is not None:
+            mask &= (dates <= filters["date_to"]) & (dates > 0)
+        flight_offsets = self._array(np, "flight_offsets").astype(np.int64)
+        entry_rows = self._arrays.get("entry_rows")
+        if entry_rows is None:
+            entry_rows = self._arrays["entry_rows"] = np.repeat(np.arange(self.calls), np.diff(flight_offsets))
+        flight_codes = self._array(np, "flights")
+        if filters["flight"] is not None:
+            matched = np.zeros(self.calls, dtype=bool)
+            matched[entry_rows[np.isin(flight_codes, list(filters["flight"]))]] = True
+            mask &= matched
+        return np.flatnonzero(mask), flight_codes[mask[entry_rows]]
+    
+    def _scan(self, filters: Dict[str, Any]):
+        columns = self.columns
+        category, status, dates = columns["category"], columns["status"], columns["date"]
+        flight_offsets, flight_codes = columns["flight_offsets"], columns["flights"]
+        rows, codes = [], []
+        for row in range(self.calls):
+            if filters["category"] is not None and category[row] not in filters["category"]:
+                continue
+            if filters["status"] is not None and status[row] not in filters["status"]:
+                continue
+            if filters["date_from"] is not None and dates[row] < filters["date_from"]:
+                continue
+            if filters["date_to"] is not None and not 0 < dates[row] <= filters["date_to"]:
+                continue
+            row_codes = flight_codes[flight_offsets[row]:flight_offsets[row + 1]]
+            if filters["flight"] is not None and not any(code in filters["flight"] for code in row_codes):
+                continue
+            rows.append(row)
+            codes.extend(row_codes)
+        return rows, codes
+    
+    @staticmethod
+    def _first_seen_counts(np, codes) -> List[tuple]:
+        # (code, count) pairs in order of first appearance, which is the
+        # order KPIPartial's dicts would have.
+        if np is None:
+            counts = {}
+            for code in codes:
+                counts[code] = counts.get(code, 0) + 1
+            return list(counts.items())
+        if not len(codes):
+            return []
+        unique, first, counts = np.unique(codes, return_index=True, return_counts=True)
+        order = np.argsort(first, kind="stable")
+        return list(zip(unique[order].tolist(), counts[order].tolist()))
 
-# KPI
-def compute_call_center_kpis(transcripts: List[str])  :
-    if not transcripts:
-        return json.dumps({"error": "No transcripts provided"})
+def archive_calls(source: Union[str, Any, Iterable[Any]], path: str, date: Any = None,
+                  max_workers: Optional[int] = None, text_field: Optional[str] = None,
+                  delimiter: str = "---", date_field: Optional[str] = None) -> int:
+    # Analyzes every transcript once and writes the calls, their analysis and
+    # text to an archive at path. Each call is dated from its record (see
+    # iter_transcript_records), falling back to date. Returns the number of
+    # calls written.
+    pending = deque()
     
+    def remember(records):
+        for transcript, record_date in records:
+            pending.append((transcript, record_date))
+            yield transcript
+    
+    with CallArchiveWriter(path) as writer:
+        transcripts = remember(iter_transcript_records(source, text_field, delimiter, date_field=date_field))
+        for categorization, sentiment_score in _iter_categorized(transcripts, max_workers):
+            transcript, record_date = pending.popleft()
+            writer.add(transcript, categorization, sentiment_score, date if record_date is None else record_date)
+    metrics.inc("archive.calls", writer.calls)
+    return writer.calls
+
+@metrics.timed("archive.query")
+def query_call_archives(paths: List[str], category: Union[str, Iterable[str], None] = None,
+                        flight: Union[str, Iterable[str], None] = None, status: Union[str, Iterable[str], None] = None,
+                        date_from: Any = None, date_to: Any = None) -> str:
+    # KPIs over archived calls matching the filters, in the same shape as
+    # compute_call_center_kpis, without re-analyzing any text.
     try:
-        categories = {}
-        resolution_count = 0
-        flight_mentions = {}
-        customer_sentiments = []
-        
-        for transcript in transcripts:
-            categorization = json.loads(categorize_call(transcript))
-            category = categorization.get("category", "Unknown")
-            details = categorization.get("details", {})
-            
+        total = KPIPartial()
+        for path in paths:
+            with CallArchive(path) as archive:
+                total = total.merge(archive.kpis(category, flight, status, date_from, date_to))
+        return _kpi_result_json(total)
+    except Exception as e:
+        return json.dumps({"error": f"Error computing KPIs: {str(e)}"})
 
-            if category in categories:
-                categories[category] += 1
-            else:
-                categories[category] = 1
-            
-            if details.get("resolution_status") == "Resolved":
-                resolution_count += 1
-            
-            for flight in details.get("flight_numbers", []):
-                if flight in flight_mentions:
-                    flight_mentions[flight] += 1
-                else:
-                    flight_mentions[flight] = 1
-            
-            sentiment_score = 0
-            positive_words = ["thank", "good", "great", "excellent", "helpful", "appreciate", "happy", "satisfied"]
-            negative_words = ["unhappy", "disappointed", "poor", "terrible", "bad", "issue", "problem", "complaint", "delay"]
-            
-            transcript_lower = transcript.lower()
-            for word in positive_words:
-                if word in transcript_lower:
-                    sentiment_score += 1
-            for word in negative_words:
-                if word in transcript_lower:
-                    sentiment_score -= 1
-                    
-            customer_sentiments.append(sentiment_score)
+# HTTP service
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8080"))
+SERVICE_MAX_CONCURRENCY = int(os.getenv("SERVICE_MAX_CONCURRENCY", "16"))
+SERVICE_MAX_QUEUE = int(os.getenv("SERVICE_MAX_QUEUE", "64"))
+SERVICE_REQUEST_TIMEOUT = float(os.getenv("SERVICE_REQUEST_TIMEOUT", "30"))
+SERVICE_SHUTDOWN_TIMEOUT = float(os.getenv("SERVICE_SHUTDOWN_TIMEOUT", "30"))
+SERVICE_MAX_BODY_BYTES = int(os.getenv("SERVICE_MAX_BODY_BYTES", str(10 * 1024 * 1024)))
+SERVICE_IDLE_TIMEOUT = 15.0
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+                504: "Gateway Timeout"}
+
+class ServiceError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+def _require(body: Dict[str, Any], field: str, kind: type):
+    value = body.get(field)
+    if not isinstance(value, kind):
+        raise ServiceError(400, f"'{field}' must be a {kind.__name__}")
+    return value
+
+def _service_info(body: Dict[str, Any]):
+    if "flight_numbers" in body:
+        flight_numbers = _require(body, "flight_numbers", list)
+        if not all(isinstance(flight_number, str) for flight_number in flight_numbers):
+            raise ServiceError(400, "'flight_numbers' must be a list of strings")
+        return info_agent_request_many, (flight_numbers,)
+    return info_agent_request, (_require(body, "flight_number", str),)
+
+def _service_qa(body: Dict[str, Any]):
+    return qa_agent_respond, (_require(body, "query", str),)
+
+def _service_categorize(body: Dict[str, Any]):
+    return categorize_call, (_require(body, "transcript", str),)
+
+def _service_kpis(body: Dict[str, Any]):
+    transcripts = _require(body, "transcripts", list)
+    if not all(isinstance(transcript, str) for transcript in transcripts):
+        raise ServiceError(400, "'transcripts' must be a list of strings")
+    return compute_call_center_kpis, (transcripts,)
+
+SERVICE_ROUTES = {
+    "/info": _service_info,
+    "/qa": _service_qa,
+    "/categorize": _service_categorize,
+    "/kpis": _service_kpis,
+}
+
+def _service_qa_stream(body: Dict[str, Any]):
+    return qa_agent_respond_stream, (_require(body, "query", str),)
+
+def _service_categorize_stream(body: Dict[str, Any]):
+    return categorize_call_stream, (_require(body, "transcript", str),)
+
+# Answered as newline-delimited JSON, one event per line, as events arrive.
+SERVICE_STREAM_ROUTES = {
+    "/qa/stream": _service_qa_stream,
+    "/categorize/stream": _service_categorize_stream,
+}
+
+class AgentService:
+    # Agents are blocking (regex work and Together AI calls), so they run on a
+    # bounded thread pool while the event loop keeps serving sockets. Work is
+    # counted until its thread finishes, even after the client has been sent a
+    # timeout, so a slow upstream cannot pile up unbounded hidden work.
+    def __init__(self, host: str = SERVICE_HOST, port: int = SERVICE_PORT,
+                 max_concurrency: int = SERVICE_MAX_CONCURRENCY, max_queue: int = SERVICE_MAX_QUEUE,
+                 request_timeout: float = SERVICE_REQUEST_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.request_timeout = request_timeout
+        from concurrent.futures import ThreadPoolExecutor
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="agent")
+        self._server = None
+        self._closing = False
+        self._pending = 0
+        self._active_requests = 0
+        self._connections = set()
+        self._cleanups = set()
+    
+    async def start(self):
+        import asyncio
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+    
+    async def _handle_connection(self, reader, writer):
+        import asyncio
+        self._connections.add(writer)
+        try:
+            while not self._closing:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), SERVICE_IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+                    break
+                
+                self._active_requests += 1
+                try:
+                    keep_alive = await self._handle_request(head, reader, writer)
+                finally:
+                    self._active_requests -= 1
+                if not keep_alive:
+                    break
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+    
+    async def _handle_request(self, head: bytes, reader, writer) -> bool:
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            await self._respond(writer, 400, json.dumps({"error": "Malformed request line"}), False)
+            return False
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
         
-        avg_response_time = 25  
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            length = -1
+        if length < 0 or length > SERVICE_MAX_BODY_BYTES:
+            await self._respond(writer, 413 if length > 0 else 400, json.dumps({"error": "Invalid request body size"}), False)
+            return False
+        body = await reader.readexactly(length) if length else b""
         
-        avg_sentiment = sum(customer_sentiments) / len(customer_sentiments) if customer_sentiments else 0
+        path = target.split("?", 1)[0]
+        keep_alive = keep_alive and not self._closing
+        if path == "/metrics" and method == "GET":
+            await self._respond(writer, 200, render_metrics(), keep_alive, "text/plain; version=0.0.4")
+            return keep_alive
         
-       
-        resolution_rate = (resolution_count / len(transcripts)) * 100 if transcripts else 0
+        start = time.perf_counter()
+        if path in SERVICE_STREAM_ROUTES:
+            status, keep_alive = await self.stream(method, path, body, writer, keep_alive, version == "HTTP/1.1")
+            metrics.observe("service.request", time.perf_counter() - start)
+            metrics.inc(f"service.status_{status}")
+            return keep_alive and not self._closing
         
+        status, payload = await self.dispatch(method, path, body)
+        metrics.observe("service.request", time.perf_counter() - start)
+        metrics.inc(f"service.status_{status}")
+        keep_alive = keep_alive and not self._closing
+        await self._respond(writer, status, payload, keep_alive)
+        return keep_alive
+    
+    async def _respond(self, writer, status: int, payload: str, keep_alive: bool,
+                       content_type: str = "application/json"):
+        data = payload.encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        )
+        if status == 503:
+            head += "Retry-After: 1\r\n"
+        writer.write(head.encode("latin-1") + b"\r\n" + data)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+    
+    def _route(self, method: str, path: str, body: bytes, routes: Dict[str, Any]):
+        route = routes.get(path)
+        if route is None:
+            raise ServiceError(404, f"Unknown endpoint {path}")
+        if method != "POST":
+            raise ServiceError(405, "Use POST with a JSON body")
+        if self._closing:
+            raise ServiceError(503, "Service is shutting down")
+        if self._pending >= self.max_concurrency + self.max_queue:
+            raise ServiceError(503, "Service overloaded, retry later")
         
-        most_common_category = max(categories.items(), key=lambda x: x[1])[0] if categories else "None"
+        try:
+            parsed = json.loads(body or b"{}")
+        except ValueError:
+            raise ServiceError(400, "Request body is not valid JSON")
+        if not isinstance(parsed, dict):
+            raise ServiceError(400, "Request body must be a JSON object")
+        return route(parsed)
+    
+    async def dispatch(self, method: str, path: str, body: bytes):
+        import asyncio
+        if path == "/healthz":
+            return 200, json.dumps({"status": "draining" if self._closing else "ok", "pending": self._pending})
         
-       
-        most_mentioned_flights = sorted(flight_mentions.items(), key=lambda x: x[1], reverse=True)[:3] if flight_mentions else []
+        try:
+            fn, args = self._route(method, path, body, SERVICE_ROUTES)
+        except ServiceError as e:
+            return e.status, json.dumps({"error": str(e)})
         
-       
-        kpi_result = {
-            "total_calls": len(transcripts),
-            "call_categories": categories,
-            "resolution_rate": resolution_rate,
-            "average_response_time": avg_response_time,
-            "average_sentiment": avg_sentiment,
-            "most_common_issue": most_common_category,
-            "most_mentioned_flights": dict(most_mentioned_flights),
-            "category_distribution": {category: (count / len(transcripts)) * 100 for category, count in categories.items()}
-        }
+        self._pending += 1
+        future = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        future.add_done_callback(self._release)
+        try:
+            return 200, await asyncio.wait_for(asyncio.shield(future), self.request_timeout)
+        except asyncio.TimeoutError:
+            return 504, json.dumps({"error": f"Request timed out after {self.request_timeout:g}s"})
+        except Exception as e:
+            return 500, json.dumps({"error": f"Error processing request: {str(e)}"})
+    
+    def _release(self, _future):
+        self._pending -= 1
+    
+    async def stream(self, method: str, path: str, body: bytes, writer, keep_alive: bool, chunked: bool):
+        # Each event is pulled from the agent's generator on the pool and
+        # written as soon as it arrives. HTTP/1.0 clients get the same lines
+        # on a connection that closes at the end. The generator is closed when
+        # the response ends for any reason, which aborts an upstream stream
+        # the client no longer needs. After a timeout or disconnect that
+        # happens in the background, so the connection is free right away.
+        # Returns (status, keep_alive).
+        import asyncio
+        try:
+            fn, args = self._route(method, path, body, SERVICE_STREAM_ROUTES)
+        except ServiceError as e:
+            await self._respond(writer, e.status, json.dumps({"error": str(e)}), keep_alive)
+            return e.status, keep_alive
         
-        return json.dumps(kpi_result)
+        keep_alive = keep_alive and chunked
+        writer.write((
+            "HTTP/1.1 200 OK\r\n"
+            "Content-Type: application/x-ndjson\r\n"
+            + ("Transfer-Encoding: chunked\r\n" if chunked else "")
+            + f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        ).encode("latin-1"))
         
-    except Exception as e:
-        return json.dumps({"error": f"Error computing KPIs: {str(e)}"})
+        loop = asyncio.get_running_loop()
+        events = fn(*args)
+        running = None
+        self._pending += 1
+        try:
+            while True:
+                running = loop.run_in_executor(self._executor, next, events, None)
+                try:
+                    event = await asyncio.wait_for(asyncio.shield(running), self.request_timeout)
+                except asyncio.TimeoutError:
+                    event = {"error": f"Request timed out after {self.request_timeout:g}s"}
+                except Exception as e:
+                    event = {"error": f"Error processing request: {str(e)}"}
+                if event is None:
+                    break
+                data = (json.dumps(event) + "\n").encode("utf-8")
+                writer.write(f"{len(data):X}\r\n".encode("latin-1") + data + b"\r\n" if chunked else data)
+                await writer.drain()
+                if "error" in event:
+                    break
+            if chunked:
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+        except ConnectionError:
+            metrics.inc("service.stream_disconnect")
+            keep_alive = False
+        finally:
+            cleanup = asyncio.ensure_future(self._close_stream(running, events))
+            self._cleanups.add(cleanup)
+            cleanup.add_done_callback(self._cleanups.discard)
+        return 200, keep_alive
+    
+    async def _close_stream(self, running, events):
+        # The generator can only be closed once the pull in flight returns; a
+        # stuck upstream keeps it, and its slot, until the SDK gives up.
+        import asyncio
+        try:
+            if running is not None:
+                await running
+        except Exception:
+            pass
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, events.close)
+        except Exception:
+            pass
+        self._pending -= 1
+    
+    async def shutdown(self, timeout: float = SERVICE_SHUTDOWN_TIMEOUT):
+        # Stop accepting, let in-flight requests answer, then drop idle
+        # keep-alive connections.
+        import asyncio
+        self._closing = True
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        deadline = time.monotonic() + timeout
+        while (self._active_requests or self._pending) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for writer in list(self._connections):
+            writer.close()
+        self._executor.shutdown(wait=False)
+    
+    async def serve_forever(self):
+        import asyncio
+        await self.start()
+        print(f"Agent service listening on http://{self.host}:{self.port}")
+        import signal
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+        try:
+            await stop.wait()
+        finally:
+            print("Shutting down agent service...")
+            await self.shutdown()
+
+def run_service(host: str = SERVICE_HOST, port: int = SERVICE_PORT):
+    import asyncio
+    start_flight_feed()
+    try:
+        asyncio.run(AgentService(host, port).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+# UI caching
+UI_CACHE_TTL = float(os.getenv("UI_CACHE_TTL", "300"))
+UI_CACHE_ENTRIES = int(os.getenv("UI_CACHE_ENTRIES", "256"))
+
+class ResultCache:
+    # Bounded LRU with a TTL for agent results shown in the dashboard, shared
+    # by every session in the process.
+    def __init__(self, max_entries: int = UI_CACHE_ENTRIES, ttl: float = UI_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = {"hits": 0, "misses": 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.stats["misses"] += 1
+            return None
+    
+    def put(self, key, value: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def _cacheable(result: str) -> bool:
+    try:
+        parsed = json.loads(result)
+    except ValueError:
+        return True
+    return not (isinstance(parsed, dict) and "error" in parsed)
 
+def _process_resources() -> Dict[str, Any]:
+    # Streamlit re-executes this module on every rerun, which would rebuild
+    # the flight store, caches, LLM client and worker pool each time. main()
+    # builds them once per process through st.cache_resource and adopts them.
+    return {
+        "flight_store": get_flight_store(),
+        "llm_cache": get_llm_cache(),
+        "qa_cache": get_qa_cache(),
+        "kpi_store": get_kpi_store(),
+        "llm_breaker": _llm_breaker,
+        "llm_rate_limiter": _llm_rate_limiter,
+        "llm_executor": _get_llm_executor(),
+        "llm_probe_executor": _get_llm_executor(probe=True),
+        "together": _get_together() if is_together_available() else None,
+        "flight_feed": start_flight_feed(),
+        "results": ResultCache(),
+    }
+
+def _adopt_process_resources(resources: Dict[str, Any]):
+    global _flight_store, _flight_feed, _llm_cache, _qa_cache, _kpi_store, _llm_breaker, _llm_rate_limiter, _llm_executor, \
+        _llm_probe_executor, _together
+    _flight_store = resources["flight_store"]
+    _flight_feed = resources["flight_feed"]
+    _llm_cache = resources["llm_cache"]
+    _qa_cache = resources["qa_cache"]
+    _kpi_store = resources["kpi_store"]
+    _llm_breaker = resources["llm_breaker"]
+    _llm_rate_limiter = resources["llm_rate_limiter"]
+    _llm_executor = resources["llm_executor"]
+    _llm_probe_executor = resources["llm_probe_executor"]
+    if resources["together"] is not None:
+        _together = resources["together"]
 
 def main():
+    import streamlit as st
+    
     st.set_page_config(
         page_title="AI-Powered Airline Call Center System",
         page_icon="✈",
@@ -417,6 +4006,24 @@ def main():
     st.title("✈ AI-Powered Airline Call Center System")
     st.markdown("---")
     
+    resources = st.cache_resource(show_spinner=False)(_process_resources)()
+    _adopt_process_resources(resources)
+    results = resources["results"]
+    
+    def take_refresh() -> bool:
+        # Set by Force refresh: the next computation also bypasses the LLM,
+        # Q&A answer and KPI caches behind the dashboard's own.
+        return st.session_state.pop("force_refresh", False)
+    
+    def cached(key, compute):
+        refresh = take_refresh()
+        result = results.get(key) if not refresh else None
+        if result is None:
+            result = compute(refresh)
+            if _cacheable(result):
+                results.put(key, result)
+        return result
+    
   
     if is_together_available():
         st.sidebar.success("Together AI API configured successfully")
@@ -430,6 +4037,11 @@ def main():
         ["Info Agent", "QA Response Agent", "Call Categorization", "KPI Analysis"]
     )
     
+    if st.sidebar.button("Force refresh", help="Discard cached results and recompute the next request from scratch"):
+        results.clear()
+        st.session_state["force_refresh"] = True
+        st.sidebar.info("Cached results cleared.")
+    
   
     def display_json(json_str):
         try:
@@ -498,6 +4110,13 @@ def main():
                     flights = parsed_json.get("most_mentioned_flights", {})
                     for flight, count in flights.items():
                         st.write(f"- Flight {flight}: {count} mentions")
+                    
+                    if "sketch" in parsed_json:
+                        cols = st.columns(2)
+                        with cols[0]:
+                            st.metric("Distinct Flights (est.)", parsed_json.get("distinct_flights", 0))
+                        with cols[1]:
+                            st.metric("Distinct Customers (est.)", parsed_json.get("distinct_customers", 0))
                 
                 else:
                     st.json(parsed_json)
@@ -519,7 +4138,8 @@ def main():
             
         if submitted and flight_number:
             with st.spinner("Retrieving flight information..."):
-                response = info_agent_request(flight_number)
+                version = get_flight_store().get_version(flight_number)
+                response = cached(("info", flight_number.upper(), version), lambda refresh: info_agent_request(flight_number))
                 st.subheader("Flight Information")
                 display_json(response)
     
@@ -535,10 +4155,33 @@ def main():
             submitted = st.form_submit_button("Submit Question")
             
         if submitted and user_query:
-            with st.spinner("Processing your question..."):
-                response = qa_agent_respond(user_query)
-                st.subheader("Response")
-                display_json(response)
+            st.subheader("Response")
+            # Keyed on the versions of any flights mentioned, so a status change
+            # is never hidden behind a cached answer.
+            versions = tuple(get_flight_store().get_version(mention) for mention in FLIGHT_MENTION_PATTERN.findall(user_query))
+            refresh = take_refresh()
+            response = results.get(("qa", user_query, versions)) if not refresh else None
+            from_cache = response is not None
+            if response is None:
+                placeholder = st.empty()
+                placeholder.info("Processing your question...")
+                partial = ""
+                for event in qa_agent_respond_stream(user_query, refresh):
+                    if "delta" in event:
+                        partial += event["delta"]
+                        placeholder.info(partial + "▌")
+                    else:
+                        response = json.dumps(event)
+                placeholder.empty()
+                # Template answers standing in for a failed model call are
+                # not kept, so the model is asked again next time.
+                if event.get("tier") not in ("fallback", "error"):
+                    results.put(("qa", user_query, versions), response)
+            display_json(response)
+            intent, confidence = classify_query_intent(user_query)
+            tier = json.loads(response).get("tier", "unknown")
+            st.caption(f"Answer tier: {tier}{' (cached)' if from_cache else ''} "
+                       f"(intent: {intent}, confidence {confidence:.2f})")
     
     elif option == "Call Categorization":
         st.header("Call Categorization")
@@ -569,10 +4212,26 @@ def main():
         
         if st.button("Categorize Call"):
             if transcript:
-                with st.spinner("Analyzing call transcript..."):
-                    response = categorize_call(transcript)
-                    st.subheader("Categorization Results")
-                    display_json(response)
+                st.subheader("Categorization Results")
+                source = "llm" if _llm_enabled() else "rules"
+                key = ("categorize", transcript_hash(transcript), analyzer_version(source))
+                refresh = take_refresh()
+                response = results.get(key) if not refresh else None
+                if response is None:
+                    placeholder = st.empty()
+                    placeholder.info("Analyzing call transcript...")
+                    partial = ""
+                    for event in categorize_call_stream(transcript, refresh=refresh):
+                        if "delta" in event:
+                            partial += event["delta"]
+                            placeholder.code(partial + "▌")
+                        else:
+                            response = event["result"]
+                    placeholder.empty()
+                    # A rules fallback is not kept under the model's key.
+                    if _cacheable(response) and event["source"] == source:
+                        results.put(key, response)
+                display_json(response)
             else:
                 st.warning("Please enter a transcript to categorize.")
     
@@ -595,15 +4254,138 @@ def main():
             
             if st.button("Compute KPIs"):
                 with st.spinner("Analyzing call center data..."):
-                    response = compute_call_center_kpis(SAMPLE_TRANSCRIPTS)
+                    key = ("kpis", transcript_hash("\x00".join(SAMPLE_TRANSCRIPTS)),
+                           analyzer_version("llm" if _llm_enabled() else "rules"))
+                    response = cached(key, lambda refresh: compute_call_center_kpis(SAMPLE_TRANSCRIPTS, refresh=refresh))
                     st.subheader("KPI Analysis Results")
                     display_json(response)
         else:
-            st.error("Custom transcript upload is not implemented in this demo version.")
-            st.info("Please use the sample transcripts for KPI analysis.")
+            uploaded = st.file_uploader("Upload transcripts", type=["jsonl", "ndjson", "csv", "zip", "gz", "txt"],
+                                        help="JSONL, CSV or delimited text (optionally gzipped), or a ZIP of such files")
+            text_field = st.text_input("Transcript field", value="",
+                                       help="JSONL key or CSV column holding the transcript (default: transcript, text or body)")
+            job = st.session_state.get("kpi_job")
+            
+            if uploaded is not None and st.button("Start Analysis", disabled=job is not None and job.running):
+                job = st.session_state["kpi_job"] = start_kpi_job(uploaded, text_field.strip() or None)
+            
+            if job is not None:
+                snapshot = job.snapshot()
+                skipped = f", {snapshot['skipped']} malformed records skipped" if snapshot["skipped"] else ""
+                st.progress(snapshot["progress"],
+                            text=f"{snapshot['status'].title()}: {snapshot['calls']} calls analyzed{skipped} in {snapshot['elapsed_seconds']:.0f}s")
+                if job.running and st.button("Cancel Analysis"):
+                    job.cancel()
+                if snapshot["error"]:
+                    st.error(snapshot["error"])
+                if job.result:
+                    st.subheader("KPI Analysis Results" if job.status == "done" else "Partial KPI Results")
+                    display_json(job.result)
+                if job.running:
+                    time.sleep(KPI_JOB_POLL_INTERVAL)
+                    st.rerun()
 
     st.markdown("---")
     st.markdown("AI-Powered Airline Call Center Optimization System | Streamlit Demo with Together AI Integration")
 
+# Command line
+def _print_categorizations(source: str, max_workers: Optional[int], text_field: Optional[str], delimiter: str):
+    for chunk in _shards(iter_transcripts(source, text_field, delimiter), KPI_CHUNK_SIZE):
+        for categorization in categorize_calls(chunk, max_workers):
+            try:
+                print(json.dumps(json.loads(categorization)))
+            except ValueError:
+                print(json.dumps({"error": "Categorization is not valid JSON", "output": categorization}))
+
+def run_cli(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(prog="python -m main", description="Airline call center agents")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    categorize = commands.add_parser("categorize", help="categorize transcripts, one JSON result per line")
+    categorize.add_argument("source", help="JSONL, CSV, delimited text, gzip or ZIP transcript file")
+    
+    kpis = commands.add_parser("kpis", help="compute call center KPIs")
+    kpis.add_argument("sources", nargs="+", help="transcript files, .kpi.json partials or .kpiarc archives to merge")
+    kpis.add_argument("--processes", type=int, help="shard the work across this many processes")
+    
+    partial = commands.add_parser("partial", help="save a mergeable KPI partial for one shard")
+    partial.add_argument("source", help="JSONL, CSV, delimited text, gzip or ZIP transcript file")
+    partial.add_argument("-o", "--output", required=True, help="where to write the .kpi.json partial")
+    
+    archive = commands.add_parser("archive", help="analyze transcripts into a columnar call archive")
+    archive.add_argument("source", help="JSONL, CSV, delimited text, gzip or ZIP transcript file")
+    archive.add_argument("-o", "--output", required=True, help="where to write the .kpiarc archive")
+    archive.add_argument("--date", help="call date (YYYY-MM-DD) for calls whose record has no date")
+    archive.add_argument("--date-field", help="JSONL field or CSV column holding each call's date "
+                                              f"(default: {', '.join(TRANSCRIPT_DATE_FIELDS)})")
+    
+    query = commands.add_parser("query", help="compute KPIs over call archives")
+    query.add_argument("archives", nargs="+", help=".kpiarc archives written by the archive command")
+    query.add_argument("--category", action="append", help="only calls in this category (repeatable)")
+    query.add_argument("--flight", action="append", help="only calls mentioning this flight (repeatable)")
+    query.add_argument("--status", action="append", help="only calls with this resolution status (repeatable)")
+    query.add_argument("--from", dest="date_from", help="only calls on or after this date (YYYY-MM-DD)")
+    query.add_argument("--to", dest="date_to", help="only calls on or before this date (YYYY-MM-DD)")
+    
+    for command in (categorize, kpis, partial, archive):
+        command.add_argument("--workers", type=int, help="concurrent Together AI categorizations")
+        command.add_argument("--text-field", help="JSONL field holding the transcript")
+        command.add_argument("--delimiter", default="---", help="line separating transcripts in text files")
+    
+    serve = commands.add_parser("serve", help="run the JSON HTTP service")
+    serve.add_argument("--host", default=SERVICE_HOST)
+    serve.add_argument("--port", type=int, default=SERVICE_PORT)
+    
+    feed = commands.add_parser("feed", help="apply live flight updates to the flight store")
+    feed.add_argument("spec", help="file:PATH, tail:PATH, tcp:HOST:PORT or synthetic[:RATE]")
+    feed.add_argument("--batch-size", type=int, default=FLIGHT_FEED_BATCH)
+    feed.add_argument("--store", default=FLIGHT_STORE_PATH,
+                      help="SQLite flight store file to update (default: FLIGHT_STORE_PATH)")
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == "categorize":
+        _print_categorizations(args.source, args.workers, args.text_field, args.delimiter)
+    elif args.command == "kpis":
+        if len(args.sources) > 1:
+            result = compute_call_center_kpis_files(args.sources, args.processes)
+        elif args.processes:
+            result = compute_call_center_kpis_parallel(args.sources[0], args.processes,
+                                                       text_field=args.text_field, delimiter=args.delimiter)
+        else:
+            result = compute_call_center_kpis_stream(args.sources[0], args.workers, args.text_field, args.delimiter)
+        print(result)
+        return 1 if "error" in json.loads(result) else 0
+    elif args.command == "partial":
+        compute_kpi_partial(args.source, args.workers, args.text_field, args.delimiter).save(args.output)
+    elif args.command == "archive":
+        calls = archive_calls(args.source, args.output, args.date, args.workers, args.text_field, args.delimiter,
+                              args.date_field)
+        print(json.dumps({"calls": calls, "archive": args.output}))
+    elif args.command == "query":
+        result = query_call_archives(args.archives, args.category, args.flight, args.status, args.date_from, args.date_to)
+        print(result)
+        return 1 if "error" in json.loads(result) else 0
+    elif args.command == "serve":
+        run_service(args.host, args.port)
+    elif args.command == "feed":
+        # An in-memory store would be thrown away when the command exits.
+        if not args.store or args.store == ":memory:":
+            parser.error("feed needs a flight store file: pass --store PATH or set FLIGHT_STORE_PATH")
+        store = SQLiteFlightStore(args.store)
+        flight_feed = FlightFeed(open_flight_feed(args.spec), store, batch_size=args.batch_size)
+        try:
+            flight_feed.run()
+        except KeyboardInterrupt:
+            flight_feed.stop()
+        print(json.dumps({"updates": flight_feed.updates, "batches": flight_feed.batches}))
+    return 0
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # `streamlit run main.py` has already imported streamlit by the time this
+    # script executes; anything else is a command line invocation.
+    if "streamlit" in sys.modules:
+        main()
+    else:
+        sys.exit(run_cli())
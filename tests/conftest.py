@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Keep the on-disk stores out of the working tree and never touch Together AI:
+# every test runs the rule-based paths unless it installs its own stub client.
+_STATE_DIR = tempfile.mkdtemp(prefix="airline-agent-tests-")
+os.environ.setdefault("KPI_STORE_PATH", os.path.join(_STATE_DIR, "kpi_store.sqlite3"))
+os.environ.setdefault("LLM_CACHE_PATH", os.path.join(_STATE_DIR, "llm_cache.sqlite3"))
+os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+os.environ.setdefault("FLIGHT_FEED", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def rules_only(monkeypatch):
+    monkeypatch.setattr(main, "_env_loaded", True)
+    monkeypatch.setattr(main, "together_api_key", None)
+    monkeypatch.setattr(main, "_together", None)
+    yield
+
+
+@pytest.fixture
+def kpi_store(tmp_path):
+    return main.KPIResultStore(str(tmp_path / "kpi_store.sqlite3"))
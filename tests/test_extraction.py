@@ -0,0 +1,48 @@
+import random
+
+import benchmarks
+import main
+
+
+def reference_choice(text, known_flights):
+    # choose_flight_number without its single-known-flight shortcut
+    candidates = main.entity_extractor.flight_candidates(text)
+    known = [candidate for candidate in candidates if candidate[0].upper() in known_flights]
+    if known:
+        return min(known, key=lambda candidate: (candidate[2], candidate[1]))[0]
+    return main.choose_flight_number(text, None)
+
+
+def test_known_flights_win():
+    known = frozenset(["AI123", "AI456"])
+    assert main.choose_flight_number("My booking reference is DEF456, flight AI123", known) == "AI123"
+    assert main.choose_flight_number("Is ai 456 delayed?", known) == "ai456"
+    assert main.choose_flight_number("AI999 or flight AI456?", known) == "AI456"
+    assert main.choose_flight_number("Booking reference DEF456. What about XY12?", None) == "XY12"
+    assert main.choose_flight_number("What time is it?", known) == ""
+
+
+def test_shortcut_matches_candidate_ranking():
+    rng = random.Random(3)
+    flights = list(benchmarks.generate_flights(300))
+    known = frozenset(flights[:200])
+    texts = list(benchmarks.generate_queries(2000, flights, seed=3))
+    for _ in range(2000):
+        a, b = rng.sample(flights, 2)
+        texts.append(rng.choice([
+            f"{a} or {b.lower()}?",
+            f"flight {a} then {a}",
+            f"{a} and {a[:2]} {a[2:]}",
+            f"{a.lower()} vs {a} at gate 12",
+            f"seat 12A on {a}, booking {b}",
+            f"{a[:2]}-{a[2:]} or {b}",
+        ]))
+    for text in texts:
+        assert main.choose_flight_number(text, known) == reference_choice(text, known), text
+
+
+def test_extract_flight_number_uses_store_index(monkeypatch):
+    store = main.SnapshotFlightStore()
+    monkeypatch.setattr(main, "_flight_store", store)
+    assert main.extract_flight_number("Booking ABC123 for AI456 please") == "AI456"
+    assert main.extract_flight_number("no flight here") == ""
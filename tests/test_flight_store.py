@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+import main
+
+
+@pytest.fixture(params=["sqlite", "snapshot"])
+def store(request):
+    if request.param == "snapshot":
+        return main.SnapshotFlightStore()
+    return main.SQLiteFlightStore(":memory:")
+
+
+def test_seeded_with_flight_database(store):
+    for flight_number, record in main.FLIGHT_DATABASE.items():
+        assert store.get(flight_number.lower()) == record
+    assert set(store.known_flights()) == set(main.FLIGHT_DATABASE)
+
+
+def test_query_filters(store):
+    expected = [record for record in main.FLIGHT_DATABASE.values() if record["status"] == "Delayed"]
+    assert sorted(r["flight_number"] for r in store.query(status="delayed")) == \
+        sorted(r["flight_number"] for r in expected)
+    assert store.query(departs_after="not a time") == []
+
+
+def test_partial_update_merges_into_known_flight(store):
+    record = dict(main.FLIGHT_DATABASE["AI123"])
+    version = store.get_version("AI123")
+    store.apply_updates([{"flight_number": "ai123", "status": "Boarding"}])
+    assert store.get("AI123") == {**record, "status": "Boarding"}
+    assert store.get_version("AI123") != version
+
+
+def test_info_agent_uses_current_store(monkeypatch):
+    store = main.SnapshotFlightStore()
+    monkeypatch.setattr(main, "_flight_store", store)
+    store.apply_updates([{"flight_number": "AI123", "gate": "Z9"}])
+    assert json.loads(main.info_agent_request("AI123"))["gate"] == "Z9"
+    assert "error" in json.loads(main.info_agent_request("AI000"))
+
+
+def test_partial_update_for_unknown_flight_is_rejected(store):
+    rejected = main.metrics_snapshot()["counters"].get("flights.rejected", 0)
+    store.apply_updates([
+        {"flight_number": "AI999", "status": "On Time"},
+        {"flight_number": "AI123", "status": "Boarding"},
+    ])
+    assert store.get("AI999") is None
+    assert "AI999" not in store.known_flights()
+    assert store.get("AI123")["status"] == "Boarding"
+    assert main.metrics_snapshot()["counters"]["flights.rejected"] - rejected == 1
+
+
+def test_complete_record_adds_unknown_flight(store):
+    record = {"flight_number": "ai999", "departure_time": "07:15 AM", "destination": "Goa",
+              "status": "On Time", "terminal": "T1", "gate": "A1"}
+    store.apply_updates([record, {"flight_number": "AI999", "gate": "A2"}])
+    assert store.get("AI999") == {**record, "flight_number": "AI999", "gate": "A2"}
+
+
+def test_qa_for_rejected_flight_is_not_found(monkeypatch):
+    store = main.SnapshotFlightStore()
+    monkeypatch.setattr(main, "_flight_store", store)
+    store.apply_updates([{"flight_number": "AI999", "status": "On Time"}])
+    answer = json.loads(main.qa_agent_respond("Is AI999 on time?"))
+    assert answer == {"answer": "Flight AI999 not found in database.", "tier": "lookup"}
+
+
+def test_template_answer_tolerates_missing_fields():
+    for intent in ("departure", "destination", "status", "gate", "general"):
+        answer = main.template_answer({"flight_number": "AI999", "status": "On Time"}, intent)
+        assert "AI999" in answer and "unknown" in answer
@@ -0,0 +1,117 @@
+import json
+
+import benchmarks
+import main
+
+
+def corpus(n, seed=0):
+    flights = list(benchmarks.generate_flights(40))
+    return list(benchmarks.generate_transcripts(n, flights, seed=seed))
+
+
+def counter(name):
+    return main.metrics_snapshot()["counters"].get(name, 0)
+
+
+def test_incremental_matches_full_recompute(kpi_store):
+    transcripts = corpus(600)
+    full = json.loads(main.compute_call_center_kpis_stream(transcripts))
+    assert json.loads(main.compute_call_center_kpis_incremental(transcripts, store=kpi_store)) == full
+
+    analyzed = counter("kpi.analyzed_calls")
+    assert json.loads(main.compute_call_center_kpis_incremental(transcripts, store=kpi_store)) == full
+    assert counter("kpi.analyzed_calls") == analyzed
+
+
+def test_incremental_after_growth_and_edits(kpi_store):
+    transcripts = corpus(500, seed=1)
+    main.compute_call_center_kpis_incremental(transcripts, store=kpi_store)
+
+    grown = transcripts + corpus(120, seed=2)
+    analyzed = counter("kpi.analyzed_calls")
+    assert json.loads(main.compute_call_center_kpis_incremental(grown, store=kpi_store)) == \
+        json.loads(main.compute_call_center_kpis_stream(grown))
+    assert counter("kpi.analyzed_calls") - analyzed == 120
+
+    edited = list(grown)
+    edited[3] = "Customer: I want to cancel flight AI123 and get a refund."
+    del edited[10]
+    assert json.loads(main.compute_call_center_kpis_incremental(edited, store=kpi_store)) == \
+        json.loads(main.compute_call_center_kpis_stream(edited))
+
+
+def test_refresh_recomputes_same_result(kpi_store):
+    transcripts = corpus(200, seed=3)
+    first = main.compute_call_center_kpis_incremental(transcripts, store=kpi_store)
+    analyzed = counter("kpi.analyzed_calls")
+    assert main.compute_call_center_kpis_incremental(transcripts, store=kpi_store, refresh=True) == first
+    assert counter("kpi.analyzed_calls") - analyzed == 200
+
+
+def test_stream_reads_jsonl_and_delimited_text(tmp_path):
+    transcripts = corpus(50, seed=4)
+    expected = json.loads(main.compute_call_center_kpis_stream(transcripts))
+
+    jsonl = tmp_path / "calls.jsonl"
+    jsonl.write_text("".join(json.dumps({"transcript": t}) + "\n" for t in transcripts), encoding="utf-8")
+    assert json.loads(main.compute_call_center_kpis_stream(str(jsonl))) == expected
+
+    text = tmp_path / "calls.txt"
+    text.write_text("\n---\n".join(transcripts), encoding="utf-8")
+    assert json.loads(main.compute_call_center_kpis_stream(str(text))) == expected
+
+
+def test_archive_round_trip(tmp_path):
+    transcripts = corpus(400, seed=5)
+    path = str(tmp_path / "calls.kpiarc")
+    records = [(t, "2024-03-%02d" % (1 + i % 28)) for i, t in enumerate(transcripts)]
+    assert main.archive_calls(records, path) == len(transcripts)
+
+    fresh = json.loads(main.compute_call_center_kpis_stream(transcripts))
+    assert json.loads(main.query_call_archives([path])) == fresh
+
+    with main.CallArchive(path) as archive:
+        assert len(archive) == len(transcripts)
+
+    analyzed = [json.loads(main.categorize_call(t)) for t in transcripts]
+    selected = [t for t, c in zip(transcripts, analyzed) if c["category"] == "Baggage Issue"]
+    assert json.loads(main.query_call_archives([path], category="Baggage Issue")) == \
+        json.loads(main.compute_call_center_kpis_stream(selected))
+
+    dated = [t for t, date in records if "2024-03-05" <= date <= "2024-03-09"]
+    assert json.loads(main.query_call_archives([path], date_from="2024-03-05", date_to="2024-03-09")) == \
+        json.loads(main.compute_call_center_kpis_stream(dated))
+
+
+def test_archive_queries_merge_across_files(tmp_path):
+    transcripts = corpus(300, seed=6)
+    paths = [str(tmp_path / "a.kpiarc"), str(tmp_path / "b.kpiarc")]
+    main.archive_calls(transcripts[:100], paths[0], date="2024-01-01")
+    main.archive_calls(transcripts[100:], paths[1], date="2024-01-02")
+    assert json.loads(main.query_call_archives(paths)) == \
+        json.loads(main.compute_call_center_kpis_stream(transcripts))
+
+
+def test_malformed_jsonl_records_are_skipped(tmp_path):
+    transcripts = corpus(30, seed=7)
+    lines = [json.dumps({"transcript": t}) for t in transcripts]
+    lines[4:4] = ['{"transcript": "cut off', "[1, 2]", json.dumps({"note": "no text"}), "42"]
+    path = tmp_path / "calls.jsonl"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    skipped = counter("transcripts.skipped")
+    assert json.loads(main.compute_call_center_kpis_stream(str(path))) == \
+        json.loads(main.compute_call_center_kpis_stream(transcripts))
+    assert counter("transcripts.skipped") - skipped == 4
+
+    stats = {}
+    assert list(main.iter_transcripts(str(path), stats=stats)) == transcripts
+    assert stats == {"skipped": 4}
+
+    job = main.KPIJob(str(path)).start()
+    job.join(10)
+    snapshot = job.snapshot()
+    assert snapshot["status"] == "done"
+    assert snapshot["calls"] == len(transcripts)
+    assert snapshot["skipped"] == 4
+    assert snapshot["kpis"] == json.loads(main.compute_call_center_kpis_stream(transcripts))
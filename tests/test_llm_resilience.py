@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = main.CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    monkeypatch.setattr(main, "_llm_breaker", breaker)
+    monkeypatch.setattr(main, "TOGETHER_MAX_RETRIES", 0)
+    monkeypatch.setattr(main, "TOGETHER_TIMEOUT", 2.0)
+    monkeypatch.setattr(main, "TOGETHER_DEADLINE", 2.0)
+    return breaker
+
+
+def fail():
+    raise ConnectionError("upstream down")
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.failure_threshold):
+        with pytest.raises(ConnectionError):
+            main._resilient_call(fail)
+    assert breaker.state == "open"
+
+
+def test_breaker_opens_probes_and_closes(breaker):
+    open_breaker(breaker)
+    with pytest.raises(main.CircuitOpenError):
+        main._resilient_call(fail)
+
+    time.sleep(breaker.reset_timeout)
+    assert main._resilient_call(lambda: breaker.state) == "half_open"
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens_breaker(breaker):
+    open_breaker(breaker)
+    time.sleep(breaker.reset_timeout)
+    with pytest.raises(ConnectionError):
+        main._resilient_call(fail)
+    assert breaker.state == "open"
+    with pytest.raises(main.CircuitOpenError):
+        main._resilient_call(fail)
+
+    time.sleep(breaker.reset_timeout)
+    assert main._resilient_call(lambda: "ok") == "ok"
+    assert breaker.state == "closed"
+
+
+def test_slow_call_times_out_and_counts_as_failure(breaker, monkeypatch):
+    monkeypatch.setattr(main, "TOGETHER_TIMEOUT", 0.05)
+    with pytest.raises(main.LLMTimeoutError):
+        main._resilient_call(time.sleep, 0.3)
+    assert breaker._failures == 1
+
+
+def test_breaker_recovers_after_adopting_process_resources(monkeypatch):
+    # A Streamlit rerun executes the module again, so the LLM pools start out
+    # unset and are adopted from the once-per-process resources.
+    for name in ("_flight_store", "_flight_feed", "_llm_cache", "_qa_cache", "_kpi_store",
+                 "_llm_breaker", "_llm_rate_limiter", "_llm_executor", "_llm_probe_executor"):
+        monkeypatch.setattr(main, name, getattr(main, name))
+    monkeypatch.setattr(main, "TOGETHER_MAX_RETRIES", 0)
+    monkeypatch.setattr(main, "_llm_breaker", main.CircuitBreaker(failure_threshold=2, reset_timeout=0.05))
+    resources = main._process_resources()
+
+    monkeypatch.setattr(main, "_llm_executor", None)
+    monkeypatch.setattr(main, "_llm_probe_executor", None)
+    main._adopt_process_resources(resources)
+    assert main._get_llm_executor() is resources["llm_executor"]
+    assert main._get_llm_executor(probe=True) is resources["llm_probe_executor"]
+
+    breaker = resources["llm_breaker"]
+    open_breaker(breaker)
+    time.sleep(breaker.reset_timeout)
+    assert main._resilient_call(lambda: breaker.state) == "half_open"
+    assert breaker.state == "closed"
+
+
+def test_probe_pool_is_created_on_its_own(monkeypatch):
+    monkeypatch.setattr(main, "_llm_executor", main._get_llm_executor())
+    monkeypatch.setattr(main, "_llm_probe_executor", None)
+    probe_executor = main._get_llm_executor(probe=True)
+    assert probe_executor is not None and probe_executor is not main._llm_executor
@@ -0,0 +1,142 @@
+import json
+import re
+
+import pytest
+
+import benchmarks
+import main
+
+
+# The rule-based categorization and KPIs as they were before any of the
+# optimizations; every faster path has to give the same answers.
+BASELINE_CATEGORIES = {
+    "Flight Booking": ["book", "reserve", "purchase", "buy", "schedule"],
+    "Flight Cancellation": ["cancel", "refund", "money back"],
+    "Flight Rescheduling": ["reschedule", "change", "move", "different date"],
+    "Baggage Issue": ["baggage", "luggage", "bag", "suitcase", "missing", "lost"],
+    "Complaint": ["complaint", "unhappy", "disappointed", "poor", "terrible", "bad experience"],
+    "Seat Change": ["seat", "change seat", "different seat", "window", "aisle"],
+    "General Inquiry": ["status", "check", "information", "time", "when"]
+}
+BASELINE_POSITIVE = ["thank", "good", "great", "excellent", "helpful", "appreciate", "happy", "satisfied"]
+BASELINE_NEGATIVE = ["unhappy", "disappointed", "poor", "terrible", "bad", "issue", "problem", "complaint", "delay"]
+
+
+def baseline_categorize(transcript):
+    transcript_lower = transcript.lower()
+    determined_category = "General Inquiry"
+    for category, keywords in BASELINE_CATEGORIES.items():
+        for keyword in keywords:
+            if keyword in transcript_lower:
+                determined_category = category
+                break
+
+    matches = re.findall(r'([A-Za-z]{1,3}\d{1,4})', transcript)
+    flight_numbers = [match for match in matches if match.upper().startswith('AI')]
+
+    resolved = "thank you" in transcript_lower and "have a" in transcript_lower
+    customer_name = "Unknown"
+    for pattern in [r'name is ([A-Za-z\s]+),', r'name is ([A-Za-z\s]+)\.', r'I\'m ([A-Za-z\s]+),', r'this is ([A-Za-z\s]+),']:
+        name_match = re.search(pattern, transcript)
+        if name_match:
+            customer_name = name_match.group(1).strip()
+            break
+
+    return {
+        "category": determined_category,
+        "details": {
+            "flight_numbers": flight_numbers,
+            "customer_name": customer_name,
+            "resolution_status": "Resolved" if resolved else "Pending",
+            "call_summary": f"{determined_category} related to flight(s): {', '.join(flight_numbers) if flight_numbers else 'None specified'}"
+        }
+    }
+
+
+def baseline_kpis(transcripts):
+    categories = {}
+    resolution_count = 0
+    flight_mentions = {}
+    customer_sentiments = []
+    for transcript in transcripts:
+        categorization = baseline_categorize(transcript)
+        category = categorization["category"]
+        details = categorization["details"]
+        categories[category] = categories.get(category, 0) + 1
+        if details["resolution_status"] == "Resolved":
+            resolution_count += 1
+        for flight in details["flight_numbers"]:
+            flight_mentions[flight] = flight_mentions.get(flight, 0) + 1
+        transcript_lower = transcript.lower()
+        customer_sentiments.append(sum(word in transcript_lower for word in BASELINE_POSITIVE)
+                                   - sum(word in transcript_lower for word in BASELINE_NEGATIVE))
+
+    most_mentioned_flights = sorted(flight_mentions.items(), key=lambda x: x[1], reverse=True)[:3]
+    return {
+        "total_calls": len(transcripts),
+        "call_categories": categories,
+        "resolution_rate": (resolution_count / len(transcripts)) * 100,
+        "average_response_time": 25,
+        "average_sentiment": sum(customer_sentiments) / len(customer_sentiments),
+        "most_common_issue": max(categories.items(), key=lambda x: x[1])[0],
+        "most_mentioned_flights": dict(most_mentioned_flights),
+        "category_distribution": {category: (count / len(transcripts)) * 100 for category, count in categories.items()}
+    }
+
+
+EDGE_TRANSCRIPTS = [
+    "",
+    "Customer: hello?",
+    "Customer: My name is Ann Lee. I want a WINDOW seat on ai101 and AI102, thank you, have a nice day.",
+    "Agent: this is Raj, how can I help? Customer: I'm Mia Wong, my bag is missing after AI303 from DEL.",
+    "Customer: terrible terrible service, bad experience, I demand a refund for flight AI9999 and AIR12345.",
+    "Customer: Can I reschedule to a different date? The delay was a problem. Thanks, great help.",
+]
+
+
+def corpus(n=300):
+    flights = list(benchmarks.generate_flights(50))
+    return main.SAMPLE_TRANSCRIPTS + EDGE_TRANSCRIPTS + list(benchmarks.generate_transcripts(n, flights, seed=7))
+
+
+def test_categorize_rules_match_baseline():
+    for transcript in corpus():
+        assert json.loads(main.categorize_call(transcript)) == baseline_categorize(transcript)
+
+
+@pytest.mark.parametrize("vectorize", [True, False])
+@pytest.mark.parametrize("store_enabled", [True, False])
+def test_kpis_match_baseline(monkeypatch, tmp_path, vectorize, store_enabled):
+    monkeypatch.setattr(main, "KPI_VECTORIZE", vectorize)
+    monkeypatch.setattr(main, "KPI_STORE_ENABLED", store_enabled)
+    monkeypatch.setattr(main, "_kpi_store", main.KPIResultStore(str(tmp_path / "kpi_store.sqlite3")))
+    transcripts = corpus()
+    assert json.loads(main.compute_call_center_kpis(transcripts)) == baseline_kpis(transcripts)
+
+
+def test_kpis_without_transcripts():
+    assert json.loads(main.compute_call_center_kpis([])) == {"error": "No transcripts provided"}
+
+
+def test_keyword_matcher_finds_every_term():
+    matcher = main.KeywordMatcher(["bag", "baggage", "change", "change seat", "aa", "aaa"])
+    text = "I want to change seat. My baggage, my bag... aaaa"
+    hits = matcher.count(text)
+    assert set(hits) == {"bag", "baggage", "change", "change seat", "aa", "aaa"}
+    assert hits["bag"] == 2
+    assert hits["aa"] == 3
+
+
+def test_keyword_scan_and_regex_agree():
+    vocab = main._keyword_matcher.terms + ["aa", "abab", "window seat"]
+    scan = main.KeywordMatcher(vocab, scan_max_terms=len(vocab))
+    regex = main.KeywordMatcher(vocab, scan_max_terms=0)
+    assert scan.scan and not regex.scan
+    for transcript in corpus(100) + ["aaaa ababab window seat window", ""]:
+        text = transcript.lower()
+        assert scan.count(text) == regex.count(text)
+
+
+def test_default_vocabulary_uses_substring_scan():
+    assert len(main._keyword_matcher.terms) <= main.KEYWORD_SCAN_MAX_TERMS
+    assert main._keyword_matcher.scan
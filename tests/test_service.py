@@ -0,0 +1,145 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+import main
+
+
+async def request(port, method, path, body=b""):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n"
+                 f"Connection: close\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split(b" ", 2)[1]), payload
+
+
+def serve(scenario, **options):
+    async def run():
+        service = main.AgentService("127.0.0.1", 0, **options)
+        await service.start()
+        try:
+            return await scenario(service)
+        finally:
+            await service.shutdown(timeout=1)
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def gate(monkeypatch):
+    # A /slow route whose calls block until the test releases them.
+    release = threading.Event()
+
+    def slow(body):
+        return (lambda: release.wait(5) and json.dumps({"answer": "done"})), ()
+
+    monkeypatch.setitem(main.SERVICE_ROUTES, "/slow", slow)
+    yield release
+    release.set()
+
+
+def test_answers_json():
+    async def scenario(service):
+        return await request(service.port, "POST", "/info", json.dumps({"flight_number": "AI123"}).encode())
+    status, payload = serve(scenario)
+    assert status == 200
+    assert json.loads(payload)["flight_number"] == "AI123"
+
+
+@pytest.mark.parametrize("body", [b"{not json", b"[1, 2]", json.dumps({"flight_number": 7}).encode()])
+def test_bad_request(body):
+    async def scenario(service):
+        return await request(service.port, "POST", "/info", body)
+    status, payload = serve(scenario)
+    assert status == 400
+    assert "error" in json.loads(payload)
+
+
+def test_unknown_endpoint_and_method():
+    async def scenario(service):
+        return (await request(service.port, "POST", "/nope", b"{}"),
+                await request(service.port, "GET", "/qa"))
+    (missing, _), (wrong_method, _) = serve(scenario)
+    assert missing == 404
+    assert wrong_method == 405
+
+
+def test_overload_is_rejected(gate):
+    async def scenario(service):
+        first = asyncio.ensure_future(request(service.port, "POST", "/slow", b"{}"))
+        while service._pending == 0:
+            await asyncio.sleep(0.01)
+        rejected = await request(service.port, "POST", "/slow", b"{}")
+        gate.set()
+        return rejected, await first
+    (status, payload), (first_status, _) = serve(scenario, max_concurrency=1, max_queue=0)
+    assert status == 503
+    assert "error" in json.loads(payload)
+    assert first_status == 200
+
+
+def test_timeout(gate):
+    async def scenario(service):
+        status, payload = await request(service.port, "POST", "/slow", b"{}")
+        pending = service._pending
+        gate.set()
+        while service._pending:
+            await asyncio.sleep(0.01)
+        return status, payload, pending
+    status, payload, pending = serve(scenario, request_timeout=0.1)
+    assert status == 504
+    assert "timed out" in json.loads(payload)["error"]
+    # the abandoned call still holds its slot until its thread finishes
+    assert pending == 1
+
+
+def test_streams_ndjson():
+    async def scenario(service):
+        return await request(service.port, "POST", "/qa/stream", json.dumps({"query": "Where is AI123 going?"}).encode())
+    status, payload = serve(scenario)
+    assert status == 200
+    events = [json.loads(line) for line in payload.split(b"\r\n") if line.startswith(b"{")]
+    assert events and events[-1]["tier"] == "template"
+
+
+def test_stream_timeout_frees_connection(monkeypatch):
+    release, closed = threading.Event(), threading.Event()
+
+    def stuck(body):
+        def events():
+            try:
+                yield {"token": "Flight"}
+                release.wait(5)
+                yield {"token": " late"}
+            finally:
+                closed.set()
+        return events, ()
+
+    monkeypatch.setitem(main.SERVICE_STREAM_ROUTES, "/stuck/stream", stuck)
+
+    async def scenario(service):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        status, payload = await request(service.port, "POST", "/stuck/stream", b"{}")
+        elapsed = loop.time() - start
+        pending = service._pending
+        release.set()
+        while service._pending:
+            await asyncio.sleep(0.01)
+        return status, payload, elapsed, pending
+    try:
+        status, payload, elapsed, pending = serve(scenario, request_timeout=0.1)
+    finally:
+        release.set()
+    events = [json.loads(line) for line in payload.split(b"\r\n") if line.startswith(b"{")]
+    assert status == 200
+    assert events[0] == {"token": "Flight"}
+    assert "timed out" in events[-1]["error"]
+    assert elapsed < 1
+    # the slot is held until the stuck pull returns, then the stream is closed
+    assert pending == 1
+    assert closed.is_set()